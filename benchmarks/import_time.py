@@ -0,0 +1,121 @@
+"""
+导入耗时基准
+
+在全新的子进程中分别导入各个模块，测量冷启动导入耗时，并检查较慢的第三方依赖
+是否被推迟到第一次使用时才导入。“预加载”一列是导入模块后再导入这些延迟依赖的
+总耗时，即改为懒加载之前导入该模块需要付出的代价。
+
+用法：
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --repeat 5 --json reports/import_time.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# 需要测量的模块
+TARGET_MODULES = [
+    "src.utils.config",
+    "src.utils.llm_client",
+    "src.tools.data_tools",
+    "src.tools.analysis_tools",
+    "src.tools.compare_analyzer",
+    "src.agents.trend_agent",
+    "src.agents.tools_registry",
+]
+
+# 应当延迟到第一次使用时才导入的慢速依赖
+DEFERRED_MODULES = [
+    "openai",
+    "pypinyin",
+    "pandas_ta",
+    "langchain_community.embeddings",
+    "langchain_community.vectorstores",
+    "mplfinance",
+]
+
+_PROBE = """
+import importlib, json, sys, time
+start = time.perf_counter()
+try:
+    importlib.import_module({module!r})
+    error = None
+except Exception as e:
+    error = f"{{type(e).__name__}}: {{e}}"
+lazy = time.perf_counter() - start
+deferred = {deferred!r}
+loaded = [m for m in deferred if m in sys.modules]
+for m in deferred:
+    try:
+        importlib.import_module(m)
+    except Exception:
+        pass
+eager = time.perf_counter() - start
+print(json.dumps({{"lazy": lazy, "eager": eager, "loaded": loaded, "error": error}}))
+"""
+
+
+def measure(module: str, repeat: int = 3) -> Dict:
+    """在子进程中重复导入一个模块，返回耗时中位数
+
+    Args:
+        module: 模块名
+        repeat: 重复次数，每次都是全新的解释器
+
+    Returns:
+        Dict: 包含lazy（导入模块耗时）、eager（再导入延迟依赖后的总耗时）、
+              loaded（导入时已被加载的延迟依赖）和error
+    """
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)],
+            cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        runs.append(json.loads(output))
+    return {
+        "module": module,
+        "lazy": statistics.median(r["lazy"] for r in runs),
+        "eager": statistics.median(r["eager"] for r in runs),
+        "loaded": runs[-1]["loaded"],
+        "error": runs[-1]["error"],
+    }
+
+
+def format_results(results: List[Dict]) -> str:
+    lines = [f"{'模块':<30}{'导入(ms)':>10}{'预加载(ms)':>12}{'节省':>8}  导入时已加载的慢速依赖"]
+    for r in results:
+        if r["error"]:
+            lines.append(f"{r['module']:<30}  导入失败: {r['error']}")
+            continue
+        saved = 1 - r["lazy"] / r["eager"] if r["eager"] else 0.0
+        lines.append(f"{r['module']:<30}{r['lazy'] * 1000:>10.0f}{r['eager'] * 1000:>12.0f}{saved:>8.0%}  "
+                     f"{', '.join(r['loaded']) or '-'}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量各模块的冷启动导入耗时")
+    parser.add_argument("modules", nargs="*", default=TARGET_MODULES, help="要测量的模块")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块重复测量的次数")
+    parser.add_argument("--json", dest="json_path", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    print(format_results(results))
+    if args.json_path:
+        Path(args.json_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+本地OpenAI兼容的大模型桩服务
+
+实现 POST /v1/chat/completions（流式与非流式），按配置模拟首token延迟、逐token输出速度、
+回复长度和错误率，用于离线压测：LLMClient指向该服务后，整条消息处理链路照常运行，
+只有大模型的耗时被替换为可控的模拟值。意图识别请求返回合法的JSON，摘要等其他请求返回固定的中文文本。
+
+用法：
+    with LLMStubServer(ttft=0.3, tokens_per_second=40, completion_tokens=200) as stub:
+        os.environ["LLM_API_URL"] = stub.base_url
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_STUB_CONFIG = {
+    "ttft": 0.3,                 # 首token延迟（秒），非流式请求同样先等待该时间
+    "jitter": 0.1,               # 首token延迟的随机抖动比例
+    "tokens_per_second": 50.0,   # 流式输出速度，<=0表示立即输出全部token
+    "completion_tokens": 200,    # 每个回复的token数（不超过请求的max_tokens）
+    "error_rate": 0.0,           # 返回HTTP 500的概率
+    "seed": 0,
+}
+
+_FILLER = ("从技术面看，短期均线仍位于中期均线上方，价格在支撑位附近企稳，成交量温和放大，"
+           "RSI处于中性区间，整体趋势偏强但需警惕回调风险，建议控制仓位并关注关键压力位的突破情况。")
+
+
+def _tokens(count: int) -> List[str]:
+    """把填充文本切成约count个“token”（每个两个汉字）"""
+    text = _FILLER * (count * 2 // len(_FILLER) + 1)
+    return [text[i:i + 2] for i in range(0, count * 2, 2)]
+
+
+class LLMStubServer:
+    def __init__(self, config: Optional[Dict] = None, **overrides):
+        """
+        Args:
+            config: 桩服务配置，缺省项使用DEFAULT_STUB_CONFIG
+            overrides: 单项覆盖，如ttft=0.5
+        """
+        self.config = {**DEFAULT_STUB_CONFIG, **(config or {}), **overrides}
+        self._random = random.Random(self.config["seed"])
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "active": 0, "max_active": 0}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "LLMStubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    stub._handle(self, body)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 1024
+        threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "LLMStubServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _reply_tokens(self, body: Dict) -> List[str]:
+        messages = body.get("messages") or []
+        if any("意图识别" in (m.get("content") or "") for m in messages):
+            return [json.dumps({"intent": "general_question", "market_names": []}, ensure_ascii=False)]
+        count = min(self.config["completion_tokens"], body.get("max_tokens") or self.config["completion_tokens"])
+        return _tokens(max(1, count))
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: Dict):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["active"] += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.stats["active"])
+            fail = self._random.random() < self.config["error_rate"]
+            ttft = self.config["ttft"] * (1 + self._random.uniform(-1, 1) * self.config["jitter"])
+        try:
+            time.sleep(max(0.0, ttft))
+            if fail:
+                with self._lock:
+                    self.stats["errors"] += 1
+                self._send_json(handler, 500, {"error": {"message": "stub injected error", "type": "server_error"}})
+                return
+            tokens = self._reply_tokens(body)
+            prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages") or []) // 2
+            if body.get("stream"):
+                with self._lock:
+                    self.stats["streams"] += 1
+                self._stream(handler, body, tokens)
+            else:
+                self._send_json(handler, 200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "".join(tokens)}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                              "total_tokens": prompt_tokens + len(tokens)},
+                })
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消请求（如调用方超时）
+            pass
+        finally:
+            with self._lock:
+                self.stats["active"] -= 1
+
+    def _stream(self, handler: BaseHTTPRequestHandler, body: Dict, tokens: List[str]):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.end_headers()
+        interval = 1.0 / self.config["tokens_per_second"] if self.config["tokens_per_second"] > 0 else 0.0
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        for i, token in enumerate(tokens):
+            if i and interval:
+                time.sleep(interval)
+            chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": body.get("model", "stub"),
+                     "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+            handler.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            handler.wfile.flush()
+        done = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", "stub"), "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        handler.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        handler.wfile.flush()
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, status: int, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
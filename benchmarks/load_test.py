@@ -0,0 +1,433 @@
+"""
+助手压测工具
+
+用本地的OpenAI兼容桩服务（benchmarks/llm_stub.py）代替真实大模型，离线压测：
+- assistant：按前端的消息处理流程（src/agents/assistant.arespond）发送用户消息，每个虚拟用户一份会话记忆；
+- tools：直接调用单市场分析和多市场对比（aanalyze_market_trend / acompare_market_trends）。
+
+虚拟用户为闭环模型：每个用户发出请求、等待完成、思考think_time秒后再发下一条，并发数即用户数。
+查询按权重混合：single（单市场分析）、compare（多市场对比）、anomaly（异动查询）、general（通用问题）。
+报告吞吐量、延迟和首token耗时（TTFT）的p50/p95/p99、各阶段耗时、按查询类型的分解和错误数，
+可保存为JSON基线，之后的运行与基线比较，延迟变慢或吞吐下降超过容忍度即视为回归（退出码1）。
+
+通用问题不经过langchain Agent，而是带记忆直接请求大模型（与无Agent时的流程相同）；
+默认关闭大模型响应缓存和每日报告，使每个请求都真正经过大模型调用路径。
+
+用法：
+    python -m benchmarks.load_test --concurrency 20 --requests 200
+    python -m benchmarks.load_test --mode tools --concurrency 50 --ttft 0.5 --tps 30
+    python -m benchmarks.load_test --synthetic 200 --mix single=3,general=1 --save-baseline benchmarks/baselines/load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.llm_stub import LLMStubServer
+from benchmarks.synthetic import generate_tree
+
+DEFAULT_MIX = {"single": 4, "compare": 2, "anomaly": 1, "general": 3}
+
+SINGLE_TEMPLATES = ["分析一下{0}的走势", "{0}最近走势怎么样", "帮我看看{0}的行情趋势"]
+COMPARE_TEMPLATES = ["对比一下{0}和{1}的走势", "比较{0}与{1}最近的行情"]
+ANOMALY_TEMPLATES = ["今天有什么异动", "最近有哪些市场出现异动"]
+GENERAL_TEMPLATES = ["饰品交易有哪些手续费", "新手应该怎么开始投资CS饰品", "磨损度对价格有什么影响",
+                     "什么是饰品市场的板块指数"]
+
+# 与基线比较的指标：延迟类越大越差，吞吐量越小越差
+COMPARED_METRICS = ["throughput", "latency_p50", "latency_p95", "latency_p99", "ttft_p50", "ttft_p95"]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析查询混合比例，如"single=3,general=1"，未列出的类型权重为0"""
+    mix = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"未知的查询类型: {name}（可选: {', '.join(DEFAULT_MIX)}）")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("查询混合比例全部为0")
+    return mix
+
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """最近秩百分位数，样本为空时返回None"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+def _distribution(samples: List[float]) -> Dict[str, Optional[float]]:
+    return {"count": len(samples), "mean": statistics.fmean(samples) if samples else None,
+            "p50": percentile(samples, 0.50), "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99),
+            "max": max(samples) if samples else None}
+
+
+class QueryGenerator:
+    """按权重生成查询，市场从数据目录中抽样，每个虚拟用户使用独立的随机序列"""
+
+    def __init__(self, mix: Dict[str, float], markets: List[str], seed: int = 0):
+        self.types = [name for name, weight in mix.items() if weight > 0]
+        self.weights = [mix[name] for name in self.types]
+        self.markets = markets
+        self.seed = seed
+
+    def for_user(self, user_id: int) -> random.Random:
+        return random.Random(self.seed * 100003 + user_id)
+
+    def next(self, rng: random.Random) -> Dict:
+        kind = rng.choices(self.types, self.weights)[0]
+        if kind == "single":
+            markets = [rng.choice(self.markets)]
+            text = rng.choice(SINGLE_TEMPLATES).format(*markets)
+        elif kind == "compare":
+            markets = rng.sample(self.markets, min(2, len(self.markets)))
+            text = rng.choice(COMPARE_TEMPLATES).format(*markets, *markets)
+        elif kind == "anomaly":
+            markets, text = [], rng.choice(ANOMALY_TEMPLATES)
+        else:
+            markets, text = [], rng.choice(GENERAL_TEMPLATES)
+        return {"type": kind, "text": text, "markets": markets}
+
+
+async def _assistant_request(query: Dict, memory, render_chart: bool) -> Dict:
+    from src.agents.assistant import arespond
+
+    tokens = 0
+
+    async def on_token(text: str):
+        nonlocal tokens
+        tokens += 1
+
+    reply = await arespond(query["text"], memory, on_token=on_token, render_chart=render_chart)
+    if reply.chart_future is not None:
+        # 前端在文本完成后附加K线图，图片渲染计入本次请求
+        began = time.perf_counter()
+        await asyncio.wrap_future(reply.chart_future)
+        reply.stages["chart"] = time.perf_counter() - began
+    return {"ttft": reply.ttft, "stages": reply.stages, "chunks": tokens,
+            "routed": reply.intent.get("intent") if reply.intent.get("task") != "anomaly" else "anomaly"}
+
+
+async def _tools_request(query: Dict) -> Dict:
+    from src.agents.trend_agent import aanalyze_market_trend
+    from src.tools.compare_analyzer import acompare_market_trends
+
+    began = time.perf_counter()
+    if query["type"] == "compare":
+        await acompare_market_trends(query["markets"])
+    else:
+        await aanalyze_market_trend(query["markets"][0])
+    return {"ttft": None, "stages": {"tool": time.perf_counter() - began}, "chunks": 0, "routed": query["type"]}
+
+
+async def _run_users(mode: str, generator: QueryGenerator, concurrency: int, requests: int, warmup: int,
+                     think_time: float, render_chart: bool, timeout: float) -> Dict:
+    from src.agents.memory import ConversationMemory
+    from src.utils.config import get_config_section
+
+    memory_config = get_config_section("memory")
+    issued = 0
+    samples: List[Dict] = []
+    measured_start: Optional[float] = None
+
+    async def user(user_id: int):
+        nonlocal issued, measured_start
+        rng = generator.for_user(user_id)
+        memory = ConversationMemory(memory_config)
+        while issued < warmup + requests:
+            index = issued
+            issued += 1
+            if index == warmup and measured_start is None:
+                measured_start = time.perf_counter()
+            query = generator.next(rng)
+            began = time.perf_counter()
+            sample = {"type": query["type"], "warmup": index < warmup, "ok": True, "error": None}
+            try:
+                if mode == "assistant":
+                    result = _assistant_request(query, memory, render_chart)
+                else:
+                    result = _tools_request(query)
+                sample.update(await asyncio.wait_for(result, timeout))
+            except Exception as e:
+                sample.update({"ok": False, "error": f"{type(e).__name__}: {e}"[:200], "ttft": None, "stages": {}})
+            sample["latency"] = time.perf_counter() - began
+            samples.append(sample)
+            if think_time > 0:
+                await asyncio.sleep(rng.expovariate(1 / think_time))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    ended = time.perf_counter()
+    return {"samples": samples, "wall": ended - (measured_start or started)}
+
+
+def summarize(samples: List[Dict], wall: float) -> Dict:
+    """把单个请求的记录汇总为报告指标（秒）"""
+    measured = [s for s in samples if not s["warmup"]]
+    ok = [s for s in measured if s["ok"]]
+    latencies = [s["latency"] for s in ok]
+    ttfts = [s["ttft"] for s in ok if s.get("ttft") is not None]
+    latency, ttft = _distribution(latencies), _distribution(ttfts)
+
+    stage_samples: Dict[str, List[float]] = {}
+    for s in ok:
+        for name, seconds in s["stages"].items():
+            stage_samples.setdefault(name, []).append(seconds)
+    by_type: Dict[str, Dict] = {}
+    for kind in sorted({s["type"] for s in measured}):
+        group = [s for s in measured if s["type"] == kind]
+        group_ok = [s["latency"] for s in group if s["ok"]]
+        by_type[kind] = {"count": len(group), "errors": len(group) - len(group_ok),
+                         "p50": percentile(group_ok, 0.50), "p95": percentile(group_ok, 0.95),
+                         "ttft_p50": percentile([s["ttft"] for s in group if s["ok"] and s.get("ttft") is not None], 0.50)}
+    errors: Dict[str, int] = {}
+    for s in measured:
+        if not s["ok"]:
+            errors[s["error"]] = errors.get(s["error"], 0) + 1
+
+    return {
+        "requests": len(measured),
+        "errors": len(measured) - len(ok),
+        "wall": wall,
+        "throughput": len(ok) / wall if wall > 0 else 0.0,
+        "latency_p50": latency["p50"], "latency_p95": latency["p95"], "latency_p99": latency["p99"],
+        "latency_mean": latency["mean"], "latency_max": latency["max"],
+        "ttft_p50": ttft["p50"], "ttft_p95": ttft["p95"], "ttft_p99": ttft["p99"],
+        "stages": {name: {"mean": statistics.fmean(values), "p95": percentile(values, 0.95), "count": len(values)}
+                   for name, values in stage_samples.items()},
+        "by_type": by_type,
+        "error_kinds": errors,
+    }
+
+
+def _prepare_workdir(synthetic: Optional[int], days: int) -> Optional[Path]:
+    """使用合成数据时在临时目录下生成data/kline并复制配置，之后切换到该目录运行
+
+    各工具按相对路径data/kline读取数据，切换工作目录即可让整条流程使用合成数据。
+    """
+    if not synthetic:
+        if not os.path.isdir("data/kline"):
+            raise SystemExit("未找到data/kline，请先抓取数据或使用--synthetic生成合成数据")
+        return None
+    work_dir = Path(tempfile.mkdtemp(prefix="cs_load_"))
+    generate_tree(str(work_dir / "data" / "kline"), synthetic, days)
+    shutil.copytree("config", work_dir / "config")
+    os.chdir(work_dir)
+    return work_dir
+
+
+def run_load_test(mode: str = "assistant", concurrency: int = 10, requests: int = 100, warmup: int = 0,
+                  mix: Optional[Dict[str, float]] = None, think_time: float = 0.0, markets: int = 20,
+                  stub_config: Optional[Dict] = None, use_cache: bool = False, use_reports: bool = False,
+                  render_chart: bool = False, timeout: float = 120.0, max_workers: Optional[int] = None,
+                  seed: int = 0) -> Dict:
+    """启动大模型桩服务并运行一次压测
+
+    Args:
+        mode: assistant（完整消息处理流程）或tools（直接调用分析工具）
+        concurrency: 虚拟用户数
+        requests: 计入统计的请求总数
+        warmup: 开始统计前的预热请求数
+        mix: 查询类型权重，默认DEFAULT_MIX；tools模式只使用single和compare
+        think_time: 用户两次请求之间的平均思考时间（秒，指数分布）
+        markets: 查询涉及的市场数量，越少则相同请求越多，合并与缓存的效果越明显
+        stub_config: 桩服务配置，见DEFAULT_STUB_CONFIG
+        use_cache: 是否使用大模型响应缓存
+        use_reports: 是否使用预先生成的每日报告
+        render_chart: 单市场分析是否渲染PNG K线图（对应前端关闭交互式图表）
+        timeout: 单个请求的超时（秒）
+        max_workers: 阻塞任务线程池大小，默认使用concurrency配置
+        seed: 查询生成的随机种子
+
+    Returns:
+        Dict: meta（参数与环境）、summary（汇总指标）和stub（桩服务统计）
+    """
+    from src.agents.trend_agent import get_chart_service, get_report_store
+    from src.tools.data_tools import list_market_files
+    from src.utils.async_utils import configure_executor
+    from src.utils.config import get_config_section
+    from src.utils.llm_client import get_llm_client
+
+    mix = dict(mix or DEFAULT_MIX)
+    if mode == "tools":
+        mix = {name: weight for name, weight in mix.items() if name in ("single", "compare")}
+        if not any(mix.values()):
+            raise ValueError("tools模式只支持single和compare查询")
+    names = sorted(name for name in list_market_files() if name != "大盘")
+    sampled = random.Random(seed).sample(names, min(markets, len(names)))
+    if not sampled:
+        raise ValueError("数据目录中没有可用的市场")
+    configure_executor(max_workers or get_config_section("concurrency").get("max_workers", 8))
+
+    with LLMStubServer(stub_config) as stub:
+        os.environ["LLM_API_URL"] = stub.base_url
+        os.environ.setdefault("API_KEY", "load-test")
+        get_llm_client.cache_clear()
+        client = get_llm_client()
+        if not use_cache:
+            client.cache = None
+        get_report_store().config["enabled"] = use_reports
+
+        generator = QueryGenerator(mix, sampled, seed)
+        try:
+            result = asyncio.run(_run_users(mode, generator, concurrency, requests, warmup, think_time,
+                                            render_chart, timeout))
+        finally:
+            if render_chart:
+                get_chart_service().shutdown()
+        stub_stats = dict(stub.stats)
+
+    summary = summarize(result["samples"], result["wall"])
+    stub_stats["llm_calls_per_request"] = stub_stats["requests"] / max(1, len(result["samples"]))
+    return {
+        "meta": {
+            "mode": mode, "concurrency": concurrency, "requests": requests, "warmup": warmup, "mix": mix,
+            "think_time": think_time, "markets": len(sampled), "stub": stub.config, "use_cache": use_cache,
+            "use_reports": use_reports, "render_chart": render_chart, "python": sys.version.split()[0],
+            "platform": platform.platform(), "created_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        "summary": summary,
+        "stub": stub_stats,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float = 0.25) -> List[Dict]:
+    """与基线比较：延迟类指标变大、吞吐量变小超过tolerance记为回归"""
+    rows = []
+    for name in COMPARED_METRICS:
+        value, base = current["summary"].get(name), baseline.get("summary", {}).get(name)
+        if value is None and base is None:
+            # tools模式没有流式输出，两边都没有TTFT
+            continue
+        if value is None or not base:
+            rows.append({"name": name, "current": value, "baseline": base, "ratio": None, "status": "new"})
+            continue
+        ratio = value / base
+        worse, better = (ratio < 1 - tolerance, ratio > 1 + tolerance) if name == "throughput" \
+            else (ratio > 1 + tolerance, ratio < 1 - tolerance)
+        status = "regression" if worse else "improved" if better else "ok"
+        rows.append({"name": name, "current": value, "baseline": base, "ratio": ratio, "status": status})
+    return rows
+
+
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def format_results(report: Dict, comparison: Optional[List[Dict]] = None) -> str:
+    meta, summary, stub = report["meta"], report["summary"], report["stub"]
+    lines = [
+        f"模式: {meta['mode']}，并发{meta['concurrency']}，请求{summary['requests']}个（预热{meta['warmup']}），"
+        f"市场{meta['markets']}个，混合{meta['mix']}",
+        f"桩服务: TTFT {meta['stub']['ttft']}s，{meta['stub']['tokens_per_second']} token/s，"
+        f"{meta['stub']['completion_tokens']} token/回复，错误率{meta['stub']['error_rate']}",
+        f"吞吐量: {summary['throughput']:.2f} 请求/s（用时{summary['wall']:.1f}s），错误{summary['errors']}个",
+        f"延迟(ms): p50 {_ms(summary['latency_p50'])}  p95 {_ms(summary['latency_p95'])}  "
+        f"p99 {_ms(summary['latency_p99'])}  max {_ms(summary['latency_max'])}",
+        f"TTFT(ms): p50 {_ms(summary['ttft_p50'])}  p95 {_ms(summary['ttft_p95'])}  p99 {_ms(summary['ttft_p99'])}",
+        f"大模型请求: {stub['requests']}次（{stub['llm_calls_per_request']:.2f}次/用户请求），"
+        f"流式{stub['streams']}次，最大并发{stub['max_active']}",
+        f"{'阶段':<10}{'次数':>8}{'平均(ms)':>12}{'p95(ms)':>12}",
+    ]
+    for name, stats in summary["stages"].items():
+        lines.append(f"{name:<10}{stats['count']:>8}{_ms(stats['mean']):>12}{_ms(stats['p95']):>12}")
+    lines.append(f"{'类型':<10}{'次数':>8}{'错误':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'TTFT p50':>12}")
+    for kind, stats in summary["by_type"].items():
+        lines.append(f"{kind:<10}{stats['count']:>8}{stats['errors']:>8}{_ms(stats['p50']):>12}"
+                     f"{_ms(stats['p95']):>12}{_ms(stats['ttft_p50']):>12}")
+    for error, count in summary["error_kinds"].items():
+        lines.append(f"错误 ×{count}: {error}")
+    if comparison is not None:
+        lines.append(f"{'指标':<14}{'当前':>12}{'基线':>12}{'比值':>8}  状态")
+        for row in comparison:
+            fmt = (lambda v: "-" if v is None else f"{v:.2f}") if row["name"] == "throughput" else _ms
+            ratio = f"{row['ratio']:>7.2f}x" if row["ratio"] is not None else f"{'-':>8}"
+            lines.append(f"{row['name']:<14}{fmt(row['current']):>12}{fmt(row['baseline']):>12}{ratio}  {row['status']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="使用本地大模型桩服务压测助手（离线）")
+    parser.add_argument("--mode", choices=["assistant", "tools"], default="assistant")
+    parser.add_argument("--concurrency", type=int, default=10, help="虚拟用户数")
+    parser.add_argument("--requests", type=int, default=100, help="计入统计的请求总数")
+    parser.add_argument("--warmup", type=int, default=0, help="开始统计前的预热请求数")
+    parser.add_argument("--mix", type=parse_mix, default=None,
+                        help="查询混合比例，如single=4,compare=2,anomaly=1,general=3")
+    parser.add_argument("--think-time", type=float, default=0.0, help="用户两次请求之间的平均思考时间（秒）")
+    parser.add_argument("--markets", type=int, default=20, help="查询涉及的市场数量")
+    parser.add_argument("--synthetic", type=int, help="在临时目录生成指定数量序列的合成数据，代替data/kline")
+    parser.add_argument("--days", type=int, default=730, help="合成数据的历史天数")
+    parser.add_argument("--ttft", type=float, default=0.3, help="桩服务首token延迟（秒）")
+    parser.add_argument("--tps", type=float, default=50.0, help="桩服务流式输出速度（token/s）")
+    parser.add_argument("--tokens", type=int, default=200, help="桩服务每个回复的token数")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="桩服务返回HTTP 500的概率")
+    parser.add_argument("--use-cache", action="store_true", help="使用大模型响应缓存")
+    parser.add_argument("--use-reports", action="store_true", help="使用预先生成的每日报告")
+    parser.add_argument("--render-chart", action="store_true", help="单市场分析渲染PNG K线图")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时（秒）")
+    parser.add_argument("--max-workers", type=int, help="阻塞任务线程池大小")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metrics-file", help="开启性能埋点，压测结束后把Prometheus格式的指标写入该文件")
+    parser.add_argument("--verbose", action="store_true", help="输出应用的INFO日志")
+    parser.add_argument("--json", action="store_true", help="以JSON输出完整结果")
+    parser.add_argument("--save-baseline", help="把结果保存为基线JSON")
+    parser.add_argument("--compare", help="与基线JSON比较，出现回归时退出码为1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的变慢或吞吐下降比例")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        # 每个请求都会记录TTFT等INFO日志，压测时只保留警告和错误
+        logging.disable(logging.INFO)
+    save_path = Path(args.save_baseline).resolve() if args.save_baseline else None
+    metrics_path = str(Path(args.metrics_file).resolve()) if args.metrics_file else None
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    work_dir = _prepare_workdir(args.synthetic, args.days)
+    if metrics_path:
+        from src.utils.metrics import configure_metrics
+        configure_metrics({"enabled": True, "textfile": metrics_path, "export_interval": 0})
+    try:
+        stub_config = {"ttft": args.ttft, "tokens_per_second": args.tps, "completion_tokens": args.tokens,
+                       "error_rate": args.llm_error_rate, "seed": args.seed}
+        report = run_load_test(args.mode, args.concurrency, args.requests, args.warmup, args.mix, args.think_time,
+                               args.markets, stub_config, args.use_cache, args.use_reports, args.render_chart,
+                               args.timeout, args.max_workers, args.seed)
+    finally:
+        if metrics_path:
+            from src.utils.metrics import shutdown_metrics
+            shutdown_metrics()
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    comparison = compare_results(report, baseline, args.tolerance) if baseline else None
+    if baseline and {k: baseline["meta"].get(k) for k in ("mode", "concurrency", "mix", "stub")} != \
+            {k: report["meta"][k] for k in ("mode", "concurrency", "mix", "stub")}:
+        print("警告: 基线的压测参数与本次运行不同，比较结果仅供参考")
+    if args.json:
+        print(json.dumps({**report, "comparison": comparison}, ensure_ascii=False, indent=2))
+    else:
+        print(format_results(report, comparison))
+
+    if save_path:
+        save_path.parent.mkdir(parents=True, exist_ok=True)
+        save_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if comparison and any(row["status"] == "regression" for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
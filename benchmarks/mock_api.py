@@ -0,0 +1,187 @@
+"""
+本地模拟行情接口
+
+在本机端口上模拟DataFetcher使用的三个接口，数据来自合成数据生成器（同一种子与磁盘上的合成数据一致）：
+- POST /user/item/block/v1/next-level：板块列表，按type/level/typeVal返回下一级板块；
+- POST /user/item/block/v1/kline：板块和HOT指数的K线，按maxTime向前分页；
+- GET  /user/statistics/v1/kline：大盘K线，分页方式相同。
+
+可配置每个请求的延迟（含随机抖动）、每页条数，以及按比例注入HTTP 500、业务失败（success=false）
+和超时。基准测试完全离线运行，不会访问真实接口。
+
+用法：
+    with MockMarketAPI(n_series=200, days=730, latency=0.01) as api:
+        config["data"]["base_url"] = api.base_url
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from benchmarks.synthetic import SeriesSpec, build_universe, generate_ohlcv
+
+DEFAULT_MOCK_CONFIG = {
+    "n_series": 100,
+    "days": 730,
+    "seed": 0,
+    "latency": 0.0,          # 每个请求的基础延迟（秒）
+    "jitter": 0.0,           # 延迟的随机抖动上限（秒）
+    "page_size": 500,        # K线接口每页最多返回的条数
+    "error_rate": 0.0,       # 返回HTTP 500的概率
+    "failure_rate": 0.0,     # 返回success=false的概率
+    "timeout_rate": 0.0,     # 请求挂起timeout_delay秒的概率
+    "timeout_delay": 5.0,
+}
+
+
+class MockMarketAPI:
+    def __init__(self, config: Optional[Dict] = None, **overrides):
+        """
+        Args:
+            config: 模拟接口配置，缺省项使用DEFAULT_MOCK_CONFIG
+            overrides: 单项覆盖，如latency=0.05
+        """
+        self.config = {**DEFAULT_MOCK_CONFIG, **(config or {}), **overrides}
+        self.specs = build_universe(self.config["n_series"], self.config["seed"])
+        self._by_type_val: Dict[str, SeriesSpec] = {spec.type_val: spec for spec in self.specs}
+        self._by_name: Dict[str, SeriesSpec] = {spec.name: spec for spec in self.specs}
+        self._children: Dict[Optional[str], List[SeriesSpec]] = {}
+        for spec in self.specs:
+            if spec.type == "BROAD":
+                self._children.setdefault(spec.parent, []).append(spec)
+        self._series_cache: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config["seed"])
+        self.stats = {"requests": 0, "kline_pages": 0, "sections": 0, "errors": 0, "failures": 0, "timeouts": 0}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockMarketAPI":
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                api._handle(self, url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                api._handle(self, urlparse(self.path).path, body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-market-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MockMarketAPI":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _series(self, spec: SeriesSpec) -> np.ndarray:
+        """K线矩阵（按时间升序），每行为 [timestamp, open, close, high, low, volume, amount]"""
+        with self._lock:
+            matrix = self._series_cache.get(spec.type_val)
+        if matrix is None:
+            data = generate_ohlcv(spec, self.config["days"])
+            matrix = np.column_stack([data[k] for k in ("timestamp", "open", "close", "high", "low", "volume", "amount")])
+            with self._lock:
+                self._series_cache[spec.type_val] = matrix
+        return matrix
+
+    def _roll(self, key: str) -> bool:
+        rate = self.config[key]
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _handle(self, handler: BaseHTTPRequestHandler, path: str, params: Dict):
+        with self._lock:
+            self.stats["requests"] += 1
+        delay = self.config["latency"] + (self._random.uniform(0, self.config["jitter"]) if self.config["jitter"] else 0)
+        if self._roll("timeout_rate"):
+            with self._lock:
+                self.stats["timeouts"] += 1
+            delay += self.config["timeout_delay"]
+        if delay > 0:
+            threading.Event().wait(delay)
+
+        if self._roll("error_rate"):
+            with self._lock:
+                self.stats["errors"] += 1
+            self._send(handler, 500, {"success": False, "msg": "internal error"})
+            return
+        if self._roll("failure_rate"):
+            with self._lock:
+                self.stats["failures"] += 1
+            self._send(handler, 200, {"success": False, "data": None, "msg": "系统繁忙"})
+            return
+
+        if path == "/user/item/block/v1/next-level":
+            self._send(handler, 200, {"success": True, "data": self._sections(params)})
+        elif path == "/user/item/block/v1/kline":
+            spec = self._by_type_val.get(str(params.get("typeVal", "")))
+            if spec is None and params.get("type") == "HOT":
+                # scripts/main.py中的HOT指数ID是真实接口的ID，稳定地映射到某个合成的HOT指数
+                hot = [s for s in self.specs if s.type == "HOT"]
+                digest = hashlib.md5(str(params.get("typeVal")).encode("utf-8")).hexdigest()
+                spec = hot[int(digest[:8], 16) % len(hot)]
+            self._send_kline(handler, spec, params)
+        elif path == "/user/statistics/v1/kline":
+            self._send_kline(handler, self._by_name.get("大盘"), params)
+        else:
+            self._send(handler, 404, {"success": False, "msg": f"unknown path {path}"})
+
+    def _sections(self, params: Dict) -> List[Dict]:
+        parent = params.get("typeVal") or None
+        with self._lock:
+            self.stats["sections"] += 1
+        return [{"type": spec.type, "typeVal": spec.type_val, "level": spec.level, "nameZh": spec.name}
+                for spec in self._children.get(parent, [])]
+
+    def _send_kline(self, handler: BaseHTTPRequestHandler, spec: Optional[SeriesSpec], params: Dict):
+        if spec is None:
+            self._send(handler, 200, {"success": True, "data": []})
+            return
+        matrix = self._series(spec)
+        max_time = int(params.get("maxTime") or time.time())
+        end = int(np.searchsorted(matrix[:, 0], max_time, side="right"))
+        page = matrix[max(0, end - self.config["page_size"]):end]
+        with self._lock:
+            self.stats["kline_pages"] += 1
+        rows = [[str(int(row[0])), round(row[1], 2), round(row[2], 2), round(row[3], 2), round(row[4], 2),
+                 int(row[5]), round(row[6], 2)] for row in page]
+        self._send(handler, 200, {"success": True, "data": rows})
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
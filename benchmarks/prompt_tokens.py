@@ -0,0 +1,258 @@
+"""
+Prompt token评测
+
+在固定评测集（数据目录中的全部市场，以及几组固定的对比组合）上比较压缩前后的Prompt：
+- token数：旧版Prompt（逐行嵌入30天原始K线、逐日指标）与预算化紧凑Prompt的token数及压缩倍数；
+- 关键事实覆盖率：最新收盘价、均线、RSI、区间高低点、VaR等分析依赖的数值是否仍出现在Prompt中；
+- 可选 --llm：用两种Prompt分别请求大模型，记录响应token数和耗时，并让大模型盲评两份分析的质量。
+
+用法：
+    python -m benchmarks.prompt_tokens
+    python -m benchmarks.prompt_tokens --llm 5 --json reports/prompt_eval.json
+"""
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from src.tools.analysis_tools import get_market_trend_prompt
+from src.tools.compare_analyzer import _cross_market_parts, cross_market_stats, prepare_comparison, summarize_market
+from src.tools.data_tools import list_market_files, read_market_data
+from src.tools.risk_tools import RiskSimulator, format_risk_summary
+from src.utils.config import get_config_section
+from src.utils.tokenizer import count_message_tokens, count_tokens
+
+EVAL_COMPARISONS = [
+    ["手枪", "步枪"],
+    ["大盘", "百战指数", "千战指数"],
+    ["匕首", "手套", "探员", "印花", "武器箱"],
+]
+
+
+def legacy_market_trend_prompt(df: pd.DataFrame, market_name: str, risk_summary: Optional[str] = None) -> str:
+    """压缩前的单市场Prompt（冻结的旧实现，仅作评测基线）"""
+    if len(df) < 26:
+        return f"以下是{market_name}最近{len(df)}天的K线数据（date, open, close, high, low, volume, amount）：\n{df.to_csv(index=False)}\n数据不足，无法进行详细技术分析。请用中文简要分析该市场的趋势，并给出简要展望。"
+    latest_data = df.iloc[-1]
+    latest_close = latest_data['close']
+    prev_close = df.iloc[-2]['close']
+    change_pct = (latest_close - prev_close) / prev_close * 100 if prev_close != 0 else 0
+    recent = df.tail(5).dropna(subset=['MA5', 'MA10', 'MA20', 'RSI'])
+    ma_lines = "\n".join(f"    - {row['date'].strftime('%Y-%m-%d')}: MA5={row['MA5']:.2f}, MA10={row['MA10']:.2f}, MA20={row['MA20']:.2f}"
+                         for _, row in recent.iterrows())
+    rsi_lines = "\n".join(f"    - {row['date'].strftime('%Y-%m-%d')}: RSI={row['RSI']:.2f}" for _, row in recent.iterrows())
+    technical_summary = f"""
+市场名称：{market_name}
+最新日期：{latest_data['date'].strftime("%Y-%m-%d")}
+最新收盘价：{latest_close:.2f}
+日涨跌幅：{change_pct:.2f}%
+最新成交量：{latest_data['volume']}
+
+技术指标趋势 (近{len(recent)}天)：
+均线 (MA):
+{ma_lines}
+
+RSI (14周期):
+{rsi_lines}
+    """
+    if risk_summary:
+        technical_summary += f"""
+量化风险指标（蒙特卡洛模拟，VaR/CVaR为亏损幅度）：
+{risk_summary}
+    """
+    recent_kline = df.tail(30)[['date', 'open', 'close', 'high', 'low', 'volume', 'amount']].to_csv(index=False)
+    return f"""
+    你是一个专业的市场分析师，请基于以下提供的市场基本信息、关键技术指标，以及作为参考的最近30天K线数据，对{market_name}的当前趋势进行详细分析，并给出简要展望。
+
+    {technical_summary}
+
+    参考K线数据 (最近30天)：
+    {recent_kline}
+
+    请从以下几个方面进行分析：
+    1. 短期趋势（根据最新价格与短期均线判断）
+    2. 中期趋势（根据均线交叉、MACD趋势判断）
+    3. 关键支撑位和压力位（可根据历史价格和均线判断）
+    4. 风险提示（如市场波动性、成交量变化，如有量化风险指标请引用具体的VaR/CVaR数值）
+    5. 投资建议（简洁明了）
+
+    请用专业但易懂的中文进行分析，注意逻辑清晰，语言流畅。
+    """
+
+
+def legacy_comparison_messages(summaries: List[Dict]) -> List[Dict[str, str]]:
+    """压缩前的对比Prompt（逐项键值摘要和完整相关系数矩阵）"""
+    lines = "\n".join(f"{item['name']}：" + "，".join(f"{k}={v}" for k, v in item["summary"].items() if v is not None)
+                      for item in summaries)
+    prompt = f"""
+    你是一个专业的市场分析师，请根据以下多个市场的统计摘要和跨市场统计，对它们进行对比分析。
+    请着重对比它们的近期走势、波动性、成交量变化，并指出它们的异同点，以及未来可能的发展趋势。
+
+    各市场摘要：
+    {lines}
+
+    跨市场统计：
+    {cross_market_stats(summaries)}
+
+    请用专业且易懂的语言进行分析。
+    """
+    return [{"role": "system", "content": "你是一个专业的市场分析师，擅长对比分析不同市场的趋势。"},
+            {"role": "user", "content": prompt}]
+
+
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _covered(prompt: str, value: float, rel_tol: float = 1e-3, abs_tol: float = 0.6) -> bool:
+    """判断数值是否以允许的精度出现在Prompt中"""
+    for match in _NUMBER.findall(prompt):
+        number = float(match)
+        if abs(number - value) <= max(abs_tol if abs(value) < 100 else 0, abs(value) * rel_tol):
+            return True
+    return False
+
+
+def key_facts(df: pd.DataFrame, risk: Optional[Dict]) -> Dict[str, float]:
+    """分析依赖的关键数值"""
+    latest = df.iloc[-1]
+    facts = {
+        "收盘价": latest["close"],
+        "日涨跌幅%": (latest["close"] / df["close"].iloc[-2] - 1) * 100,
+        "MA5": latest["MA5"],
+        "MA10": latest["MA10"],
+        "MA20": latest["MA20"],
+        "RSI": latest["RSI"],
+        "20日最高": df["high"].tail(20).max(),
+        "20日最低": df["low"].tail(20).min(),
+    }
+    if risk:
+        horizon = risk["horizons"][-1]
+        for key, value in risk["metrics"][horizon].items():
+            if key.startswith("VaR") or key.startswith("CVaR"):
+                facts[f"{horizon}天{key}"] = value
+    return facts
+
+
+def evaluate_markets(simulator: RiskSimulator) -> List[Dict]:
+    results = []
+    for name in sorted(list_market_files()):
+        df = read_market_data(name, num_days=730)
+        if df is None or len(df) < 26:
+            continue
+        risk = simulator.simulate_frame(df, name)
+        risk_summary = format_risk_summary(risk)
+        compact = get_market_trend_prompt(df, name, risk_summary=risk_summary)  # 同时计算了MA/RSI列
+        legacy = legacy_market_trend_prompt(df, name, risk_summary=risk_summary)
+        facts = key_facts(df, risk)
+        results.append({
+            "case": name,
+            "legacy_tokens": count_tokens(legacy),
+            "compact_tokens": count_tokens(compact),
+            "legacy_coverage": sum(_covered(legacy, v) for v in facts.values()) / len(facts),
+            "compact_coverage": sum(_covered(compact, v) for v in facts.values()) / len(facts),
+            "missing": [k for k, v in facts.items() if not _covered(compact, v)],
+            "prompts": {"legacy": [{"role": "user", "content": legacy}], "compact": [{"role": "user", "content": compact}]},
+        })
+    return results
+
+
+def evaluate_comparisons() -> List[Dict]:
+    results = []
+    for names in EVAL_COMPARISONS:
+        summaries = [s for s in (summarize_market(name) for name in names) if s is not None]
+        if len(summaries) < 2:
+            continue
+        legacy = legacy_comparison_messages(summaries)
+        compact = prepare_comparison(names)["messages"]
+        _, corr = _cross_market_parts(summaries)
+        facts = {f"{s['name']}{k}": v for s in summaries for k, v in s["summary"].items()
+                 if isinstance(v, (int, float)) and ("涨跌幅" in k or "波动率" in k or k == "RSI14")}
+        results.append({
+            "case": "+".join(names),
+            "legacy_tokens": count_message_tokens(legacy),
+            "compact_tokens": count_message_tokens(compact),
+            "legacy_coverage": sum(_covered(legacy[1]["content"], v) for v in facts.values()) / len(facts),
+            "compact_coverage": sum(_covered(compact[1]["content"], v) for v in facts.values()) / len(facts),
+            "missing": [k for k, v in facts.items() if not _covered(compact[1]["content"], v)],
+            "prompts": {"legacy": legacy, "compact": compact},
+        })
+    return results
+
+
+JUDGE_PROMPT = """你是严格的金融分析评审。下面是针对同一市场的两份分析（A和B），请从数据准确性、
+趋势判断、支撑压力位、风险提示（是否引用具体数值）、建议的可操作性五个方面分别为两份分析打1-10分的总分。
+只返回JSON：{{"A": 分数, "B": 分数}}
+
+分析A：
+{a}
+
+分析B：
+{b}"""
+
+
+def run_llm_eval(results: List[Dict], limit: int) -> None:
+    """用两种Prompt分别请求大模型，并盲评两份分析（顺序随机）"""
+    from src.utils.llm_client import get_llm_client
+    llm = get_llm_client()
+    for item in results[:limit]:
+        outputs = {}
+        for variant in ("legacy", "compact"):
+            start = time.perf_counter()
+            response = llm.chat(item["prompts"][variant], use_cache=False)
+            usage = response.get("usage") or {}
+            outputs[variant] = response["choices"][0]["message"]["content"]
+            item[f"{variant}_latency"] = time.perf_counter() - start
+            item[f"{variant}_completion_tokens"] = usage.get("completion_tokens")
+        order = ["legacy", "compact"]
+        random.shuffle(order)
+        judge = llm.chat([{"role": "user", "content": JUDGE_PROMPT.format(a=outputs[order[0]], b=outputs[order[1]])}],
+                         temperature=0.0, use_cache=False)
+        try:
+            scores = json.loads(judge["choices"][0]["message"]["content"].strip().strip("`").removeprefix("json"))
+            item["legacy_score"] = scores["A" if order[0] == "legacy" else "B"]
+            item["compact_score"] = scores["A" if order[0] == "compact" else "B"]
+        except Exception:
+            item["legacy_score"] = item["compact_score"] = None
+        item["outputs"] = outputs
+
+
+def format_results(results: List[Dict]) -> str:
+    lines = [f"{'用例':<28}{'旧版tokens':>10}{'紧凑tokens':>10}{'压缩':>7}{'事实覆盖(旧/新)':>18}  缺失"]
+    for r in results:
+        lines.append(f"{r['case']:<28}{r['legacy_tokens']:>10}{r['compact_tokens']:>10}"
+                     f"{r['legacy_tokens'] / r['compact_tokens']:>6.1f}x"
+                     f"{r['legacy_coverage']:>10.0%}/{r['compact_coverage']:.0%}  {','.join(r['missing']) or '-'}")
+        if r.get("compact_score") is not None:
+            lines.append(f"{'':<28}LLM评分 旧版{r['legacy_score']} / 紧凑{r['compact_score']}，"
+                         f"耗时 {r['legacy_latency']:.1f}s / {r['compact_latency']:.1f}s")
+    legacy_total = sum(r["legacy_tokens"] for r in results)
+    compact_total = sum(r["compact_tokens"] for r in results)
+    lines.append(f"合计: 旧版{legacy_total} tokens，紧凑{compact_total} tokens，压缩{legacy_total / compact_total:.1f}x")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较压缩前后分析Prompt的token数和关键信息覆盖率")
+    parser.add_argument("--llm", type=int, default=0, help="请求大模型并盲评的用例数，0表示只做离线评测")
+    parser.add_argument("--json", dest="json_path", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    # 固定随机种子，保证风险指标在多次评测之间一致
+    simulator = RiskSimulator({**get_config_section("risk"), "seed": 42})
+    results = evaluate_markets(simulator) + evaluate_comparisons()
+    if args.llm:
+        run_llm_eval(results, args.llm)
+    print(format_results(results))
+    if args.json_path:
+        Path(args.json_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+数据层与Prompt构建基准
+
+在合成数据和本地模拟接口上运行可重复的基准，完全离线：
+- crawl：DataFetcher按scripts/main.py的流程抓取大盘、HOT指数和全部板块（模拟接口，可设延迟与错误注入）；
+- storage_load / storage_append：DataStorage加载CSV、追加新K线；
+- read_tail / read_full：read_market_data读取末尾730行和整个文件；
+- find_csv_file / fuzzy_match：按名称查找数据文件、拼音与相似度模糊匹配；
+- prompt_build：计算指标并构建单市场分析Prompt（需要pandas_ta）。
+
+结果可保存为JSON基线，之后的运行与基线比较，中位数变慢超过容忍度即视为回归（退出码1）。
+
+用法：
+    python -m benchmarks.suite --scale small
+    python -m benchmarks.suite --scale medium --save-baseline benchmarks/baselines/medium.json
+    python -m benchmarks.suite --scale medium --compare benchmarks/baselines/medium.json --tolerance 0.25
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from benchmarks.mock_api import MockMarketAPI
+from benchmarks.synthetic import build_universe, generate_tree
+
+SCALES = {
+    "tiny": {"series": 20, "days": 120},
+    "small": {"series": 100, "days": 730},
+    "medium": {"series": 2000, "days": 1825},
+    "large": {"series": 50000, "days": 3650},
+}
+
+# 抓取基准使用的序列数上限，全部板块都会被逐个请求，规模过大时只抓取一部分
+MAX_CRAWL_SERIES = 300
+
+
+def measure(func: Callable[[], object], repeat: int = 5, warmup: int = 1) -> Dict[str, float]:
+    """多次运行func，返回耗时统计（秒）"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "median": statistics.median(samples),
+        "min": samples[0],
+        "p95": samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        "mean": statistics.fmean(samples),
+        "repeat": repeat,
+    }
+
+
+def _config(data_dir: str, processed_dir: str, base_url: str = "http://127.0.0.1:9") -> Dict:
+    from src.utils.config import load_config
+    config = dict(load_config())
+    config["data"] = {**config.get("data", {}), "base_url": base_url, "output_dir": data_dir,
+                      "processed_dir": processed_dir}
+    return config
+
+
+@contextmanager
+def _recorded_throttle(module):
+    """把抓取器分页之间的固定等待改为只记录不等待，报告中单独列出被跳过的等待时间"""
+    skipped = []
+    original = module.time
+    module.time = SimpleNamespace(time=original.time, sleep=skipped.append)
+    try:
+        yield skipped
+    finally:
+        module.time = original
+
+
+def bench_crawl(work_dir: Path, series: int, days: int, mock_config: Dict, throttle: bool) -> Dict:
+    """按scripts/main.py的流程完整抓取一遍模拟接口"""
+    import src.data.fetcher as fetcher_module
+    from scripts.main import fetch_all_sections, fetch_hot_sections, fetch_market
+    from src.data.fetcher import DataFetcher
+    from src.data.storage import DataStorage
+
+    n_series = min(series, MAX_CRAWL_SERIES)
+    with MockMarketAPI(mock_config, n_series=n_series, days=days) as api:
+        out_dir = work_dir / "crawl"
+        config = _config(str(out_dir), str(work_dir / "crawl_processed"), api.base_url)
+        fetcher, storage = DataFetcher(config), DataStorage(config)
+
+        def crawl():
+            shutil.rmtree(out_dir, ignore_errors=True)
+            fetcher.output_dir.mkdir(parents=True, exist_ok=True)
+            fetch_market(fetcher, storage)
+            fetch_hot_sections(fetcher, storage)
+            fetch_all_sections(fetcher, storage)
+
+        if throttle:
+            result = measure(crawl, repeat=1, warmup=0)
+            skipped = []
+        else:
+            with _recorded_throttle(fetcher_module) as skipped:
+                result = measure(crawl, repeat=3, warmup=0)
+        files = len(list(out_dir.rglob("*.csv")))
+        result.update({
+            "series": n_series,
+            "files": files,
+            "requests_per_crawl": api.stats["requests"] // result["repeat"],
+            "skipped_throttle_s": round(sum(skipped) / result["repeat"], 2),
+            "injected_errors": api.stats["errors"] + api.stats["failures"] + api.stats["timeouts"],
+        })
+    return result
+
+
+def bench_storage(data_dir: Path, work_dir: Path, sample: List[str]) -> Dict[str, Dict]:
+    from src.data.storage import DataStorage
+
+    append_dir = work_dir / "append"
+    shutil.copytree(data_dir, append_dir, dirs_exist_ok=True)
+    storage = DataStorage(_config(str(append_dir), str(work_dir / "processed")))
+    rel_paths = [str(Path(p).relative_to(data_dir)) for p in sample]
+
+    def load_all():
+        for rel in rel_paths:
+            storage.load_csv(rel)
+
+    new_rows = pd.DataFrame([{"date": f"2025-07-{day:02d}", "open": 1.0, "close": 1.0, "high": 1.0, "low": 1.0,
+                              "volume": 1, "amount": 1.0} for day in range(1, 6)])
+
+    def append_all():
+        for rel in rel_paths:
+            storage.append_to_csv(new_rows, rel)
+
+    return {"storage_load": measure(load_all), "storage_append": measure(append_all)}
+
+
+def bench_reads(data_dir: Path, names: List[str]) -> Dict[str, Dict]:
+    from src.tools.data_tools import read_market_data
+
+    def read_tail():
+        for name in names:
+            read_market_data(name, data_dir=str(data_dir), num_days=730)
+
+    def read_full():
+        for name in names:
+            read_market_data(name, data_dir=str(data_dir))
+
+    return {"read_tail": measure(read_tail), "read_full": measure(read_full)}
+
+
+def bench_lookup(data_dir: Path, names: List[str]) -> Dict[str, Dict]:
+    from src.tools.data_tools import find_csv_file, fuzzy_match_market_name
+
+    rng = random.Random(0)
+    # 模拟用户输入：去掉一个字符或只给出前半部分
+    typos = []
+    for name in names:
+        if len(name) > 3:
+            i = rng.randrange(len(name))
+            typos.append(name[:i] + name[i + 1:])
+        else:
+            typos.append(name)
+
+    def find_all():
+        for name in names:
+            find_csv_file(name, str(data_dir))
+
+    def fuzzy_all():
+        for name in typos:
+            fuzzy_match_market_name(name, str(data_dir))
+
+    results = {"find_csv_file": measure(find_all)}
+    try:
+        results["fuzzy_match"] = measure(fuzzy_all, repeat=3)
+    except ImportError as e:
+        print(f"跳过fuzzy_match: {e}")
+    return results
+
+
+def bench_prompt(data_dir: Path, names: List[str]) -> Dict[str, Dict]:
+    from src.tools.analysis_tools import get_market_trend_prompt
+    from src.tools.data_tools import read_market_data
+
+    frames = [(name, read_market_data(name, data_dir=str(data_dir), num_days=730)) for name in names]
+
+    def build_all():
+        for name, df in frames:
+            get_market_trend_prompt(df.copy(), name)
+
+    try:
+        return {"prompt_build": measure(build_all)}
+    except ImportError as e:
+        print(f"跳过prompt_build: {e}")
+        return {}
+
+
+def run_suite(scale: str = "small", series: Optional[int] = None, days: Optional[int] = None,
+              sample_size: int = 20, mock_config: Optional[Dict] = None, throttle: bool = False,
+              only: Optional[List[str]] = None) -> Dict:
+    """生成合成数据并运行全部基准
+
+    Args:
+        scale: 预设规模（tiny/small/medium/large）
+        series: 序列数，覆盖预设
+        days: 历史天数，覆盖预设
+        sample_size: 读取、查找、Prompt基准抽样的市场数
+        mock_config: 模拟接口配置（延迟、分页、错误注入）
+        throttle: 抓取时是否保留分页之间的固定等待
+        only: 只运行这些基准组（crawl/storage/read/lookup/prompt）
+
+    Returns:
+        Dict: meta（环境与规模）和results（各基准的耗时统计）
+    """
+    params = {**SCALES[scale]}
+    params.update({k: v for k, v in (("series", series), ("days", days)) if v})
+    groups = only or ["crawl", "storage", "read", "lookup", "prompt"]
+    work_dir = Path(tempfile.mkdtemp(prefix="cs_bench_"))
+    try:
+        data_dir = work_dir / "kline"
+        generated = generate_tree(str(data_dir), params["series"], params["days"])
+        specs = build_universe(params["series"])
+        sample = random.Random(0).sample(specs, min(sample_size, len(specs)))
+        names = [spec.name for spec in sample]
+        paths = [str(data_dir / spec.rel_path) for spec in sample]
+
+        results: Dict[str, Dict] = {}
+        if "crawl" in groups:
+            results["crawl"] = bench_crawl(work_dir, params["series"], params["days"], mock_config or {}, throttle)
+        if "storage" in groups:
+            results.update(bench_storage(data_dir, work_dir, paths))
+        if "read" in groups:
+            results.update(bench_reads(data_dir, names))
+        if "lookup" in groups:
+            results.update(bench_lookup(data_dir, names))
+        if "prompt" in groups:
+            results.update(bench_prompt(data_dir, names))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "scale": scale,
+            **params,
+            "sample_size": len(names),
+            "generated": generated,
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare_results(current: Dict, baseline: Dict, tolerance: float = 0.25) -> List[Dict]:
+    """按中位数耗时与基线比较，ratio超过1+tolerance记为回归"""
+    rows = []
+    for name, stats in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            rows.append({"name": name, "current": stats["median"], "baseline": None, "ratio": None, "status": "new"})
+            continue
+        ratio = stats["median"] / base["median"] if base["median"] else float("inf")
+        status = "regression" if ratio > 1 + tolerance else "improved" if ratio < 1 - tolerance else "ok"
+        rows.append({"name": name, "current": stats["median"], "baseline": base["median"], "ratio": ratio,
+                     "status": status})
+    return rows
+
+
+def format_results(report: Dict, comparison: Optional[List[Dict]] = None) -> str:
+    meta = report["meta"]
+    lines = [f"规模: {meta['scale']}（{meta['series']}个序列 × {meta['days']}天，抽样{meta['sample_size']}个），"
+             f"生成数据{meta['generated']['bytes'] / 1e6:.1f}MB，用时{meta['generated']['seconds']:.1f}s"]
+    if comparison is None:
+        lines.append(f"{'基准':<16}{'中位数(ms)':>12}{'最小(ms)':>12}{'p95(ms)':>12}")
+        for name, stats in report["results"].items():
+            lines.append(f"{name:<16}{stats['median'] * 1000:>12.1f}{stats['min'] * 1000:>12.1f}"
+                         f"{stats['p95'] * 1000:>12.1f}")
+    else:
+        lines.append(f"{'基准':<16}{'当前(ms)':>12}{'基线(ms)':>12}{'比值':>8}  状态")
+        for row in comparison:
+            baseline = f"{row['baseline'] * 1000:>12.1f}" if row["baseline"] is not None else f"{'-':>12}"
+            ratio = f"{row['ratio']:>7.2f}x" if row["ratio"] is not None else f"{'-':>8}"
+            lines.append(f"{row['name']:<16}{row['current'] * 1000:>12.1f}{baseline}{ratio}  {row['status']}")
+    crawl = report["results"].get("crawl")
+    if crawl:
+        lines.append(f"抓取: {crawl['series']}个序列，{crawl['requests_per_crawl']}次请求/轮，"
+                     f"跳过分页等待{crawl['skipped_throttle_s']}s/轮，注入错误{crawl['injected_errors']}次")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="在合成数据和模拟接口上运行数据层基准（离线）")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--series", type=int, help="序列数，覆盖预设规模")
+    parser.add_argument("--days", type=int, help="历史天数，覆盖预设规模")
+    parser.add_argument("--sample", type=int, default=20, help="读取/查找/Prompt基准抽样的市场数")
+    parser.add_argument("--only", nargs="+", choices=["crawl", "storage", "read", "lookup", "prompt"])
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟接口每个请求的延迟（秒）")
+    parser.add_argument("--page-size", type=int, default=500, help="模拟接口K线每页条数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟接口返回HTTP 500的概率")
+    parser.add_argument("--throttle", action="store_true", help="保留抓取器分页之间的0.5秒等待")
+    parser.add_argument("--save-baseline", help="把结果保存为基线JSON")
+    parser.add_argument("--compare", help="与基线JSON比较，出现回归时退出码为1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的中位数变慢比例")
+    args = parser.parse_args()
+
+    mock_config = {"latency": args.latency, "page_size": args.page_size, "error_rate": args.error_rate}
+    report = run_suite(args.scale, args.series, args.days, args.sample, mock_config, args.throttle, args.only)
+
+    comparison = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if {k: baseline["meta"].get(k) for k in ("series", "days")} != {k: report["meta"][k] for k in ("series", "days")}:
+            print("警告: 基线的数据规模与本次运行不同，比较结果仅供参考")
+        comparison = compare_results(report, baseline, args.tolerance)
+    print(format_results(report, comparison))
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if comparison and any(row["status"] == "regression" for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
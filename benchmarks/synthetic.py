@@ -0,0 +1,190 @@
+"""
+合成K线数据生成器
+
+按与真实抓取结果相同的目录结构生成K线数据树：根目录下的大盘.csv、HOT目录下的热门指数、
+每个一级板块一个目录（板块自身的CSV加上各二级板块的子目录）。序列数量可从几十到五万，
+历史长度可从几个月到十年。价格为带波动率聚集的对数随机游走，成交量与价格波动相关，
+同一随机种子总是生成完全相同的数据，便于基准结果在不同机器、不同时间之间比较。
+
+用法：
+    python -m benchmarks.synthetic --out /tmp/kline --series 1000 --days 1825
+"""
+import argparse
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 固定的数据截止日期，保证生成结果与运行日期无关
+END_DATE = date(2025, 6, 30)
+
+CATEGORIES = ["步枪", "手枪", "匕首", "手套", "印花", "探员", "武器箱", "微型冲锋枪", "霰弹枪", "音乐盒",
+              "机枪", "涂鸦", "布章", "收藏品", "通行证", "钥匙"]
+HOT_INDICES = ["百战指数", "千战指数", "多普勒指数", "伽玛多普勒指数", "原皮指数"]
+ITEM_PREFIXES = ["AK-47", "M4A4", "M4A1消音型", "AWP", "沙漠之鹰", "格洛克18型", "USP消音版", "蝴蝶刀", "爪子刀",
+                 "运动手套", "驾驶手套", "P90", "MP9", "新星", "内格夫", "SSG 08", "FN57", "加利尔AR", "法玛斯", "刺刀"]
+ITEM_SKINS = ["红线", "火神", "二西莫夫", "血腥运动", "霓虹骑士", "渐变之色", "多普勒", "伽玛多普勒", "深红之网",
+              "表面淬火", "屠夫", "野火", "皇后", "暴怒野兽", "黑色魅影", "龙王", "印花集", "荒野反叛", "燃料喷射器", "迷人眼"]
+ITEM_WEARS = ["崭新出厂", "略有磨损", "久经沙场", "破损不堪", "战痕累累"]
+
+CSV_HEADER = "date,open,close,high,low,volume,amount\n"
+
+
+@dataclass
+class SeriesSpec:
+    """一个合成序列：市场名、相对数据目录的CSV路径，以及模拟接口使用的板块参数"""
+    name: str
+    rel_path: str
+    type: str
+    level: int
+    type_val: str
+    parent: Optional[str] = None    # 上级板块的type_val，一级板块和大盘为None
+    price: float = 100.0            # 初始价格量级
+
+    @property
+    def seed(self) -> int:
+        return int(hashlib.md5(self.type_val.encode("utf-8")).hexdigest()[:8], 16)
+
+
+def _type_val(*parts) -> str:
+    """生成与真实接口形式相同的19位数字ID"""
+    digest = hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()
+    return str(10 ** 18 + int(digest[:15], 16) % (9 * 10 ** 18))
+
+
+def _item_name(index: int) -> str:
+    prefix = ITEM_PREFIXES[index % len(ITEM_PREFIXES)]
+    skin = ITEM_SKINS[(index // len(ITEM_PREFIXES)) % len(ITEM_SKINS)]
+    wear = ITEM_WEARS[(index // (len(ITEM_PREFIXES) * len(ITEM_SKINS))) % len(ITEM_WEARS)]
+    rounds = index // (len(ITEM_PREFIXES) * len(ITEM_SKINS) * len(ITEM_WEARS))
+    name = f"{prefix} _ {skin} ({wear})"
+    return f"{name} {rounds + 1}" if rounds else name
+
+
+def build_universe(n_series: int, seed: int = 0) -> List[SeriesSpec]:
+    """生成市场目录结构
+
+    Args:
+        n_series: 序列总数（含大盘和HOT指数），至少为len(HOT_INDICES)+2
+        seed: 随机种子，影响板块数量和各板块的二级板块分配
+
+    Returns:
+        List[SeriesSpec]: 大盘、HOT指数、一级板块、二级板块依次排列
+    """
+    n_series = max(n_series, len(HOT_INDICES) + 2)
+    rng = np.random.default_rng(seed)
+    specs = [SeriesSpec("大盘", "大盘.csv", "STATISTICS", 0, _type_val(seed, "大盘"), price=1000.0)]
+    specs += [SeriesSpec(name, f"HOT/{name}.csv", "HOT", 0, _type_val(seed, "HOT", name), price=1000.0)
+              for name in HOT_INDICES]
+
+    remaining = n_series - len(specs)
+    # 序列较少时减少一级板块数，保证每个板块平均至少有几个二级板块
+    n_categories = min(len(CATEGORIES), max(1, remaining // 4))
+    categories = CATEGORIES[:n_categories]
+    n_children = remaining - n_categories
+    # 二级板块数量在一级板块之间按长尾分布分配
+    weights = rng.dirichlet(np.full(n_categories, 0.8))
+    counts = np.floor(weights * n_children).astype(int)
+    counts[: n_children - counts.sum()] += 1
+
+    item_index = 0
+    for category, count in zip(categories, counts):
+        category_val = _type_val(seed, "BROAD", category)
+        specs.append(SeriesSpec(category, f"{category}/{category}.csv", "BROAD", 0, category_val,
+                                price=float(rng.uniform(1e4, 2e6))))
+        for _ in range(count):
+            name = _item_name(item_index)
+            item_index += 1
+            safe = name.replace("|", "_").replace("/", "_")
+            specs.append(SeriesSpec(name, f"{category}/{safe}/{safe}.csv", "BROAD", 1,
+                                    _type_val(seed, "BROAD", category, name), parent=category_val,
+                                    price=float(np.exp(rng.uniform(np.log(5), np.log(5e4))))))
+    return specs
+
+
+def generate_ohlcv(spec: SeriesSpec, days: int, end: date = END_DATE) -> Dict[str, np.ndarray]:
+    """生成一个序列的日K线
+
+    收益率的波动率服从对数OU过程（波动率聚集），偶尔出现跳跃；成交量为对数正态分布并随|收益率|放大。
+
+    Returns:
+        Dict[str, np.ndarray]: timestamp（秒）、open、close、high、low、volume、amount
+    """
+    rng = np.random.default_rng(spec.seed)
+    log_vol = np.empty(days)
+    log_vol[0] = np.log(0.02)
+    shocks = rng.normal(0.0, 0.15, days)
+    for i in range(1, days):
+        log_vol[i] = log_vol[i - 1] + 0.05 * (np.log(0.02) - log_vol[i - 1]) + shocks[i]
+    sigma = np.exp(log_vol)
+    returns = rng.standard_t(4, days) * sigma / np.sqrt(2) + 0.0002
+    jumps = rng.random(days) < 0.01
+    returns[jumps] += rng.normal(0, 0.08, jumps.sum())
+
+    close = spec.price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[spec.price], close[:-1]]) * (1 + rng.normal(0, 0.002, days))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.5, days)) * sigma)
+    low = np.minimum(open_, close) * (1 - np.clip(np.abs(rng.normal(0, 0.5, days)) * sigma, 0, 0.5))
+    base_volume = np.exp(rng.uniform(3, 9))
+    volume = np.floor(base_volume * rng.lognormal(0, 0.4, days) * (1 + 20 * np.abs(returns))).astype(np.int64)
+    amount = volume * (high + low) / 2
+
+    start = end - timedelta(days=days - 1)
+    start_ts = (start - date(1970, 1, 1)).days * 86400
+    timestamps = start_ts + np.arange(days, dtype=np.int64) * 86400
+    return {"timestamp": timestamps, "open": open_, "close": close, "high": high, "low": low,
+            "volume": volume, "amount": amount}
+
+
+def to_csv_text(data: Dict[str, np.ndarray]) -> str:
+    """格式化为与DataFetcher.save_to_csv输出相同的CSV文本"""
+    dates = (np.datetime64("1970-01-01") + data["timestamp"] // 86400).astype(str)
+    rows = zip(dates, data["open"], data["close"], data["high"], data["low"], data["volume"], data["amount"])
+    return CSV_HEADER + "".join(f"{d},{o:.2f},{c:.2f},{h:.2f},{l:.2f},{v},{a:.2f}\n" for d, o, c, h, l, v, a in rows)
+
+
+def generate_tree(output_dir: str, n_series: int = 100, days: int = 730, seed: int = 0) -> Dict:
+    """在output_dir下写出合成K线数据树
+
+    Args:
+        output_dir: 输出目录（相当于data/kline）
+        n_series: 序列总数
+        days: 每个序列的历史天数
+        seed: 随机种子
+
+    Returns:
+        Dict: 生成统计：series、rows、bytes、seconds
+    """
+    start = time.perf_counter()
+    root = Path(output_dir)
+    total_bytes = 0
+    specs = build_universe(n_series, seed)
+    for spec in specs:
+        path = root / spec.rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = to_csv_text(generate_ohlcv(spec, days))
+        path.write_text(text, encoding="utf-8")
+        total_bytes += len(text.encode("utf-8"))
+    return {"series": len(specs), "rows": len(specs) * days, "bytes": total_bytes,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成K线数据树")
+    parser.add_argument("--out", required=True, help="输出目录")
+    parser.add_argument("--series", type=int, default=100, help="序列数量（10~50000）")
+    parser.add_argument("--days", type=int, default=730, help="每个序列的历史天数（如90~3650）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.out) and os.listdir(args.out):
+        parser.error(f"输出目录不为空: {args.out}")
+    print(generate_tree(args.out, args.series, args.days, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,146 @@
-import os
+import time
+import asyncio
+import functools
 import chainlit as cl
-from dotenv import load_dotenv
-import yaml
-from src.utils.llm_client import LLMClient
-from src.agents.trend_agent import analyze_market_trend
-from src.tools.compare_analyzer import compare_market_trends
-from src.agents.tools_registry import get_tools
-from langchain.agents import initialize_agent, AgentType
-from langchain.chat_models import ChatOpenAI
-
-load_dotenv()
-api_key = os.getenv("API_KEY")
-# 读取配置
-with open("config/config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
+import pandas as pd
+from src.utils.config import load_config
+from src.utils.llm_client import get_llm_client
+from src.utils.logger import setup_logger
+from src.utils.async_utils import configure_executor, run_blocking
+from src.utils.metrics import configure_metrics
+from src.utils.warmup import start_background_warmup
+from src.agents.assistant import arespond
+from src.agents.intent_router import get_intent_router
+from src.agents.memory import ConversationMemory
+from src.agents.trend_agent import get_chart_service
+from src.tools.chart_data import get_chart_data
+
+config = load_config()
 llm_cfg = config["llm_api"]
 
-# 初始化LLM和工具
-llm = ChatOpenAI(temperature=0, model=llm_cfg["model"])
-tools = get_tools()
+logger = setup_logger("chainlit_app")
+
+# 阻塞任务共享的有界线程池，以及每个会话允许同时处理的请求数
+concurrency_cfg = config.get("concurrency", {})
+configure_executor(concurrency_cfg.get("max_workers", 8))
+PER_SESSION_LIMIT = concurrency_cfg.get("per_session_limit", 1)
+
+# 性能埋点与指标导出（默认关闭）
+configure_metrics(config.get("metrics"))
+
+# 交互式K线图：服务端只返回降采样后的列式数据，由浏览器端的Plotly绘制，缩放平移无需服务端渲染图片
+chart_cfg = config.get("chart", {})
+INTERACTIVE_CHART = chart_cfg.get("interactive", True)
+INTERACTIVE_POINTS = chart_cfg.get("interactive_points", 400)
+
+@functools.lru_cache(maxsize=1)
+def get_agent():
+    """创建通用问答使用的Agent，langchain导入较慢，第一次使用（或后台预热）时才创建"""
+    from langchain.agents import initialize_agent, AgentType
+    from langchain.chat_models import ChatOpenAI
+    from src.agents.tools_registry import get_tools
+
+    llm = ChatOpenAI(temperature=0, model=llm_cfg["model"])
+    return initialize_agent(
+        get_tools(),
+        llm,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        verbose=True
+    )
+
+def _warm_up_analysis():
+    import pandas_ta  # noqa: F401
+    import pypinyin  # noqa: F401
 
-# 初始化Agent
-agent = initialize_agent(
-    tools,
-    llm,
-    agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True
-)
+def _warm_up_llm_client():
+    # 创建共享客户端并触发openai SDK导入
+    get_llm_client().async_client
+
+# 启动时在后台提前完成较慢的初始化，服务本身无需等待
+startup_cfg = config.get("startup", {})
+if startup_cfg.get("warm_up", True):
+    start_background_warmup({
+        "analysis": _warm_up_analysis,
+        "intent_router": lambda: get_intent_router().match_markets(""),
+        "llm_client": _warm_up_llm_client,
+        "agent": get_agent,
+        "chart_service": lambda: get_chart_service().warm_up() if not INTERACTIVE_CHART else None,
+    })
+
+def get_memory() -> ConversationMemory:
+    memory = cl.user_session.get("memory")
+    if memory is None:
+        memory = ConversationMemory(config.get("memory"))
+        cl.user_session.set("memory", memory)
+    return memory
 
 @cl.on_chat_start
 def start_chat():
-    cl.user_session.set("message_history", [
-        {"role": "system", "content": "你是一个专业的市场分析师，可以分析市场趋势、回答金融相关问题。"}
-    ])
+    # 会话记忆有token上限：最近几轮原样保留，更早的对话折叠为摘要，讨论过的市场置顶
+    cl.user_session.set("memory", ConversationMemory(config.get("memory")))
+    cl.user_session.set("semaphore", asyncio.Semaphore(PER_SESSION_LIMIT))
+
+def build_kline_figure(payload: dict):
+    """根据get_chart_data返回的列式数据构建Plotly K线图"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    columns = payload["columns"]
+    dates = pd.to_datetime(columns["date"], unit="D")
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.75, 0.25], vertical_spacing=0.03)
+    fig.add_trace(go.Candlestick(x=dates, open=columns["open"], high=columns["high"], low=columns["low"],
+                                 close=columns["close"], name="K线"), row=1, col=1)
+    fig.add_trace(go.Bar(x=dates, y=columns["volume"], name="成交量"), row=2, col=1)
+    fig.update_layout(
+        title=f"{payload['market']} K线图（{payload['points']}/{payload['total_points']}根）",
+        xaxis_rangeslider_visible=False,
+        showlegend=False,
+        height=520,
+        margin=dict(l=40, r=20, t=50, b=30),
+    )
+    return fig
+
+async def build_chart_elements(market_name: str, chart_future=None) -> list:
+    """生成消息附带的K线图元素：优先使用交互式图表，不可用时回退到渲染好的PNG"""
+    if INTERACTIVE_CHART:
+        try:
+            payload = await run_blocking(get_chart_data, market_name, target_points=INTERACTIVE_POINTS)
+            if payload is not None:
+                figure = await run_blocking(build_kline_figure, payload)
+                return [cl.Plotly(name=f"{market_name} K线图", figure=figure, display="inline")]
+        except Exception as e:
+            logger.error(f"生成交互式K线图时发生错误: {str(e)}")
+    if chart_future is not None:
+        try:
+            image_path = await asyncio.shield(asyncio.wrap_future(chart_future))
+            return [cl.Image(path=image_path, name=f"{market_name} K线图", display="inline")]
+        except Exception as e:
+            logger.error(f"生成K线图时发生错误: {str(e)}")
+    return []
+
+async def handle_message(user_input: str, start: float):
+    msg = cl.Message(content="")
+    reply = await arespond(user_input, get_memory(), on_token=msg.stream_token, agent_factory=get_agent,
+                           render_chart=not INTERACTIVE_CHART, start=start)
+    await msg.send()
+    if reply.chart_market:
+        # 文本完成后再附加K线图
+        elements = await build_chart_elements(reply.chart_market, reply.chart_future)
+        if elements:
+            msg.elements = elements
+            await msg.update()
 
 @cl.on_message
 async def main(message: cl.Message):
     user_input = message.content
-    # 由Agent自动选择工具并应答
+    start = time.perf_counter()
+    semaphore = cl.user_session.get("semaphore")
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(PER_SESSION_LIMIT)
+        cl.user_session.set("semaphore", semaphore)
     try:
-        response = agent.run(user_input)
-        await cl.Message(content=response).send()
+        # 限制单个会话的并发请求数，避免一个用户占满线程池
+        async with semaphore:
+            await handle_message(user_input, start)
     except Exception as e:
-        await cl.Message(content=f"出错: {e}").send() 
\ No newline at end of file
+        await cl.Message(content=f"出错: {e}").send()
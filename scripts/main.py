@@ -1,5 +1,5 @@
 import argparse
-import yaml
+import logging
 from pathlib import Path
 import sys
 import re
@@ -12,11 +12,16 @@ sys.path.append(str(project_root))
 
 from src.data.fetcher import DataFetcher
 from src.data.storage import DataStorage
-from src.utils.logger import setup_logger
+from src.utils.config import load_config as load_config_file
+from src.utils.logger import LogSampler, setup_logger
+from src.utils.metrics import configure_metrics
+from src.tools.anomaly_scanner import AnomalyScanner
 import pandas as pd
 
 # 创建logger实例
 logger = setup_logger("main")
+# 逐个板块的进度日志抽样输出
+sampler = LogSampler()
 
 HOT_SECTIONS = [
     {"type": "HOT", "typeVal": "1368024613355786240", "level": 0, "nameZh": "百战指数"},
@@ -34,8 +39,7 @@ def load_config() -> dict:
     """
     try:
         config_path = project_root / "config" / "config.yaml"
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = yaml.safe_load(f)
+        config = load_config_file(config_path)
         logger.info("成功加载配置文件")
         return config
     except Exception as e:
@@ -60,7 +64,7 @@ def fetch_section_and_children_kline(fetcher, storage, section, parent_path="",
     full_dir = os.path.join(fetcher.output_dir, current_path)
     os.makedirs(full_dir, exist_ok=True)
 
-    logger.info(f"开始获取板块 {section_name} 的K线数据")
+    logger.debug("开始获取板块 %s 的K线数据", section_name)
     api_url = f"{fetcher.base_url}/user/item/block/v1/kline"
     params = {
         "type": section_type,
@@ -74,7 +78,7 @@ def fetch_section_and_children_kline(fetcher, storage, section, parent_path="",
     kline_data = fetcher.fetch_kline(api_url, params)
     filename = os.path.join(current_path, f"{safe_section_name}.csv")
     if fetcher.save_to_csv(kline_data, filename):
-        logger.info(f"成功保存板块 {section_name} 的K线数据")
+        sampler.log(logger, logging.INFO, "section", "成功保存板块 %s 的K线数据", section_name)
     else:
         logger.error(f"保存板块 {section_name} 的K线数据失败")
 
@@ -124,7 +128,7 @@ def fetch_latest_data(fetcher: DataFetcher, storage: DataStorage):
             if not section_id or not section_name:
                 continue
                 
-            logger.info(f"开始获取板块 {section_name} 的最新K线数据")
+            logger.debug("开始获取板块 %s 的最新K线数据", section_name)
             
             # 构建API URL和参数
             api_url = f"{fetcher.base_url}/user/item/block/v1/kline"
@@ -147,7 +151,7 @@ def fetch_latest_data(fetcher: DataFetcher, storage: DataStorage):
             # 追加数据
             filename = f"{section_name}.csv"
             if storage.append_to_csv(df, filename):
-                logger.info(f"成功追加板块 {section_name} 的最新K线数据")
+                sampler.log(logger, logging.INFO, "latest", "成功追加板块 %s 的最新K线数据", section_name)
             else:
                 logger.error(f"追加板块 {section_name} 的最新K线数据失败")
                 
@@ -192,16 +196,38 @@ def fetch_hot_sections(fetcher, storage):
         else:
             logger.warning(f"未获取到{section['nameZh']}K线数据")
 
+def run_anomaly_scan(config: dict):
+    """抓取完成后对所有序列进行异动扫描，生成告警表"""
+    try:
+        scanner = AnomalyScanner(config.get("anomaly"), data_dir=config['data']['output_dir'])
+        scanner.scan()
+    except Exception as e:
+        logger.error(f"异动扫描时发生错误: {str(e)}")
+
+def run_report_pipeline(config: dict):
+    """抓取完成后为常见市场预生成分析报告，只重新生成数据有变化的市场"""
+    reports_config = config.get("reports") or {}
+    if not reports_config.get("enabled", True):
+        return
+    try:
+        # 依赖大模型客户端等较重的模块，只在需要时导入
+        from src.agents.daily_reports import DailyReportPipeline
+        DailyReportPipeline(reports_config, data_dir=config['data']['output_dir']).run()
+    except Exception as e:
+        logger.error(f"预生成分析报告时发生错误: {str(e)}")
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description="K线数据获取工具")
     parser.add_argument("--mode", choices=["all", "latest"], default="all",
                       help="运行模式：all-获取所有数据，latest-获取最新数据")
+    parser.add_argument("--skip-reports", action="store_true", help="抓取后不预生成分析报告")
     args = parser.parse_args()
     
     try:
         # 加载配置
         config = load_config()
+        configure_metrics(config.get("metrics"))
         
         # 初始化数据获取器和存储器
         fetcher = DataFetcher(config)
@@ -214,6 +240,13 @@ def main():
             fetch_all_sections(fetcher, storage)
         else:
             fetch_latest_data(fetcher, storage)
+
+        # 数据更新后扫描市场异动
+        run_anomaly_scan(config)
+
+        # 为常见问题预生成分析报告
+        if not args.skip_reports:
+            run_report_pipeline(config)
             
     except Exception as e:
         logger.error(f"程序执行出错: {str(e)}")
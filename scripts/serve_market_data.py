@@ -0,0 +1,36 @@
+import argparse
+from pathlib import Path
+import sys
+import os
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+os.chdir(project_root)
+sys.path.append(str(project_root))
+
+from src.data.market_service import MarketDataServer
+from src.utils.config import get_config_section
+from src.utils.metrics import configure_metrics
+
+
+def main():
+    """启动本地行情查询服务"""
+    config = get_config_section("market_service")
+    parser = argparse.ArgumentParser(description="本地行情查询服务")
+    parser.add_argument("--host", default=config.get("host"), help="监听地址，默认只监听本机")
+    parser.add_argument("--port", type=int, default=config.get("port"), help="监听端口")
+    parser.add_argument("--data-dir", default=get_config_section("data").get("output_dir", "data/kline"),
+                        help="K线数据目录")
+    args = parser.parse_args()
+
+    configure_metrics(get_config_section("metrics"))
+    overrides = {k: v for k, v in (("host", args.host), ("port", args.port)) if v is not None}
+    server = MarketDataServer({**config, **overrides}, data_dir=args.data_dir)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+助手消息处理流程
+
+与界面无关的单轮消息处理：指代补全、意图路由，然后按意图走异动报告、单市场流式分析、
+多市场流式对比或通用问答，最后写入会话记忆。前端（frontend/chainlit_app.py）和压测工具
+共用同一流程；文本通过on_token回调逐段交给调用方，各阶段耗时和首token耗时随结果返回。
+"""
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.agents.intent_router import get_intent_router
+from src.agents.memory import ConversationMemory
+from src.agents.trend_agent import astream_market_trend, prepare_market_analysis
+from src.tools.anomaly_scanner import get_configured_anomaly_report
+from src.tools.compare_analyzer import astream_compare_market_trends
+from src.utils import metrics
+from src.utils.async_utils import run_blocking
+from src.utils.llm_client import get_llm_client
+from src.utils.logger import setup_logger
+
+logger = setup_logger("assistant")
+
+# 指代上文市场的说法，如“它最近怎么样”“这个板块能买吗”
+REFERENCE_WORDS = ("它", "这个", "该板块", "该市场", "刚才", "上面", "那个")
+
+GENERAL_SYSTEM_PROMPT = "你是CS饰品市场助手，请用简洁的中文回答用户的问题。"
+
+TokenCallback = Callable[[str], Awaitable[Any]]
+
+
+@dataclass
+class AssistantReply:
+    """一轮回复的结果"""
+    content: str
+    intent: Dict[str, Any]
+    market_names: List[str]
+    chart_market: Optional[str] = None       # 需要附加K线图的市场
+    chart_future: Any = None                 # 已提交的PNG渲染任务
+    stages: Dict[str, float] = field(default_factory=dict)   # 各阶段耗时（秒）
+    ttft: Optional[float] = None             # 从开始处理到第一段文本的耗时（秒）
+    total: float = 0.0
+
+
+class _Recorder:
+    """记录阶段耗时和首token时间，并把文本转发给回调"""
+
+    def __init__(self, on_token: Optional[TokenCallback], start: float):
+        self.on_token = on_token
+        self.start = start
+        self.stages: Dict[str, float] = {}
+        self.ttft: Optional[float] = None
+        self.parts: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - began
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            metrics.observe("assistant_stage_seconds", elapsed, stage=name)
+
+    async def emit(self, text: str):
+        if not text:
+            return
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+            metrics.observe("assistant_ttft_seconds", self.ttft)
+            logger.info(f"首token耗时(TTFT): {self.ttft * 1000:.0f}ms")
+        self.parts.append(text)
+        if self.on_token is not None:
+            await self.on_token(text)
+
+    async def stream(self, tokens):
+        async for token in tokens:
+            await self.emit(token)
+
+
+async def arespond(user_input: str, memory: ConversationMemory, on_token: Optional[TokenCallback] = None,
+                   agent_factory: Optional[Callable[[], Any]] = None, render_chart: bool = False,
+                   start: Optional[float] = None) -> AssistantReply:
+    """处理一轮用户消息
+
+    Args:
+        user_input: 用户输入
+        memory: 本会话的记忆
+        on_token: 接收回复文本片段的异步回调
+        agent_factory: 返回处理通用问题的Agent（需提供arun）的函数，只在通用问题时调用；
+            为None时直接用带记忆的对话消息请求大模型
+        render_chart: 单市场分析时是否提交PNG渲染（前端使用交互式图表时为False）
+        start: 请求开始的时间（time.perf_counter），用于计算首token耗时，默认为调用时刻
+
+    Returns:
+        AssistantReply: 回复文本、路由结果、需附加图表的市场、各阶段耗时
+    """
+    start = start if start is not None else time.perf_counter()
+    recorder = _Recorder(on_token, start)
+    router = get_intent_router()
+    chart_market, chart_future = None, None
+
+    with recorder.stage("route"):
+        route_input = user_input
+        if memory.last_market and any(word in user_input for word in REFERENCE_WORDS) \
+                and not router.match_markets(user_input):
+            # 没有提到市场但指代了上文时，补上最近讨论的市场
+            route_input = f"{memory.last_market} {user_input}"
+        # 本地规则能确定意图时不再请求大模型，置信度不足才回退
+        intent = await router.aroute(route_input)
+    market_names = intent.get("market_names") or []
+
+    if intent.get("task") == "anomaly" and intent.get("source") == "local":
+        # 异动查询直接读取扫描结果，无需经过Agent
+        with recorder.stage("anomaly"):
+            report = await run_blocking(get_configured_anomaly_report)
+        await recorder.emit(report)
+    elif intent.get("intent") == "market_analysis" and len(market_names) == 1:
+        # 先流式输出分析文本，K线图由调用方在文本完成后附加
+        market_name = market_names[0]
+        with recorder.stage("prepare"):
+            prepared = await run_blocking(prepare_market_analysis, market_name, render_chart=render_chart)
+        with recorder.stage("llm"):
+            await recorder.stream(astream_market_trend(market_name, prepared=prepared))
+        if prepared.get("messages") is not None:
+            chart_market, chart_future = market_name, prepared.get("chart_future")
+    elif intent.get("intent") == "market_analysis" and len(market_names) > 1:
+        with recorder.stage("llm"):
+            await recorder.stream(astream_compare_market_trends(market_names))
+    else:
+        with recorder.stage("agent"):
+            if agent_factory is not None:
+                # Agent只接受单个输入字符串，记忆以受限长度的背景文字随输入传入
+                response = await agent_factory().arun(memory.contextualize(user_input))
+            else:
+                result = await get_llm_client().achat(memory.build_messages(GENERAL_SYSTEM_PROMPT, user_input))
+                response = result["choices"][0]["message"]["content"]
+        await recorder.emit(response)
+
+    content = "".join(recorder.parts)
+    with recorder.stage("memory"):
+        await memory.aadd_turn(user_input, content, market_names)
+    total = time.perf_counter() - start
+    metrics.observe("assistant_request_seconds", total, intent=intent.get("intent", "unknown"))
+    return AssistantReply(content=content, intent=intent, market_names=market_names, chart_market=chart_market,
+                          chart_future=chart_future, stages=recorder.stages, ttft=recorder.ttft, total=total)
@@ -0,0 +1,150 @@
+"""
+抓取后的每日报告预生成流水线
+
+数据每天抓取一次，大盘、HOT指数、各一级板块等常见问题的答案在数据更新后就已确定。
+scripts/main.py 抓取完成后运行本流水线，为配置的市场预先计算指标、渲染K线图并请求大模型分析，
+按数据版本保存到报告存储；analyze_market_trend 等入口遇到版本一致的报告直接返回。
+只有数据版本发生变化（或尚无成功报告）的市场会重新生成。
+
+用法：
+    python -m src.agents.daily_reports [--force]
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.agents.trend_agent import get_chart_service, get_report_store, prepare_market_analysis
+from src.tools.data_tools import get_data_version
+from src.tools.report_store import DEFAULT_REPORT_CONFIG, ReportStore
+from src.utils.async_utils import run_blocking
+from src.utils.config import get_config_section
+from src.utils.llm_client import get_llm_client
+from src.utils.logger import setup_logger
+from src.utils.metrics import configure_metrics
+
+logger = setup_logger("daily_reports")
+
+
+def select_markets(patterns: List[str], data_dir: str = "data/kline") -> Dict[str, str]:
+    """按glob模式（相对数据目录）选出需要预生成报告的市场
+
+    Returns:
+        Dict[str, str]: 市场名称到CSV路径的映射，同名市场只保留第一个匹配
+    """
+    markets = {}
+    for pattern in patterns:
+        for path in sorted(Path(data_dir).glob(pattern)):
+            if path.suffix == ".csv":
+                markets.setdefault(path.stem, str(path))
+    return markets
+
+
+class DailyReportPipeline:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline",
+                 store: Optional[ReportStore] = None):
+        """
+        Args:
+            config: 报告配置，即config.yaml中的reports部分，缺省项使用DEFAULT_REPORT_CONFIG
+            data_dir: K线数据目录
+            store: 报告存储，默认使用分析入口共享的存储
+        """
+        self.config = {**DEFAULT_REPORT_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self.store = store or get_report_store()
+
+    async def _generate(self, market_name: str, csv_path: str, version: str,
+                        semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        # 直接使用select_markets选出的文件，不再按名称查找：名称可能是其他市场名的子串（如“多普勒指数”与
+        # “伽玛多普勒指数”），按名称查找可能分析另一个文件，却以本文件的路径和版本保存报告
+        prepared = await run_blocking(prepare_market_analysis, market_name, True, False, csv_path)
+        if prepared["messages"] is None:
+            raise ValueError(prepared["analysis"])
+        async with semaphore:
+            response = await get_llm_client().achat(prepared["messages"])
+        image_path = None
+        if prepared["chart_future"] is not None:
+            try:
+                # 批量渲染时排队较久，这里不设超时
+                image_path = await asyncio.wrap_future(prepared["chart_future"])
+            except Exception as e:
+                logger.error(f"渲染{market_name}K线图失败: {str(e)}")
+        return {
+            "market": market_name,
+            "csv_path": csv_path,
+            "data_version": version,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "analysis": response["choices"][0]["message"]["content"],
+            "image_path": image_path,
+            "indicators": prepared.get("indicators"),
+            "messages": prepared["messages"],
+        }
+
+    async def arun(self, force: bool = False) -> Dict[str, Any]:
+        """为配置的市场预生成报告，只处理数据版本变化的市场
+
+        Args:
+            force: 是否忽略已有报告全部重新生成
+
+        Returns:
+            Dict: 运行摘要，包含total、generated、skipped、failed
+        """
+        markets = select_markets(self.config["markets"], self.data_dir)
+        pending = {}
+        skipped = 0
+        for name, csv_path in markets.items():
+            version = get_data_version(csv_path)
+            if not force and self.store.get(csv_path, version) is not None:
+                skipped += 1
+                continue
+            pending[name] = (csv_path, version)
+        logger.info(f"预生成报告: 共{len(markets)}个市场，需要生成{len(pending)}个，数据未变化跳过{skipped}个")
+
+        semaphore = asyncio.Semaphore(self.config["max_concurrency"])
+
+        async def generate_one(name: str, csv_path: str, version: str) -> Optional[str]:
+            try:
+                report = await self._generate(name, csv_path, version, semaphore)
+                await run_blocking(self.store.put, report)
+                return None
+            except Exception as e:
+                logger.error(f"预生成{name}报告失败: {str(e)}")
+                return name
+
+        results = await asyncio.gather(*(generate_one(name, *args) for name, args in pending.items()))
+        failed = [name for name in results if name is not None]
+        summary = {
+            "total": len(markets),
+            "generated": len(pending) - len(failed),
+            "skipped": skipped,
+            "failed": failed,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        self.store.output_dir.mkdir(parents=True, exist_ok=True)
+        (self.store.output_dir / "_summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2),
+                                                             encoding="utf-8")
+        logger.info(f"预生成报告完成: 生成{summary['generated']}个，跳过{skipped}个，失败{len(failed)}个")
+        return summary
+
+    def run(self, force: bool = False) -> Dict[str, Any]:
+        """arun的同步入口"""
+        try:
+            return asyncio.run(self.arun(force))
+        finally:
+            get_chart_service().shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为常见市场预生成趋势分析报告")
+    parser.add_argument("--force", action="store_true", help="忽略已有报告，全部重新生成")
+    args = parser.parse_args()
+    configure_metrics(get_config_section("metrics"))
+    data_dir = get_config_section("data").get("output_dir", "data/kline")
+    print(json.dumps(DailyReportPipeline(get_config_section("reports"), data_dir).run(args.force),
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+本地意图识别
+
+在调用大模型之前先用本地规则识别用户意图：用Aho-Corasick自动机一次扫描匹配
+所有市场名称及其拼音、首字母、简称别名，再用关键词规则判断分析、对比、筛选、
+异动等意图。只有置信度不足时才回退到大模型识别，多数对话因此省去一次LLM往返。
+
+路由器会统计走本地快速路径的比例；并可按比例抽样把快速路径的结果与大模型的
+识别结果对照（影子校验），用来估计本地识别的准确率。
+"""
+import asyncio
+import functools
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from src.tools.data_tools import get_all_market_names
+from src.utils.async_utils import get_executor
+from src.utils.config import get_config_section
+from src.utils.logger import setup_logger
+
+logger = setup_logger("intent_router")
+
+DEFAULT_INTENT_CONFIG = {
+    "enabled": True,
+    "min_confidence": 0.8,        # 低于该置信度时回退到大模型
+    "shadow_sample_rate": 0.05,   # 快速路径结果抽样交给大模型校验的比例，0表示不校验
+    "refresh_interval": 60.0,     # 两次检查市场目录之间的最小间隔（秒）
+    "report_every": 100,          # 每处理多少条查询输出一次统计日志
+    "aliases": {},                # 额外的别名，格式为 {市场名: [别名, ...]}
+}
+
+# 关键词规则，按优先级从高到低排列
+ANOMALY_KEYWORDS = ("异动", "异常", "暴涨", "暴跌", "急涨", "急跌", "大涨", "大跌", "放量", "突破")
+SCREEN_KEYWORDS = ("筛选", "哪些", "哪个板块", "哪几个", "排名", "排行", "前十", "前五", "最大", "最小",
+                   "最高", "最低", "最强", "最弱", "top", "rsi", "超卖", "超买")
+COMPARE_KEYWORDS = ("对比", "比较", "相比", "哪个好", "哪个更", "区别", "差异", "vs", "和", "与", "跟")
+ANALYSIS_KEYWORDS = ("分析", "走势", "趋势", "行情", "怎么样", "如何", "看法", "展望", "预测", "解读",
+                     "后市", "能买", "能不能买", "值得买", "风险", "涨跌", "k线", "表现", "看看", "看一下")
+GENERAL_KEYWORDS = ("你好", "您好", "谢谢", "你是谁", "是什么", "什么是", "解释", "介绍", "怎么用", "帮助", "hello", "hi")
+
+_ASCII_ALIAS = re.compile(r"^[a-z]+$")
+
+
+class AhoCorasick:
+    """Aho-Corasick多模式匹配自动机，对查询文本只做一次线性扫描"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, object]]] = [[]]
+        self._built = False
+
+    def add(self, pattern: str, value: object):
+        """添加一个模式串，value为匹配成功时返回的值"""
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = nxt
+        self._output[state].append((pattern, value))
+        self._built = False
+
+    def build(self):
+        """按广度优先计算失败指针"""
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0) if self._goto[fail].get(ch, 0) != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+        self._built = True
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str, object]]:
+        """返回所有匹配，每项为 (起始位置, 结束位置, 模式串, 值)"""
+        if not self._built:
+            self.build()
+        matches = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for pattern, value in self._output[state]:
+                matches.append((i - len(pattern) + 1, i + 1, pattern, value))
+        return matches
+
+
+def _select_matches(matches: List[Tuple[int, int, str, object]], text: str) -> List[Tuple[int, int, str, object]]:
+    """从重叠的匹配中按“最左最长”选出互不重叠的匹配，拼音别名要求前后不是英文字母"""
+    selected = []
+    end = 0
+    for match in sorted(matches, key=lambda m: (m[0], -(m[1] - m[0]))):
+        start, stop, pattern, _ = match
+        if start < end:
+            continue
+        if _ASCII_ALIAS.match(pattern):
+            before = text[start - 1] if start > 0 else ""
+            after = text[stop] if stop < len(text) else ""
+            if before.isascii() and before.isalpha() or after.isascii() and after.isalpha():
+                continue
+        selected.append(match)
+        end = stop
+    return selected
+
+
+# 拼音首字母别名的最小长度，更短的缩写不作为本地路由的别名
+MIN_INITIALS_ALIAS_LENGTH = 3
+
+
+@functools.lru_cache(maxsize=None)
+def build_aliases(name: str) -> Tuple[str, ...]:
+    """生成市场名称的别名：原名、去掉“指数”后缀的简称、全拼、拼音首字母
+
+    两个字母的首字母缩写（如手套→st、手枪→sq）容易与英文缩写冲突（饰品中的ST通常指StatTrak），
+    只保留至少MIN_INITIALS_ALIAS_LENGTH个字母的首字母别名。
+    """
+    aliases = [name]
+    if name.endswith("指数") and len(name) > 3:
+        aliases.append(name[:-2])
+    try:
+        from pypinyin import Style, lazy_pinyin
+    except ImportError:
+        return tuple(aliases)
+    for alias in list(aliases):
+        full = "".join(lazy_pinyin(alias)).lower()
+        initials = "".join(lazy_pinyin(alias, style=Style.FIRST_LETTER)).lower()
+        if _ASCII_ALIAS.match(full):
+            aliases.append(full)
+        if _ASCII_ALIAS.match(initials) and len(initials) >= MIN_INITIALS_ALIAS_LENGTH:
+            aliases.append(initials)
+    return tuple(dict.fromkeys(aliases))
+
+
+def _contains_any(text: str, keywords) -> bool:
+    return any(keyword in text for keyword in keywords)
+
+
+class IntentRouter:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline", llm_client=None):
+        """初始化意图路由器
+
+        Args:
+            config: 意图识别配置，即config.yaml中的intent部分，缺省项使用DEFAULT_INTENT_CONFIG
+            data_dir: K线数据目录，用于构建市场名称目录
+            llm_client: 回退使用的大模型客户端，默认使用共享客户端
+        """
+        self.config = {**DEFAULT_INTENT_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self._llm_client = llm_client
+        self._automaton: Optional[AhoCorasick] = None
+        self._names: frozenset = frozenset()
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._shadow_tasks = set()
+        self._stats = {"total": 0, "fast_path": 0, "llm_fallback": 0, "shadow_checked": 0, "shadow_agreed": 0}
+
+    @property
+    def llm_client(self):
+        if self._llm_client is None:
+            from src.utils.llm_client import get_llm_client
+            self._llm_client = get_llm_client()
+        return self._llm_client
+
+    def _get_automaton(self) -> AhoCorasick:
+        """市场目录发生变化时重建自动机"""
+        now = time.monotonic()
+        if self._automaton is not None and now - self._last_check < self.config["refresh_interval"]:
+            return self._automaton
+        with self._lock:
+            self._last_check = now
+            names = frozenset(get_all_market_names(self.data_dir))
+            if self._automaton is None or names != self._names:
+                automaton = AhoCorasick()
+                for name in names:
+                    for alias in build_aliases(name):
+                        automaton.add(alias.lower(), name)
+                for name, extra in (self.config.get("aliases") or {}).items():
+                    for alias in extra:
+                        automaton.add(str(alias).lower(), name)
+                automaton.build()
+                self._automaton, self._names = automaton, names
+                logger.info(f"市场名称自动机已构建: {len(names)}个市场")
+        return self._automaton
+
+    def match_markets(self, text: str) -> List[str]:
+        """按出现顺序返回查询中提到的市场名称（去重）"""
+        normalized = text.lower()
+        selected = _select_matches(self._get_automaton().find_all(normalized), normalized)
+        return list(dict.fromkeys(value for _, _, _, value in selected))
+
+    def classify_local(self, user_query: str) -> Dict:
+        """只用本地规则识别意图
+
+        Returns:
+            Dict: 包含intent（market_analysis或general_question，与LLMClient.classify_intent兼容）、
+                  market_names、task（analysis/comparison/screening/anomaly/general）和confidence
+        """
+        text = user_query.strip().lower()
+        markets = self.match_markets(text)
+        residual = text
+        for alias in sorted({a for m in markets for a in build_aliases(m)}, key=len, reverse=True):
+            residual = residual.replace(alias.lower(), "")
+        residual = re.sub(r"[\s,，。.!！?？、和与跟的]+", "", residual)
+
+        def result(intent: str, task: str, confidence: float, names: Optional[List[str]] = None) -> Dict:
+            return {"intent": intent, "market_names": names or [], "task": task, "confidence": confidence}
+
+        if _contains_any(text, ANOMALY_KEYWORDS) and not _contains_any(text, ANALYSIS_KEYWORDS[:2]):
+            return result("general_question", "anomaly", 0.9 if not markets else 0.6)
+        if _contains_any(text, SCREEN_KEYWORDS):
+            return result("general_question", "screening", 0.9 if len(markets) != 1 else 0.6)
+        if len(markets) >= 2:
+            confidence = 0.95 if _contains_any(text, COMPARE_KEYWORDS + ANALYSIS_KEYWORDS) else 0.7
+            return result("market_analysis", "comparison", confidence, markets)
+        if len(markets) == 1:
+            if _contains_any(text, ANALYSIS_KEYWORDS):
+                return result("market_analysis", "analysis", 0.95, markets)
+            # 只输入了市场名称（或加上语气词）时按分析处理
+            return result("market_analysis", "analysis", 0.85 if len(residual) <= 2 else 0.5, markets)
+        if _contains_any(text, GENERAL_KEYWORDS):
+            return result("general_question", "general", 0.9)
+        return result("general_question", "general", 0.5)
+
+    def _record(self, fast: bool):
+        with self._lock:
+            self._stats["total"] += 1
+            self._stats["fast_path" if fast else "llm_fallback"] += 1
+            total = self._stats["total"]
+        if self.config["report_every"] and total % self.config["report_every"] == 0:
+            logger.info(f"意图识别统计: {self.format_stats()}")
+
+    def _should_shadow(self) -> bool:
+        rate = self.config["shadow_sample_rate"]
+        return rate > 0 and random.random() < rate
+
+    def _record_shadow(self, local: Dict, llm_result: Dict):
+        agreed = local["intent"] == llm_result.get("intent") and \
+            set(local["market_names"]) == set(self._normalize_names(llm_result.get("market_names") or []))
+        with self._lock:
+            self._stats["shadow_checked"] += 1
+            self._stats["shadow_agreed"] += int(agreed)
+        if not agreed:
+            logger.info(f"本地意图识别与大模型不一致: 本地={local}, 大模型={llm_result}")
+
+    def _normalize_names(self, names: List[str]) -> List[str]:
+        """把大模型返回的市场名称映射到目录中的名称，便于比较"""
+        normalized = []
+        for name in names:
+            matched = self.match_markets(str(name))
+            normalized.extend(matched or [name])
+        return normalized
+
+    def _shadow_check(self, user_query: str, local: Dict):
+        try:
+            self._record_shadow(local, self.llm_client.classify_intent(user_query))
+        except Exception as e:
+            logger.warning(f"影子校验失败: {str(e)}")
+
+    def route(self, user_query: str) -> Dict:
+        """识别意图：本地规则置信度足够时直接返回，否则回退到大模型
+
+        Returns:
+            Dict: 在classify_local结果的基础上增加source（local或llm）
+        """
+        local = self.classify_local(user_query)
+        if self.config["enabled"] and local["confidence"] >= self.config["min_confidence"]:
+            self._record(fast=True)
+            if self._should_shadow():
+                get_executor().submit(self._shadow_check, user_query, local)
+            return {**local, "source": "local"}
+        self._record(fast=False)
+        return self._merge_llm_result(local, self.llm_client.classify_intent(user_query))
+
+    async def aroute(self, user_query: str) -> Dict:
+        """route的异步版本，影子校验在后台任务中进行，不影响响应时间"""
+        local = self.classify_local(user_query)
+        if self.config["enabled"] and local["confidence"] >= self.config["min_confidence"]:
+            self._record(fast=True)
+            if self._should_shadow():
+                task = asyncio.create_task(self._ashadow_check(user_query, local))
+                # 保留后台任务的引用，避免任务未完成就被回收
+                self._shadow_tasks.add(task)
+                task.add_done_callback(self._shadow_tasks.discard)
+            return {**local, "source": "local"}
+        self._record(fast=False)
+        return self._merge_llm_result(local, await self.llm_client.aclassify_intent(user_query))
+
+    async def _ashadow_check(self, user_query: str, local: Dict):
+        try:
+            self._record_shadow(local, await self.llm_client.aclassify_intent(user_query))
+        except Exception as e:
+            logger.warning(f"影子校验失败: {str(e)}")
+
+    def _merge_llm_result(self, local: Dict, llm_result: Dict) -> Dict:
+        names = self._normalize_names(llm_result.get("market_names") or [])
+        intent = llm_result.get("intent", "general_question")
+        task = local["task"] if intent == "general_question" else ("comparison" if len(names) > 1 else "analysis")
+        return {"intent": intent, "market_names": list(dict.fromkeys(names)), "task": task,
+                "confidence": local["confidence"], "source": "llm"}
+
+    def stats(self) -> Dict:
+        """返回快速路径比例和影子校验准确率"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["fast_path_rate"] = stats["fast_path"] / stats["total"] if stats["total"] else 0.0
+        stats["shadow_accuracy"] = stats["shadow_agreed"] / stats["shadow_checked"] if stats["shadow_checked"] else None
+        return stats
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        accuracy = "暂无" if stats["shadow_accuracy"] is None else f"{stats['shadow_accuracy']:.1%}"
+        return (f"共{stats['total']}条，本地快速路径{stats['fast_path']}条（{stats['fast_path_rate']:.1%}），"
+                f"回退大模型{stats['llm_fallback']}条，影子校验{stats['shadow_checked']}条，准确率{accuracy}")
+
+
+@functools.lru_cache(maxsize=1)
+def get_intent_router() -> IntentRouter:
+    """返回按config.yaml中intent配置创建的共享路由器"""
+    return IntentRouter(get_config_section("intent"))
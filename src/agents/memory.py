@@ -0,0 +1,206 @@
+"""
+会话记忆
+
+按token预算管理多轮对话上下文：最近几轮对话原样保留，更早的对话增量折叠进一段滚动摘要，
+讨论过的市场等关键信息单独置顶。无论对话进行多少轮，带入Prompt的上下文都不超过预算，
+每轮的延迟和成本保持平稳。摘要由大模型在后台增量更新，更新完成前被移出的对话以压缩文本代替，
+不阻塞当前回复。
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.logger import setup_logger
+from src.utils.tokenizer import count_tokens
+
+logger = setup_logger("memory")
+
+DEFAULT_MEMORY_CONFIG = {
+    "token_budget": 1500,          # 记忆部分（置顶信息+摘要+最近对话）的总token预算
+    "recent_turns": 3,             # 最多原样保留的最近轮数
+    "summary_budget": 300,         # 滚动摘要的token上限
+    "max_pinned_markets": 5,       # 置顶的最近讨论市场数
+    "turn_char_limit": 600,        # 单条消息保存时的最大字符数，过长的分析只保留开头
+    "summarize_with_llm": True,    # 是否用大模型更新摘要，否则使用本地抽取式摘要
+}
+
+SUMMARY_PROMPT = """请把“已有摘要”和“新增对话”合并为一段新的对话摘要，保留用户关心的市场、问题、结论和关键数值，
+删除寒暄和重复内容，使用中文，不超过{limit}字，只输出摘要本身。
+
+已有摘要：
+{summary}
+
+新增对话：
+{turns}"""
+
+# 每次折叠进摘要的最多轮数，避免积压时单次摘要请求过长
+FOLD_BATCH = 4
+
+Turn = Tuple[str, str]
+
+
+def _truncate(text: str, limit: int) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def _brief(turn: Turn, limit: int = 80) -> str:
+    """本地抽取式压缩：用户问题加回答的第一句"""
+    user, assistant = turn
+    first = assistant.strip().split("\n", 1)[0].split("。", 1)[0]
+    return f"用户问：{_truncate(user, limit)}；答：{_truncate(first, limit)}"
+
+
+class ConversationMemory:
+    def __init__(self, config: Optional[Dict] = None, llm_client=None):
+        """初始化会话记忆
+
+        Args:
+            config: 记忆配置，即config.yaml中的memory部分，缺省项使用DEFAULT_MEMORY_CONFIG
+            llm_client: 更新摘要使用的大模型客户端，默认使用共享客户端
+        """
+        self.config = {**DEFAULT_MEMORY_CONFIG, **(config or {})}
+        self._llm_client = llm_client
+        self.turns: List[Turn] = []
+        self.summary = ""
+        self.pinned_markets: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: List[Turn] = []       # 已移出最近对话、尚未折叠进摘要的轮次
+        self._fold_task: Optional[asyncio.Task] = None
+        self.turn_count = 0
+
+    @property
+    def llm_client(self):
+        if self._llm_client is None:
+            from src.utils.llm_client import get_llm_client
+            self._llm_client = get_llm_client()
+        return self._llm_client
+
+    def pin_markets(self, market_names: List[str]):
+        """置顶本轮讨论的市场，超出数量时移除最早讨论的"""
+        for name in market_names or []:
+            self.pinned_markets.pop(name, None)
+            self.pinned_markets[name] = None
+        while len(self.pinned_markets) > self.config["max_pinned_markets"]:
+            self.pinned_markets.popitem(last=False)
+
+    @property
+    def last_market(self) -> Optional[str]:
+        """最近讨论的市场，用于解析“它”“这个板块”等指代"""
+        return next(reversed(self.pinned_markets), None)
+
+    def _evict(self):
+        """把超出轮数或预算的最早对话移入待折叠列表，至少保留最近一轮"""
+        limit = self.config["token_budget"] - self.config["summary_budget"] - count_tokens(self._pinned_text())
+        while len(self.turns) > 1 and (len(self.turns) > self.config["recent_turns"]
+                                       or self._turns_tokens(self.turns) > limit):
+            self._pending.append(self.turns.pop(0))
+
+    @staticmethod
+    def _turns_tokens(turns: List[Turn]) -> int:
+        return sum(count_tokens(user) + count_tokens(assistant) for user, assistant in turns)
+
+    def _record(self, user_input: str, reply: str, market_names: Optional[List[str]]):
+        limit = self.config["turn_char_limit"]
+        self.turns.append((_truncate(user_input, limit), _truncate(reply, limit)))
+        self.turn_count += 1
+        self.pin_markets(market_names or [])
+        self._evict()
+
+    def _fold_prompt(self, pending: List[Turn]) -> List[Dict[str, str]]:
+        turns = "\n".join(f"用户：{user}\n助手：{assistant}" for user, assistant in pending)
+        # 摘要预算按token计，中文约1.4字/token
+        limit = int(self.config["summary_budget"] * 1.4)
+        return [{"role": "user", "content": SUMMARY_PROMPT.format(limit=limit, summary=self.summary or "（无）",
+                                                                  turns=turns)}]
+
+    def _local_fold(self, pending: List[Turn]) -> str:
+        parts = [self.summary] if self.summary else []
+        parts.extend(_brief(turn) for turn in pending)
+        return "\n".join(parts)
+
+    def _apply_summary(self, summary: str, folded: int):
+        """写入新摘要并移除已折叠的轮次；摘要仍超出预算时丢弃最早的行"""
+        lines = [line for line in summary.strip().splitlines() if line.strip()]
+        while len(lines) > 1 and count_tokens("\n".join(lines)) > self.config["summary_budget"]:
+            lines.pop(0)
+        summary = "\n".join(lines)
+        if count_tokens(summary) > self.config["summary_budget"]:
+            summary = _truncate(summary, int(self.config["summary_budget"] * 1.4))
+        self.summary = summary
+        del self._pending[:folded]
+
+    def add_turn(self, user_input: str, reply: str, market_names: Optional[List[str]] = None):
+        """记录一轮对话，需要时同步折叠摘要"""
+        self._record(user_input, reply, market_names)
+        while self._pending:
+            pending = self._pending[:FOLD_BATCH]
+            summary = None
+            if self.config["summarize_with_llm"]:
+                try:
+                    response = self.llm_client.chat(self._fold_prompt(pending), max_tokens=self.config["summary_budget"],
+                                                    temperature=0.2)
+                    summary = response["choices"][0]["message"]["content"]
+                except Exception as e:
+                    logger.warning(f"更新对话摘要失败，使用本地摘要: {str(e)}")
+            self._apply_summary(summary or self._local_fold(pending), len(pending))
+
+    async def aadd_turn(self, user_input: str, reply: str, market_names: Optional[List[str]] = None):
+        """记录一轮对话；摘要在后台任务中更新，不阻塞当前回复"""
+        self._record(user_input, reply, market_names)
+        if self._pending and (self._fold_task is None or self._fold_task.done()):
+            self._fold_task = asyncio.create_task(self._afold())
+
+    async def _afold(self):
+        while self._pending:
+            pending = self._pending[:FOLD_BATCH]
+            summary = None
+            if self.config["summarize_with_llm"]:
+                try:
+                    response = await self.llm_client.achat(self._fold_prompt(pending),
+                                                           max_tokens=self.config["summary_budget"], temperature=0.2)
+                    summary = response["choices"][0]["message"]["content"]
+                except Exception as e:
+                    logger.warning(f"更新对话摘要失败，使用本地摘要: {str(e)}")
+            self._apply_summary(summary or self._local_fold(pending), len(pending))
+
+    def _pinned_text(self) -> str:
+        if not self.pinned_markets:
+            return ""
+        return "正在讨论的市场：" + "、".join(reversed(self.pinned_markets))
+
+    def context_text(self) -> str:
+        """置顶信息和摘要（包括尚未折叠的轮次的压缩文本）"""
+        parts = []
+        pinned = self._pinned_text()
+        if pinned:
+            parts.append(pinned)
+        summary_lines = [self.summary] if self.summary else []
+        summary_lines.extend(_brief(turn) for turn in self._pending)
+        # 摘要尚未更新时待折叠的轮次可能积压，超出摘要预算时先去掉最早的待折叠轮次
+        while len(summary_lines) > 1 and count_tokens("\n".join(summary_lines)) > self.config["summary_budget"]:
+            summary_lines.pop(1 if self.summary and len(summary_lines) > 2 else 0)
+        if summary_lines:
+            parts.append("之前的对话摘要：\n" + "\n".join(summary_lines))
+        return "\n".join(parts)
+
+    def build_messages(self, system_prompt: str, user_input: str) -> List[Dict[str, str]]:
+        """构建带记忆的对话消息：系统提示+置顶信息+摘要，最近几轮原样保留，最后是本轮输入"""
+        context = self.context_text()
+        messages = [{"role": "system", "content": system_prompt + ("\n\n" + context if context else "")}]
+        for user, assistant in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": user_input})
+        return messages
+
+    def contextualize(self, user_input: str) -> str:
+        """把记忆压缩成一段文字放在本轮输入前，供只接受单个输入字符串的Agent使用"""
+        context = self.context_text()
+        recent = "\n".join(f"用户：{u}\n助手：{_truncate(a, 200)}" for u, a in self.turns)
+        if recent:
+            context = (context + "\n" if context else "") + "最近的对话：\n" + recent
+        return f"{context}\n\n当前问题：{user_input}" if context else user_input
+
+    def token_count(self) -> int:
+        """当前带入Prompt的记忆token数"""
+        return count_tokens(self.context_text()) + self._turns_tokens(self.turns)
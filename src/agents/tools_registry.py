@@ -0,0 +1,112 @@
+import json
+from langchain.tools import Tool
+from src.agents.trend_agent import aanalyze_market_trend, analyze_market_trend
+from src.tools.compare_analyzer import acompare_market_trends, compare_market_trends
+from src.utils.async_utils import run_blocking
+from src.tools.anomaly_scanner import get_configured_anomaly_report
+from src.tools.chart_data import get_chart_data
+from src.tools.screener import METRIC_FIELDS, MarketScreener, screen_markets_tool
+
+# 指标表常驻内存，全市场筛选无需逐个读取文件
+screener = MarketScreener()
+
+
+def _format_analysis(result: dict) -> str:
+    if result.get("image_path"):
+        return f"{result['analysis']}\n\nK线图：{result['image_path']}"
+    return result["analysis"]
+
+
+def _split_market_names(market_names: str) -> list:
+    return [name.strip() for name in market_names.replace("，", ",").split(",") if name.strip()]
+
+
+def _analyze_market_tool(market_name: str) -> str:
+    return _format_analysis(analyze_market_trend(market_name.strip()))
+
+
+async def _aanalyze_market_tool(market_name: str) -> str:
+    return _format_analysis(await aanalyze_market_trend(market_name.strip()))
+
+
+def _compare_markets_tool(market_names: str) -> str:
+    return compare_market_trends(_split_market_names(market_names))["analysis"]
+
+
+async def _acompare_markets_tool(market_names: str) -> str:
+    return (await acompare_market_trends(_split_market_names(market_names)))["analysis"]
+
+
+def _anomaly_report_tool(query: str = "") -> str:
+    return get_configured_anomaly_report()
+
+
+async def _aanomaly_report_tool(query: str = "") -> str:
+    return await run_blocking(get_configured_anomaly_report)
+
+
+def _screen_markets_tool(query: str) -> str:
+    return screen_markets_tool(query, screener)
+
+
+async def _ascreen_markets_tool(query: str) -> str:
+    return await run_blocking(screen_markets_tool, query, screener)
+
+
+def _chart_data_tool(query: str) -> str:
+    """输入为JSON字符串：{"market": 市场名, "start": 开始日期, "end": 结束日期, "target_points": 点数}"""
+    try:
+        params = json.loads(query) if query.strip().startswith("{") else {"market": query.strip()}
+        payload = get_chart_data(params["market"], start=params.get("start"), end=params.get("end"),
+                                 target_points=params.get("target_points", 200))
+        if payload is None:
+            return f"未找到{params['market']}的数据文件。"
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    except Exception as e:
+        return f"获取图表数据失败: {str(e)}"
+
+
+async def _achart_data_tool(query: str) -> str:
+    return await run_blocking(_chart_data_tool, query)
+
+
+def get_tools():
+    """返回智能体可用的工具列表"""
+    return [
+        Tool(
+            name="market_trend_analysis",
+            func=_analyze_market_tool,
+            coroutine=_aanalyze_market_tool,
+            description="分析单个市场/板块的近期趋势并生成K线图。输入为市场名称，例如：大盘、百战指数、手枪。",
+        ),
+        Tool(
+            name="market_comparison",
+            func=_compare_markets_tool,
+            coroutine=_acompare_markets_tool,
+            description="对比分析多个市场/板块的走势。输入为用逗号分隔的市场名称，例如：手枪,步枪。",
+        ),
+        Tool(
+            name="market_anomaly_report",
+            func=_anomaly_report_tool,
+            coroutine=_aanomaly_report_tool,
+            description="查询最新交易日出现异动（价格大涨大跌、成交量异常、波动率突变、突破）的市场，"
+                        "用于回答“今天有什么异常”“哪些板块异动”等问题。输入可以为空。",
+        ),
+        Tool(
+            name="kline_chart_data",
+            func=_chart_data_tool,
+            coroutine=_achart_data_tool,
+            description="获取某个市场指定日期范围的OHLCV列式数据（长区间自动降采样，日期为距1970-01-01的天数）。"
+                        '输入为市场名称，或JSON字符串，如：{"market": "大盘", "start": "2025-01-01", "end": "2025-06-01", "target_points": 200}。',
+        ),
+        Tool(
+            name="market_screener",
+            func=_screen_markets_tool,
+            coroutine=_ascreen_markets_tool,
+            description="按条件筛选并排序全部市场/板块（包括HOT指数），用于回答“哪些板块最近一周涨幅最大且RSI低于30”等问题。"
+                        "输入为JSON字符串，格式如："
+                        '{"filters": [{"field": "rsi_14", "op": "<", "value": 30}], "sort_by": "return_5d", "ascending": false, "limit": 10}。'
+                        "运算符可用 >, >=, <, <=, ==, !=, between, in, contains；category字段为所属分类（HOT或一级板块名，大盘为空），可用于限定范围。"
+                        "可用指标字段：" + "；".join(f"{k}={v}" for k, v in METRIC_FIELDS.items()),
+        ),
+    ]
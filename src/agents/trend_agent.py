@@ -1,44 +1,215 @@
-from langchain.tools import Tool
-from src.tools.data_tools import get_all_market_names, read_market_data, find_csv_file
+from src.tools.data_tools import read_csv_data, find_csv_file
 from src.tools.analysis_tools import get_market_trend_prompt
-from src.tools.visualiza import plot_kline
-from src.utils.llm_client import LLMClient
-import yaml
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-api_key = os.getenv("API_KEY")
-
-with open("config/config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
-llm_cfg = config["llm_api"]
-llm = LLMClient(
-    api_url=llm_cfg["api_url"],
-    api_key=api_key,
-    model=llm_cfg["model"]
-)
-
-def analyze_market_trend(market_name):
-    csv_path = find_csv_file(market_name)
+from src.tools.chart_service import ChartService
+from src.tools.data_tools import get_data_version, market_data_key
+from src.tools.report_store import ReportStore
+from src.tools.risk_tools import RiskSimulator, format_risk_summary
+from src.utils import metrics
+from src.utils.config import get_config_section
+from src.utils.llm_client import get_llm_client
+from src.utils.async_utils import run_blocking
+from src.utils.singleflight import AsyncSingleFlight, SingleFlight
+from src.utils.logger import setup_logger
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import functools
+
+logger = setup_logger("trend_agent")
+
+# 大模型客户端、风险模拟器和渲染服务都在第一次使用时创建，导入本模块不做任何初始化
+
+@functools.lru_cache(maxsize=1)
+def get_risk_simulator() -> RiskSimulator:
+    return RiskSimulator(get_config_section("risk"))
+
+@functools.lru_cache(maxsize=1)
+def get_chart_service() -> ChartService:
+    return ChartService(get_config_section("chart"))
+
+@functools.lru_cache(maxsize=1)
+def get_report_store() -> ReportStore:
+    return ReportStore(get_config_section("reports"))
+
+# 单市场分析读取的历史天数，是合并键的一部分
+ANALYSIS_DAYS = 730
+
+@functools.lru_cache(maxsize=1)
+def get_analysis_flights() -> Tuple[SingleFlight, AsyncSingleFlight]:
+    """同一市场、同一数据版本的并发分析请求共享一次计算（线程版和协程版）"""
+    config = get_config_section("singleflight")
+    return SingleFlight("trend_analysis", config), AsyncSingleFlight("trend_analysis", config)
+
+def render_market_chart(market_name: str, csv_path: str) -> Optional[str]:
+    """生成市场K线图，返回图片路径（数据未变化时直接返回缓存的图片）"""
+    return get_chart_service().get_chart(market_name, csv_path)
+
+def wait_chart(chart_future, market_name: str, timeout: Optional[float] = None) -> Optional[str]:
+    """等待K线图渲染结果，超时或失败时返回None，不影响分析文本的返回"""
+    if chart_future is None:
+        return None
+    try:
+        return chart_future.result(timeout=timeout)
+    except Exception as e:
+        logger.error(f"获取{market_name}K线图失败: {str(e)}")
+        return None
+
+def _submit_chart(market_name: str, csv_path: str):
+    try:
+        return get_chart_service().submit(market_name, csv_path)
+    except Exception as e:
+        logger.error(f"提交{market_name}K线图渲染失败: {str(e)}")
+        return None
+
+def prepare_market_analysis(market_name: str, render_chart: bool = True, use_report: bool = True,
+                            csv_path: Optional[str] = None) -> Dict[str, Any]:
+    """准备单个市场分析所需的数据和Prompt，并在后台提交K线图渲染
+
+    数据抓取后预生成的报告与当前数据版本一致时，直接返回报告（report字段），不再读数据和模拟风险。
+    同一数据文件、同一版本的并发准备请求合并为一次读数据和风险模拟。
+
+    Args:
+        market_name: 市场名称
+        render_chart: 是否提交K线图渲染
+        use_report: 是否使用预生成的报告，预生成流水线本身传入False
+        csv_path: 已解析出的数据文件路径，传入时不再按名称查找
+
+    Returns:
+        Dict: 包含csv_path、chart_future（渲染任务的Future）、messages、indicators，命中预生成报告时还包含report；
+            出错时messages为None，analysis为错误信息
+    """
+    csv_path = csv_path or find_csv_file(market_name)
     if not csv_path:
-        return {"analysis": f"未找到{market_name}的数据文件。", "image_path": None}
+        return {"analysis": f"未找到{market_name}的数据文件。", "image_path": None, "messages": None}
+    version = get_data_version(csv_path)
+    if use_report:
+        report = get_report_store().get(csv_path, version)
+        if report is not None:
+            logger.info(f"使用预生成的{market_name}分析报告（数据版本{version}）")
+            return {
+                "analysis": None,
+                "csv_path": csv_path,
+                "chart_future": _submit_chart(market_name, csv_path) if render_chart else None,
+                "image_path": None,
+                "messages": report.get("messages") or [],
+                "indicators": report.get("indicators"),
+                "report": report,
+            }
+    key = ("prepare", csv_path, version, ANALYSIS_DAYS, render_chart)
+    return dict(get_analysis_flights()[0].do(key, _prepare_csv_analysis, market_name, csv_path, render_chart))
+
+def _latest_indicators(df) -> Dict[str, Any]:
+    """最新交易日的价格和指标快照，随预生成报告保存"""
+    latest = df.iloc[-1]
+    snapshot = {"date": str(latest["date"])[:10]}
+    for column in ("close", "volume", "MA5", "MA10", "MA20", "RSI"):
+        if column in df.columns and latest[column] == latest[column]:
+            snapshot[column] = round(float(latest[column]), 4)
+    return snapshot
 
-    df = read_market_data(market_name, num_days=730)
+@metrics.timed("analysis.prepare", profile=True)
+def _prepare_csv_analysis(market_name: str, csv_path: str, render_chart: bool) -> Dict[str, Any]:
+    # 渲染在进程池中与数据准备、LLM请求并行进行
+    chart_future = _submit_chart(market_name, csv_path) if render_chart else None
+
+    df = read_csv_data(csv_path, num_days=ANALYSIS_DAYS)
     if df is None:
-        return {"analysis": f"读取{market_name}的数据文件失败。", "image_path": None}
+        return {"analysis": f"读取{market_name}的数据文件失败。", "image_path": None, "messages": None}
 
-    plot_dir = "./plot/kline"
-    os.makedirs(plot_dir, exist_ok=True)
-    image_filename = f"{market_name}_kline.png"
-    image_path = os.path.join(plot_dir, image_filename)
     try:
-        plot_kline(csv_path, save_path=image_path, title=f"{market_name} K线图")
+        with metrics.span("analysis.risk"):
+            risk = get_risk_simulator().simulate_frame(df, market_name, data_version=get_data_version(csv_path))
+        risk_summary = format_risk_summary(risk)
     except Exception as e:
-        return {"analysis": f"生成K线图时发生错误: {str(e)}", "image_path": None}
+        logger.warning(f"{market_name}风险模拟失败，分析将不包含风险摘要: {str(e)}")
+        risk_summary = None
+
+    prompt = get_market_trend_prompt(df, market_name, risk_summary=risk_summary)
+    return {
+        "analysis": None,
+        "csv_path": csv_path,
+        "chart_future": chart_future,
+        "image_path": None,
+        "messages": [{"role": "user", "content": prompt}],
+        "indicators": _latest_indicators(df),
+    }
+
+def _analysis_target(market_name: str) -> Tuple[Optional[str], Optional[tuple]]:
+    """解析市场名，返回 (数据文件路径, 合并键)；解析结果一路传给数据准备，名称只查找一次"""
+    csv_path = find_csv_file(market_name)
+    if not csv_path:
+        return None, None
+    return csv_path, ("trend", market_data_key([csv_path]), ANALYSIS_DAYS)
+
+def analyze_market_trend(market_name, timeout: Optional[float] = None):
+    """分析单个市场的趋势，同一市场、同一数据版本的并发请求共享一次分析
 
-    prompt = get_market_trend_prompt(df, market_name)
-    result = llm.chat([{"role": "user", "content": prompt}])
-    analysis_text = result["choices"][0]["message"]["content"]
+    Args:
+        market_name: 市场名称
+        timeout: 等待其他请求正在进行的同一分析的最长时间（秒），默认使用singleflight配置
+    """
+    csv_path, key = _analysis_target(market_name)
+    if key is None:
+        return _analyze_market_trend(market_name, csv_path)
+    return dict(get_analysis_flights()[0].do(key, _analyze_market_trend, market_name, csv_path, timeout=timeout))
+
+def _analyze_market_trend(market_name, csv_path: Optional[str] = None):
+    prepared = prepare_market_analysis(market_name, csv_path=csv_path)
+    if prepared["messages"] is None:
+        return {"analysis": prepared["analysis"], "image_path": prepared["image_path"]}
+
+    if prepared.get("report"):
+        analysis_text = prepared["report"]["analysis"]
+    else:
+        result = get_llm_client().chat(prepared["messages"])
+        analysis_text = result["choices"][0]["message"]["content"]
+    image_path = wait_chart(prepared["chart_future"], market_name, timeout=get_chart_service().config["wait_timeout"])
     
-    return {"analysis": analysis_text, "image_path": image_path} 
\ No newline at end of file
+    return {"analysis": analysis_text, "image_path": image_path}
+
+async def aanalyze_market_trend(market_name: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """analyze_market_trend的异步版本：数据准备和绘图在线程池中执行，与LLM请求并发进行
+
+    调用方超时或被取消只影响自己，所有等待者都离开后才取消共享的分析。
+    """
+    csv_path, key = await run_blocking(_analysis_target, market_name)
+    if key is None:
+        return await _aanalyze_market_trend(market_name, csv_path)
+    return dict(await get_analysis_flights()[1].do(key, _aanalyze_market_trend, market_name, csv_path,
+                                                   timeout=timeout))
+
+async def _aanalyze_market_trend(market_name: str, csv_path: Optional[str] = None) -> Dict[str, Any]:
+    prepared = await run_blocking(prepare_market_analysis, market_name, csv_path=csv_path)
+    if prepared["messages"] is None:
+        return {"analysis": prepared["analysis"], "image_path": prepared["image_path"]}
+
+    if prepared.get("report"):
+        analysis_text = prepared["report"]["analysis"]
+    else:
+        result = await get_llm_client().achat(prepared["messages"])
+        analysis_text = result["choices"][0]["message"]["content"]
+    image_path = None
+    if prepared["chart_future"] is not None:
+        try:
+            image_path = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(prepared["chart_future"])),
+                                                timeout=get_chart_service().config["wait_timeout"])
+        except Exception as e:
+            logger.error(f"获取{market_name}K线图失败: {str(e)}")
+    return {"analysis": analysis_text, "image_path": image_path}
+
+async def astream_market_trend(market_name: str, prepared: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """流式分析单个市场，逐段产出分析文本
+
+    Args:
+        market_name: 市场名称
+        prepared: prepare_market_analysis的结果，调用方已准备好数据（如需先取得图片路径）时传入
+    """
+    if prepared is None:
+        prepared = await run_blocking(prepare_market_analysis, market_name, render_chart=False)
+    if prepared["messages"] is None:
+        yield prepared["analysis"]
+        return
+    if prepared.get("report"):
+        yield prepared["report"]["analysis"]
+        return
+    async for token in get_llm_client().astream_text(prepared["messages"]):
+        yield token
@@ -1,12 +1,16 @@
+import logging
 import requests
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Optional
-from src.utils.logger import setup_logger
+from src.utils import metrics
+from src.utils.logger import LogSampler, setup_logger
 import time
 
 # 创建logger实例
 logger = setup_logger("data_fetcher")
+# 每个板块、每次抓取的明细日志抽样输出，避免大规模抓取时日志量随板块数增长
+sampler = LogSampler()
 
 class DataFetcher:
     def __init__(self, config: Dict):
@@ -39,32 +43,37 @@ class DataFetcher:
             current_max_time_seconds = int(time.time())
         else:
             current_max_time_seconds = int(max_time_raw)
-        while True:
-            params['timestamp'] = int(time.time() * 1000)
-            params['maxTime'] = current_max_time_seconds
-            try:
-                if api_url.endswith('/kline') and 'statistics' in api_url:
-                    response = requests.get(api_url, headers=self.headers, params=params)
-                else:
-                    response = requests.post(api_url, headers=self.headers, json=params)
-                response.raise_for_status()
-                data = response.json()
-                if data.get('success') and data.get('data'):
-                    kline_batch = data.get('data', [])
-                    if not kline_batch:
-                        break
-                    all_kline_data.extend(kline_batch)
-                    oldest_timestamp = int(kline_batch[0][0])
-                    if oldest_timestamp >= current_max_time_seconds and len(kline_batch) > 0:
+        with metrics.span("fetcher.fetch_kline") as span:
+            while True:
+                params['timestamp'] = int(time.time() * 1000)
+                params['maxTime'] = current_max_time_seconds
+                try:
+                    if api_url.endswith('/kline') and 'statistics' in api_url:
+                        response = requests.get(api_url, headers=self.headers, params=params)
+                    else:
+                        response = requests.post(api_url, headers=self.headers, json=params)
+                    response.raise_for_status()
+                    span.add("requests")
+                    span.add("bytes", len(response.content))
+                    data = response.json()
+                    if data.get('success') and data.get('data'):
+                        kline_batch = data.get('data', [])
+                        if not kline_batch:
+                            break
+                        all_kline_data.extend(kline_batch)
+                        oldest_timestamp = int(kline_batch[0][0])
+                        if oldest_timestamp >= current_max_time_seconds and len(kline_batch) > 0:
+                            break
+                        current_max_time_seconds = oldest_timestamp - 1
+                        time.sleep(0.5)
+                    else:
                         break
-                    current_max_time_seconds = oldest_timestamp - 1
-                    time.sleep(0.5)
-                else:
+                except Exception as e:
+                    span.add("request_errors")
+                    logger.error(f"获取K线数据时发生错误: {str(e)}")
                     break
-            except Exception as e:
-                logger.error(f"获取K线数据时发生错误: {str(e)}")
-                break
-        logger.info(f"成功获取{len(all_kline_data)}条K线数据: {api_url}")
+            span.add("rows", len(all_kline_data))
+        sampler.log(logger, logging.INFO, "kline", "成功获取%d条K线数据: %s", len(all_kline_data), api_url)
         return all_kline_data
 
     def fetch_sections(self, type: str = "BROAD", level: int = 0, 
@@ -83,7 +92,7 @@ class DataFetcher:
             List[Dict]: 板块列表
         """
         try:
-            logger.info(f"开始获取板块列表: type={type}, level={level}")
+            logger.debug("开始获取板块列表: type=%s, level=%s", type, level)
             api_url = f"{self.base_url}/user/item/block/v1/next-level"
             payload = {
                 "type": type,
@@ -94,17 +103,22 @@ class DataFetcher:
                 "timestamp": str(int(time.time() * 1000))
             }
             
-            response = requests.post(api_url, headers=self.headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
+            with metrics.span("fetcher.fetch_sections") as span:
+                response = requests.post(api_url, headers=self.headers, json=payload)
+                response.raise_for_status()
+                span.add("bytes", len(response.content))
+                data = response.json()
             
             if data.get('success') and data.get('data'):
                 sections = data.get('data', [])
-                logger.info(f"成功获取{len(sections)}个板块")
-                # 使用logger输出板块信息
-                logger.info("获取到的板块列表：")
-                for i, section in enumerate(sections, 1):
-                    logger.info(f"{i}. {section.get('nameZh', '未知板块')} (ID: {section.get('typeVal', '未知ID')})")
+                metrics.inc("sections_total", len(sections))
+                sampler.log(logger, logging.INFO, "sections", "成功获取%d个板块: type=%s, level=%s, typeVal=%s",
+                            len(sections), type, level, typeVal)
+                # 板块明细只在DEBUG级别抽样输出
+                if logger.isEnabledFor(logging.DEBUG):
+                    for i, section in enumerate(sections, 1):
+                        sampler.log(logger, logging.DEBUG, "section_item", "%d. %s (ID: %s)", i,
+                                    section.get('nameZh', '未知板块'), section.get('typeVal', '未知ID'))
                 return sections
             else:
                 logger.error(f"获取板块列表失败: {data.get('msg')}")
@@ -114,6 +128,7 @@ class DataFetcher:
             logger.error(f"获取板块列表时发生错误: {str(e)}")
             return []
 
+    @metrics.timed("fetcher.save_to_csv")
     def save_to_csv(self, data: list, filename: str) -> bool:
         try:
             if not data:
@@ -126,7 +141,7 @@ class DataFetcher:
             df = df.sort_values("date")  # 按日期升序排序
             filepath = self.output_dir / filename
             df.to_csv(filepath, index=False)
-            logger.info(f"成功保存数据到: {filepath}")
+            sampler.log(logger, logging.INFO, "save", "成功保存数据到: %s", filepath)
             return True
             
         except Exception as e:
@@ -0,0 +1,133 @@
+"""
+行情查询服务客户端
+
+封装src/data/market_service.py提供的HTTP接口：复用连接，按URL缓存响应并带If-None-Match重新验证，
+数据未变化时服务端返回304，客户端直接使用缓存的结果，不再传输和解码数据。
+
+用法：
+    client = MarketDataClient("http://127.0.0.1:8765")
+    df = client.series("百战指数", last=180, indicators=["ma20", "rsi14"])
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from src.data.market_service import BINARY_CONTENT_TYPE, decode_columns
+
+
+class MarketDataError(Exception):
+    """查询服务返回错误（如市场不存在、参数无效）"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class MarketDataClient:
+    def __init__(self, base_url: str = "http://127.0.0.1:8765", timeout: float = 10.0, cache_size: int = 128):
+        """
+        Args:
+            base_url: 查询服务地址
+            timeout: 单次请求超时（秒）
+            cache_size: 按URL缓存的响应数，用于ETag重新验证
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._session = requests.Session()
+        self._cache: "OrderedDict[str, Tuple[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0}
+
+    def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        request = requests.Request("GET", f"{self.base_url}{path}", params=params).prepare()
+        url = request.url
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None:
+            request.headers["If-None-Match"] = cached[0]
+        response = self._session.send(request, timeout=self.timeout)
+        self.stats["requests"] += 1
+        if response.status_code == 304 and cached is not None:
+            self.stats["not_modified"] += 1
+            with self._lock:
+                self._cache.move_to_end(url)
+            return cached[1]
+        if response.status_code != 200:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            raise MarketDataError(response.status_code, message)
+
+        if response.headers.get("Content-Type", "").startswith(BINARY_CONTENT_TYPE):
+            result = decode_columns(response.content)
+        else:
+            result = response.json()
+        etag = response.headers.get("ETag")
+        if etag:
+            with self._lock:
+                self._cache[url] = (etag, result)
+                self._cache.move_to_end(url)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def catalog(self) -> List[Dict[str, str]]:
+        """返回市场目录：每项包含name、path、version"""
+        return self._get("/v1/catalog")["markets"]
+
+    def resolve(self, market_name: str) -> Optional[Dict[str, str]]:
+        """解析市场名称，未找到时返回None"""
+        try:
+            return self._get("/v1/resolve", {"name": market_name})
+        except MarketDataError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def health(self) -> Dict[str, Any]:
+        return self._get("/v1/health")
+
+    def series_columns(self, market_name: str, start: Optional[str] = None, end: Optional[str] = None,
+                       last: Optional[int] = None, columns: Optional[List[str]] = None,
+                       indicators: Optional[List[str]] = None, interval: str = "1d", points: Optional[int] = None,
+                       precision: int = 64) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """查询K线，返回 (meta, {列名: 数组})，日期列为距1970-01-01的天数
+
+        Args:
+            market_name: 市场名称（服务端解析，支持模糊匹配）
+            start: 开始日期（含），YYYY-MM-DD
+            end: 结束日期（含）
+            last: 只返回最后N根
+            columns: 需要的K线列，默认全部
+            indicators: 附加的指标，如["ma20", "rsi14", "macd", "boll20"]
+            interval: 1d、1w或1M
+            points: 目标点数，超过时服务端降采样
+            precision: 浮点列的精度，32时传输量减半
+
+        Raises:
+            MarketDataError: 市场不存在或参数无效
+        """
+        params = {
+            "market": market_name, "start": start, "end": end, "last": last, "interval": interval,
+            "columns": ",".join(columns) if columns else None,
+            "indicators": ",".join(indicators) if indicators else None,
+            "points": points, "precision": precision if precision != 64 else None, "format": "binary",
+        }
+        return self._get("/v1/series", params)
+
+    def series(self, market_name: str, **kwargs) -> pd.DataFrame:
+        """查询K线并转换为DataFrame（date为datetime类型），参数同series_columns"""
+        _, columns = self.series_columns(market_name, **kwargs)
+        df = pd.DataFrame({name: values for name, values in columns.items() if name != "date"})
+        df.insert(0, "date", pd.to_datetime(columns["date"].astype("datetime64[D]")))
+        return df
+
+    def close(self):
+        self._session.close()
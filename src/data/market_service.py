@@ -0,0 +1,509 @@
+"""
+本地行情查询服务
+
+在一个常驻进程中保存市场目录和最近使用的K线序列，通过本机HTTP接口提供查询，
+智能体工具、Notebook和看板等多个调用方共享同一份已解析的数据，不必各自重新读取CSV：
+- GET /v1/catalog：市场目录（名称、相对路径、数据版本）；
+- GET /v1/resolve?name=...：市场名称解析（精确、包含、拼音/相似度模糊匹配）；
+- GET /v1/series?market=...：按日期范围或最近N根切片、按列投影的K线，可重采样为周线/月线、
+  降采样到目标点数，并附加技术指标列（ma/ema/rsi/macd/boll/vma）；
+- GET /v1/health：缓存与请求统计。
+
+序列数据默认以紧凑的列式二进制格式返回（见encode_columns），也可返回JSON。
+每个响应带有由数据版本和查询参数计算的ETag，客户端带If-None-Match请求时数据未变化则返回304。
+每次访问序列时检查文件的数据版本（修改时间与大小），抓取更新后自动重新加载。
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.tools.chart_data import downsample_ohlc
+from src.tools.data_tools import fuzzy_match_market_name, get_data_version, list_market_files
+from src.utils import metrics
+from src.utils.logger import setup_logger
+
+logger = setup_logger("market_service")
+
+DEFAULT_MARKET_SERVICE_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 8765,
+    "max_series": 256,           # 内存中保留的序列数，超出后淘汰最久未使用的
+    "refresh_interval": 60,      # 重新扫描市场目录的最小间隔（秒）
+    "resolve_cache_size": 1024,  # 名称解析结果的缓存条数
+}
+
+PRICE_COLUMNS = ["open", "close", "high", "low", "volume", "amount"]
+INTERVALS = {"1d": None, "1w": "W", "1M": "M"}
+BINARY_CONTENT_TYPE = "application/x-cs-columns"
+# 二进制格式的魔数，后接4字节小端头部长度、UTF-8 JSON头部和各列的原始数据
+BINARY_MAGIC = b"CSC1"
+
+
+def encode_columns(meta: Dict[str, Any], columns: Dict[str, np.ndarray], precision: int = 64) -> bytes:
+    """把列式数据编码为紧凑的二进制格式
+
+    格式：b"CSC1" + 头部长度（<u4）+ JSON头部 + 各列数据。头部包含meta和每列的名称、dtype、字节偏移；
+    日期列为距1970-01-01的天数（<i4），其余列为小端浮点数（precision=32时为<f4，体积减半）。
+    """
+    float_dtype = "<f4" if precision == 32 else "<f8"
+    parts, specs, offset = [], [], 0
+    for name, values in columns.items():
+        dtype = "<i4" if name == "date" else float_dtype
+        data = np.ascontiguousarray(values, dtype=dtype).tobytes()
+        specs.append({"name": name, "dtype": dtype, "offset": offset, "length": len(values)})
+        parts.append(data)
+        offset += len(data)
+    header = json.dumps({**meta, "columns": specs}, ensure_ascii=False, default=str).encode("utf-8")
+    return BINARY_MAGIC + struct.pack("<I", len(header)) + header + b"".join(parts)
+
+
+def decode_columns(body: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """解码encode_columns的输出，返回 (meta, {列名: 数组})，数组直接引用body的内存，不复制"""
+    if body[:4] != BINARY_MAGIC:
+        raise ValueError("不是有效的列式二进制数据")
+    (header_len,) = struct.unpack("<I", body[4:8])
+    meta = json.loads(body[8:8 + header_len].decode("utf-8"))
+    data = memoryview(body)[8 + header_len:]
+    columns = {}
+    for spec in meta.pop("columns"):
+        dtype = np.dtype(spec["dtype"])
+        columns[spec["name"]] = np.frombuffer(data, dtype=dtype, count=spec["length"], offset=spec["offset"])
+    return meta, columns
+
+
+def _parse_indicator(spec: str) -> Tuple[str, int]:
+    """解析指标名，如ma20、ema12、rsi14、boll20、vma5、macd"""
+    spec = spec.strip().lower()
+    if spec == "macd":
+        return "macd", 0
+    for kind in ("sma", "ema", "rsi", "boll", "vma", "ma"):
+        if spec.startswith(kind) and spec[len(kind):].isdigit() and int(spec[len(kind):]) > 0:
+            return ("ma" if kind == "sma" else kind), int(spec[len(kind):])
+    raise ValueError(f"不支持的指标: {spec}（可用: maN, emaN, rsiN, bollN, vmaN, macd）")
+
+
+def compute_indicator(df: pd.DataFrame, spec: str) -> Dict[str, np.ndarray]:
+    """在整条序列上计算一个指标，返回 {列名: 数组}（长度与df相同，预热期为NaN）
+
+    均线、RSI（Wilder平滑）与pandas_ta的sma/ema/rsi计算方式一致；MACD为12/26/9，布林带为N日均线±2倍标准差。
+    """
+    kind, length = _parse_indicator(spec)
+    close = df["close"].astype(np.float64)
+    if kind == "ma":
+        return {f"ma{length}": close.rolling(length).mean().to_numpy()}
+    if kind == "ema":
+        return {f"ema{length}": close.ewm(span=length, adjust=False, min_periods=length).mean().to_numpy()}
+    if kind == "vma":
+        return {f"vma{length}": df["volume"].astype(np.float64).rolling(length).mean().to_numpy()}
+    if kind == "rsi":
+        delta = close.diff()
+        gain = delta.clip(lower=0).ewm(alpha=1 / length, adjust=False, min_periods=length).mean()
+        loss = (-delta.clip(upper=0)).ewm(alpha=1 / length, adjust=False, min_periods=length).mean()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi = 100 - 100 / (1 + gain / loss)
+        return {f"rsi{length}": rsi.to_numpy()}
+    if kind == "boll":
+        mid = close.rolling(length).mean()
+        std = close.rolling(length).std(ddof=0)
+        return {f"boll{length}_upper": (mid + 2 * std).to_numpy(), f"boll{length}_mid": mid.to_numpy(),
+                f"boll{length}_lower": (mid - 2 * std).to_numpy()}
+    macd = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    signal = macd.ewm(span=9, adjust=False).mean()
+    return {"macd": macd.to_numpy(), "macd_signal": signal.to_numpy(), "macd_hist": (macd - signal).to_numpy()}
+
+
+def resample_bars(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """把日K线聚合为周线（1w）或月线（1M），日期为每个周期内最后一个交易日"""
+    if interval not in INTERVALS:
+        raise ValueError(f"不支持的周期: {interval}，可选: {', '.join(INTERVALS)}")
+    freq = INTERVALS[interval]
+    if freq is None:
+        return df
+    periods = df["date"].dt.to_period(freq)
+    grouped = df.groupby(periods, sort=True)
+    agg = {"date": "last", "open": "first", "high": "max", "low": "min", "close": "last"}
+    agg.update({c: "sum" for c in ("volume", "amount") if c in df.columns})
+    return grouped.agg(agg).reset_index(drop=True)
+
+
+class _Series:
+    """一个已加载的序列：数据版本、日K线，以及按周期缓存的重采样结果和指标"""
+    __slots__ = ("path", "version", "frames", "indicators", "lock")
+
+    def __init__(self, path: str, version: str, df: pd.DataFrame):
+        self.path = path
+        self.version = version
+        self.frames: Dict[str, pd.DataFrame] = {"1d": df}
+        self.indicators: Dict[Tuple[str, str], Dict[str, np.ndarray]] = {}
+        self.lock = threading.Lock()
+
+    def frame(self, interval: str) -> pd.DataFrame:
+        with self.lock:
+            df = self.frames.get(interval)
+            if df is None:
+                df = self.frames[interval] = resample_bars(self.frames["1d"], interval)
+            return df
+
+    def indicator(self, interval: str, spec: str) -> Dict[str, np.ndarray]:
+        key = (interval, spec)
+        with self.lock:
+            values = self.indicators.get(key)
+        if values is None:
+            values = compute_indicator(self.frame(interval), spec)
+            with self.lock:
+                self.indicators[key] = values
+        return values
+
+
+def _load_frame(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df = df.drop_duplicates(subset=["date"], keep="last")
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.sort_values("date").reset_index(drop=True)
+    for column in PRICE_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(np.float64)
+    return df
+
+
+class MarketDataStore:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline"):
+        """初始化行情数据存储
+
+        Args:
+            config: 服务配置，即config.yaml中的market_service部分，缺省项使用DEFAULT_MARKET_SERVICE_CONFIG
+            data_dir: K线数据目录
+        """
+        self.config = {**DEFAULT_MARKET_SERVICE_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._catalog: Dict[str, str] = {}
+        self._catalog_etag = ""
+        self._last_scan = 0.0
+        self._series: "OrderedDict[str, _Series]" = OrderedDict()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._resolved: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self.stats = {"requests": 0, "not_modified": 0, "hits": 0, "loads": 0, "reloads": 0, "evictions": 0}
+
+    def catalog(self, refresh: bool = False) -> Tuple[Dict[str, str], str]:
+        """返回 ({市场名: CSV路径}, 目录ETag)，距离上次扫描超过refresh_interval时重新扫描"""
+        now = time.monotonic()
+        with self._lock:
+            if not refresh and self._catalog and now - self._last_scan < self.config["refresh_interval"]:
+                return self._catalog, self._catalog_etag
+        files = list_market_files(self.data_dir)
+        digest = hashlib.sha1()
+        for name, path in files.items():
+            digest.update(f"{name}|{path}|{get_data_version(path)}\n".encode("utf-8"))
+        etag = f'"{digest.hexdigest()[:20]}"'
+        with self._lock:
+            if files != self._catalog:
+                # 目录变化后名称解析结果可能改变
+                self._resolved.clear()
+                logger.info(f"市场目录已更新: {len(files)}个市场")
+            self._catalog, self._catalog_etag, self._last_scan = files, etag, now
+        return files, etag
+
+    def resolve(self, market_name: str) -> Optional[str]:
+        """把市场名称解析为CSV路径：精确匹配、包含匹配，最后拼音/相似度模糊匹配，结果缓存"""
+        catalog, _ = self.catalog()
+        with self._lock:
+            if market_name in self._resolved:
+                self._resolved.move_to_end(market_name)
+                return self._resolved[market_name]
+        path = catalog.get(market_name)
+        if path is None:
+            path = next((p for name, p in catalog.items() if market_name in name), None)
+        if path is None and market_name:
+            path, _ = fuzzy_match_market_name(market_name, self.data_dir)
+        with self._lock:
+            self._resolved[market_name] = path
+            while len(self._resolved) > self.config["resolve_cache_size"]:
+                self._resolved.popitem(last=False)
+        return path
+
+    def series(self, path: str, version: Optional[str] = None) -> _Series:
+        """返回已加载的序列，文件的数据版本变化后重新加载"""
+        version = version or get_data_version(path)
+        with self._lock:
+            entry = self._series.get(path)
+            if entry is not None and entry.version == version:
+                self._series.move_to_end(path)
+                self.stats["hits"] += 1
+                metrics.inc("cache_requests_total", cache="market_series", result="hit")
+                return entry
+            load_lock = self._loading.setdefault(path, threading.Lock())
+        # 同一序列只由一个线程加载，其他线程等待后直接使用结果
+        with load_lock:
+            with self._lock:
+                current = self._series.get(path)
+                if current is not None and current.version == version:
+                    return current
+            with metrics.span("service.load_series") as span:
+                df = _load_frame(path)
+                span.add("rows", len(df))
+            loaded = _Series(path, version, df)
+            with self._lock:
+                self.stats["reloads" if entry is not None else "loads"] += 1
+                metrics.inc("cache_requests_total", cache="market_series", result="miss")
+                self._series[path] = loaded
+                self._series.move_to_end(path)
+                while len(self._series) > self.config["max_series"]:
+                    self._series.popitem(last=False)
+                    self.stats["evictions"] += 1
+                self._loading.pop(path, None)
+        if entry is not None:
+            logger.info(f"数据已更新，重新加载: {path}")
+        return loaded
+
+    def query(self, path: str, version: str, columns: Optional[List[str]] = None,
+              indicators: Optional[List[str]] = None, start: Optional[str] = None, end: Optional[str] = None,
+              last: Optional[int] = None, interval: str = "1d",
+              points: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+        """查询一个序列
+
+        Args:
+            path: CSV路径（由resolve得到）
+            version: 数据版本
+            columns: 返回的K线列，默认全部；date列总是返回
+            indicators: 附加的指标，如["ma20", "rsi14", "macd"]，在整条序列上计算后再切片
+            start: 开始日期（含），YYYY-MM-DD
+            end: 结束日期（含）
+            last: 只返回切片后的最后N根
+            interval: 1d、1w或1M
+            points: 目标点数，超过时按开高低收分桶降采样（此时不支持指标）
+
+        Returns:
+            (meta, {列名: 数组})：日期列为距1970-01-01的天数
+        """
+        entry = self.series(path, version)
+        df = entry.frame(interval)
+        columns = columns or [c for c in PRICE_COLUMNS if c in df.columns]
+        unknown = [c for c in columns if c not in df.columns]
+        if unknown:
+            raise ValueError(f"不存在的列: {', '.join(unknown)}")
+
+        dates = df["date"].to_numpy()
+        lo = int(np.searchsorted(dates, np.datetime64(start), side="left")) if start else 0
+        hi = int(np.searchsorted(dates, np.datetime64(end), side="right")) if end else len(df)
+        if last is not None and last >= 0:
+            lo = max(lo, hi - last)
+        hi = max(lo, hi)
+
+        result: Dict[str, np.ndarray] = {}
+        if points and hi - lo > points:
+            if indicators:
+                raise ValueError("降采样（points）与指标不能同时使用")
+            sampled = downsample_ohlc(df.iloc[lo:hi], points)
+            result["date"] = sampled["date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+            for column in columns:
+                result[column] = sampled[column].to_numpy(dtype=np.float64)
+        else:
+            result["date"] = dates[lo:hi].astype("datetime64[D]").astype(np.int64)
+            for column in columns:
+                result[column] = df[column].to_numpy(dtype=np.float64)[lo:hi]
+            for spec in indicators or []:
+                for name, values in entry.indicator(interval, spec).items():
+                    result[name] = values[lo:hi]
+
+        meta = {
+            "path": os.path.relpath(path, self.data_dir),
+            "version": version,
+            "interval": interval,
+            "rows": len(result["date"]),
+            "total_rows": len(df),
+            "start": str(dates[lo])[:10] if hi > lo else None,
+            "end": str(dates[hi - 1])[:10] if hi > lo else None,
+        }
+        return meta, result
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, "series_cached": len(self._series), "markets": len(self._catalog)}
+
+
+def _etag(*parts) -> str:
+    return '"' + hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class MarketDataServer:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline",
+                 store: Optional[MarketDataStore] = None):
+        """本机行情查询HTTP服务
+
+        Args:
+            config: 服务配置，即config.yaml中的market_service部分
+            data_dir: K线数据目录
+            store: 共享的数据存储，默认按config创建
+        """
+        self.config = {**DEFAULT_MARKET_SERVICE_CONFIG, **(config or {})}
+        self.store = store or MarketDataStore(self.config, data_dir)
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _build_server(self) -> ThreadingHTTPServer:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # 保持连接，客户端的Session可复用同一个TCP连接
+            protocol_version = "HTTP/1.1"
+            # 头部和正文分两次写出，关闭Nagle算法避免与延迟ACK叠加产生约40ms的等待
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    service._dispatch(self, url.path, params)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((self.config["host"], int(self.config["port"])), Handler)
+        server.daemon_threads = True
+        return server
+
+    def start(self) -> "MarketDataServer":
+        """在后台线程中启动服务（port为0时使用随机端口）"""
+        self._server = self._build_server()
+        threading.Thread(target=self._server.serve_forever, name="market-service", daemon=True).start()
+        logger.info(f"行情查询服务已启动: {self.base_url}")
+        return self
+
+    def serve_forever(self):
+        """在当前线程中运行服务，直到被中断"""
+        self._server = self._build_server()
+        logger.info(f"行情查询服务已启动: {self.base_url}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "MarketDataServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, path: str, params: Dict[str, str]):
+        store = self.store
+        with store._lock:
+            store.stats["requests"] += 1
+        if_none_match = handler.headers.get("If-None-Match")
+        try:
+            if path == "/v1/series":
+                self._series(handler, params, if_none_match)
+            elif path == "/v1/catalog":
+                catalog, etag = store.catalog(refresh=params.get("refresh") == "1")
+                if etag == if_none_match:
+                    return self._not_modified(handler, etag)
+                markets = [{"name": name, "path": os.path.relpath(p, store.data_dir), "version": get_data_version(p)}
+                           for name, p in catalog.items()]
+                self._send_json(handler, 200, {"markets": markets}, etag)
+            elif path == "/v1/resolve":
+                resolved = store.resolve(params.get("name", ""))
+                if resolved is None:
+                    return self._send_json(handler, 404, {"error": f"未找到市场: {params.get('name', '')}"})
+                self._send_json(handler, 200, {"name": params.get("name"), "path": os.path.relpath(resolved, store.data_dir),
+                                               "version": get_data_version(resolved)})
+            elif path == "/v1/health":
+                self._send_json(handler, 200, store.health())
+            else:
+                self._send_json(handler, 404, {"error": f"未知路径: {path}"})
+        except ValueError as e:
+            self._send_json(handler, 400, {"error": str(e)})
+        except Exception as e:
+            logger.error(f"处理查询{path}时发生错误: {str(e)}")
+            self._send_json(handler, 500, {"error": str(e)})
+
+    def _series(self, handler: BaseHTTPRequestHandler, params: Dict[str, str], if_none_match: Optional[str]):
+        market = params.get("market", "")
+        csv_path = self.store.resolve(market)
+        if csv_path is None:
+            return self._send_json(handler, 404, {"error": f"未找到市场: {market}"})
+        version = get_data_version(csv_path)
+        fmt = params.get("format", "binary")
+        if fmt not in ("binary", "json"):
+            raise ValueError(f"不支持的格式: {fmt}，可选: binary, json")
+        # ETag由数据版本和规范化的查询参数决定，数据未变化时无需重新计算
+        query = sorted((k, v) for k, v in params.items() if k != "market")
+        etag = _etag(csv_path, version, query)
+        if etag == if_none_match:
+            return self._not_modified(handler, etag)
+
+        last = params.get("last")
+        points = params.get("points")
+        with metrics.span("service.query", format=fmt):
+            meta, columns = self.store.query(
+                csv_path, version,
+                columns=_split(params.get("columns")),
+                indicators=_split(params.get("indicators")),
+                start=params.get("start"), end=params.get("end"),
+                last=int(last) if last else None,
+                interval=params.get("interval", "1d"),
+                points=int(points) if points else None,
+            )
+            meta["market"] = market
+            if fmt == "binary":
+                body = encode_columns(meta, columns, precision=int(params.get("precision", 64)))
+                self._send(handler, 200, body, BINARY_CONTENT_TYPE, etag, version)
+            else:
+                payload = {**meta, "columns": {name: [None if v != v else v for v in values.tolist()]
+                                               for name, values in columns.items()}}
+                self._send_json(handler, 200, payload, etag, version)
+
+    def _not_modified(self, handler: BaseHTTPRequestHandler, etag: str):
+        with self.store._lock:
+            self.store.stats["not_modified"] += 1
+        handler.send_response(304)
+        handler.send_header("ETag", etag)
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+
+    def _send_json(self, handler: BaseHTTPRequestHandler, status: int, payload: Dict, etag: Optional[str] = None,
+                   version: Optional[str] = None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self._send(handler, status, body, "application/json; charset=utf-8", etag, version)
+
+    @staticmethod
+    def _send(handler: BaseHTTPRequestHandler, status: int, body: bytes, content_type: str,
+              etag: Optional[str] = None, version: Optional[str] = None):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        if etag:
+            handler.send_header("ETag", etag)
+            # 客户端可以缓存，但每次使用前需带If-None-Match重新验证
+            handler.send_header("Cache-Control", "no-cache")
+        if version:
+            handler.send_header("X-Data-Version", version)
+        handler.end_headers()
+        handler.wfile.write(body)
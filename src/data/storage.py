@@ -1,10 +1,13 @@
+import logging
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Optional
-from src.utils.logger import setup_logger
+from src.utils import metrics
+from src.utils.logger import LogSampler, setup_logger
 
 # 创建logger实例
 logger = setup_logger("data_storage")
+sampler = LogSampler()
 
 class DataStorage:
     def __init__(self, config: Dict):
@@ -35,14 +38,19 @@ class DataStorage:
                 logger.warning(f"文件不存在: {filepath}")
                 return None
                 
-            df = pd.read_csv(filepath)
-            logger.info(f"成功加载数据: {filepath}")
+            with metrics.span("storage.load_csv") as span:
+                df = pd.read_csv(filepath)
+                span.add("rows", len(df))
+                if metrics.is_enabled():
+                    span.add("bytes", filepath.stat().st_size)
+            sampler.log(logger, logging.INFO, "load", "成功加载数据: %s", filepath)
             return df
             
         except Exception as e:
             logger.error(f"加载CSV文件时发生错误: {str(e)}")
             return None
 
+    @metrics.timed("storage.save_processed")
     def save_processed(self, df: pd.DataFrame, filename: str) -> bool:
         """保存处理后的数据
         
@@ -60,13 +68,14 @@ class DataStorage:
                 
             filepath = self.processed_dir / filename
             df.to_csv(filepath, index=False)
-            logger.info(f"成功保存处理后的数据: {filepath}")
+            sampler.log(logger, logging.INFO, "save_processed", "成功保存处理后的数据: %s", filepath)
             return True
             
         except Exception as e:
             logger.error(f"保存处理后的数据时发生错误: {str(e)}")
             return False
 
+    @metrics.timed("storage.append_to_csv")
     def append_to_csv(self, df: pd.DataFrame, filename: str) -> bool:
         """追加数据到CSV文件
         
@@ -94,7 +103,7 @@ class DataStorage:
             
             # 保存合并后的数据
             df.to_csv(filepath, index=False)
-            logger.info(f"成功追加数据到: {filepath}")
+            sampler.log(logger, logging.INFO, "append", "成功追加数据到: %s", filepath)
             return True
             
         except Exception as e:
@@ -0,0 +1,266 @@
+"""
+市场异动扫描工具
+
+每次抓取数据后扫描所有K线序列，计算收益率、成交量、成交额的滚动z分数，
+识别波动率状态切换和价格突破，并输出按异常程度排序的告警表。
+各序列先按日期去重，并截断到所有序列共同的最新已完成交易日（部分序列末尾未收盘的K线不参与比较），
+再按末尾对齐堆叠为 市场数×窗口长度 的矩阵后统一向量化计算；
+增量扫描只重新读取数据版本或对齐日期发生变化的序列的末尾数据。
+"""
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.tools.data_tools import (common_completed_date, get_data_version, list_market_files, normalize_daily_bars,
+                                  read_csv_tail, stack_series_tails)
+from src.utils.config import get_config_section
+from src.utils.logger import setup_logger
+
+logger = setup_logger("anomaly_scanner")
+
+DEFAULT_ANOMALY_CONFIG = {
+    "zscore_window": 20,          # 滚动z分数的窗口
+    "vol_short_window": 5,        # 短期波动率窗口
+    "vol_long_window": 60,        # 长期波动率窗口
+    "breakout_window": 20,        # 突破判断的回看窗口
+    "z_threshold": 3.0,
+    "vol_ratio_threshold": 2.0,
+    "max_lag_days": 3,            # 落后最新日期超过该天数的序列视为停止更新，不参与确定对齐日期
+    "alert_file": "data/processed/anomalies.csv",
+}
+
+ALERT_COLUMNS = [
+    "market", "date", "close", "return_pct", "return_z", "volume_z", "amount_z",
+    "vol_ratio", "breakout", "score", "alerts", "path", "data_version", "last_date",
+]
+
+# 读取末尾数据时多读的行数，弥补按日期去重和截断到对齐日期去掉的行
+TAIL_SLACK_ROWS = 10
+
+
+def _zscore_latest(values: np.ndarray, window: int) -> np.ndarray:
+    """计算每行最后一个值相对于此前window个值的z分数"""
+    history = values[:, -window - 1:-1]
+    mean = np.nanmean(history, axis=1)
+    std = np.nanstd(history, axis=1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (values[:, -1] - mean) / std
+    z[~np.isfinite(z)] = 0.0
+    return z
+
+
+def compute_anomaly_metrics(frames: Dict[str, pd.DataFrame], config: Optional[Dict] = None) -> pd.DataFrame:
+    """对多个市场的末尾K线数据向量化计算异动指标
+
+    Args:
+        frames: 市场名称到K线数据（至少包含最近若干行）的映射，应已按日期去重并对齐到同一交易日
+        config: 扫描配置，缺省项使用DEFAULT_ANOMALY_CONFIG
+
+    Returns:
+        pd.DataFrame: 每个市场一行的异动指标
+    """
+    cfg = {**DEFAULT_ANOMALY_CONFIG, **(config or {})}
+    names = list(frames.keys())
+    if not names:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+    dfs = [frames[name] for name in names]
+    length = max(cfg["zscore_window"], cfg["vol_long_window"], cfg["breakout_window"]) + 2
+
+    # 历史数据不足的序列会产生全NaN切片，忽略对应的RuntimeWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        close = stack_series_tails(dfs, "close", length)
+        high = stack_series_tails(dfs, "high", length)
+        low = stack_series_tails(dfs, "low", length)
+        volume = np.log1p(np.clip(stack_series_tails(dfs, "volume", length), 0, None))
+        amount = np.log1p(np.clip(stack_series_tails(dfs, "amount", length), 0, None))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.diff(np.log(np.where(close > 0, close, np.nan)), axis=1)
+
+        return_z = _zscore_latest(returns, cfg["zscore_window"])
+        volume_z = _zscore_latest(volume, cfg["zscore_window"])
+        amount_z = _zscore_latest(amount, cfg["zscore_window"])
+
+        # 波动率状态切换：短期波动率与长期波动率之比
+        short_vol = np.nanstd(returns[:, -cfg["vol_short_window"]:], axis=1, ddof=1)
+        long_vol = np.nanstd(returns[:, -cfg["vol_long_window"]:], axis=1, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            vol_ratio = short_vol / long_vol
+        vol_ratio[~np.isfinite(vol_ratio)] = 1.0
+
+        # 突破：最新收盘价突破此前N天的最高价/最低价
+        window_high = np.nanmax(high[:, -cfg["breakout_window"] - 1:-1], axis=1)
+        window_low = np.nanmin(low[:, -cfg["breakout_window"] - 1:-1], axis=1)
+        latest_close = close[:, -1]
+        breakout = np.where(latest_close > window_high, 1, np.where(latest_close < window_low, -1, 0))
+
+        z_max = np.max(np.abs(np.vstack([return_z, volume_z, amount_z])), axis=0)
+        regime_shift = (vol_ratio >= cfg["vol_ratio_threshold"]) | (vol_ratio <= 1 / cfg["vol_ratio_threshold"])
+        score = z_max + (breakout != 0) + regime_shift * np.abs(np.log(vol_ratio))
+
+    result = pd.DataFrame({
+        "market": names,
+        "date": [pd.Timestamp(df["date"].iloc[-1]).strftime("%Y-%m-%d") if len(df) else None for df in dfs],
+        "close": latest_close,
+        "return_pct": np.expm1(returns[:, -1]) * 100,
+        "return_z": return_z,
+        "volume_z": volume_z,
+        "amount_z": amount_z,
+        "vol_ratio": vol_ratio,
+        "breakout": breakout,
+        "score": score,
+    })
+    result["alerts"] = _describe_alerts(result, cfg)
+    return result
+
+
+def _describe_alerts(metrics: pd.DataFrame, cfg: Dict) -> List[str]:
+    """根据阈值生成每个市场的告警描述"""
+    threshold = cfg["z_threshold"]
+    descriptions = []
+    for row in metrics.itertuples(index=False):
+        parts = []
+        if abs(row.return_z) >= threshold:
+            parts.append(f"价格{'大涨' if row.return_z > 0 else '大跌'}(z={row.return_z:.1f})")
+        if abs(row.volume_z) >= threshold:
+            parts.append(f"成交量{'放大' if row.volume_z > 0 else '萎缩'}(z={row.volume_z:.1f})")
+        if abs(row.amount_z) >= threshold:
+            parts.append(f"成交额{'放大' if row.amount_z > 0 else '萎缩'}(z={row.amount_z:.1f})")
+        if row.vol_ratio >= cfg["vol_ratio_threshold"]:
+            parts.append(f"波动率放大(短/长={row.vol_ratio:.1f})")
+        elif row.vol_ratio <= 1 / cfg["vol_ratio_threshold"]:
+            parts.append(f"波动率收敛(短/长={row.vol_ratio:.2f})")
+        if row.breakout == 1:
+            parts.append(f"向上突破{cfg['breakout_window']}日高点")
+        elif row.breakout == -1:
+            parts.append(f"向下跌破{cfg['breakout_window']}日低点")
+        descriptions.append("；".join(parts))
+    return descriptions
+
+
+class AnomalyScanner:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline"):
+        """初始化异动扫描器
+
+        Args:
+            config: 扫描配置，即config.yaml中的anomaly部分
+            data_dir: K线数据目录
+        """
+        self.config = {**DEFAULT_ANOMALY_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self.alert_file = Path(self.config["alert_file"])
+
+    def _load_previous(self) -> pd.DataFrame:
+        if self.alert_file.exists():
+            try:
+                table = pd.read_csv(self.alert_file, keep_default_na=False,
+                                    na_values={c: [""] for c in ALERT_COLUMNS if c != "alerts"})
+                # 旧版告警表没有last_date列，对应的序列会重新计算
+                return table.reindex(columns=ALERT_COLUMNS)
+            except Exception as e:
+                logger.warning(f"读取历史告警表失败，将进行全量扫描: {str(e)}")
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    def _read_tail(self, name: str, path: str) -> Optional[pd.DataFrame]:
+        tail_rows = max(self.config["zscore_window"], self.config["vol_long_window"],
+                        self.config["breakout_window"]) + 2 + TAIL_SLACK_ROWS
+        try:
+            return normalize_daily_bars(read_csv_tail(path, tail_rows))
+        except Exception as e:
+            logger.error(f"读取{name}数据失败: {str(e)}")
+            return None
+
+    def scan(self, full: bool = False) -> pd.DataFrame:
+        """扫描所有序列并写出排序后的告警表
+
+        所有序列对齐到共同的最新已完成交易日后再计算，当天未收盘的K线不会被当作异动。
+
+        Args:
+            full: 是否忽略上次结果进行全量扫描
+
+        Returns:
+            pd.DataFrame: 按异常分数降序排列的告警表（包含所有序列）
+        """
+        market_files = list_market_files(self.data_dir)
+        previous = pd.DataFrame(columns=ALERT_COLUMNS) if full else self._load_previous()
+        previous_rows = {row.path: row for row in previous.itertuples(index=False)}
+
+        versions = {name: get_data_version(path) for name, path in market_files.items()}
+        frames = {}
+        last_dates = {}
+        for name, path in market_files.items():
+            row = previous_rows.get(path)
+            if row is not None and row.data_version == versions[name] and pd.notna(row.last_date):
+                last_dates[name] = pd.Timestamp(row.last_date)
+                continue
+            df = self._read_tail(name, path)
+            if df is not None and len(df):
+                frames[name] = df
+                last_dates[name] = df["date"].iloc[-1]
+
+        as_of = common_completed_date(last_dates.values(), self.config["max_lag_days"])
+        targets = {name: min(last_date, as_of) for name, last_date in last_dates.items()}
+        # 数据未变化但对齐日期变了的序列（如其他序列补齐了最新交易日）也需要重新计算
+        for name, target in targets.items():
+            if name not in frames and previous_rows[market_files[name]].date != target.strftime("%Y-%m-%d"):
+                df = self._read_tail(name, market_files[name])
+                if df is not None and len(df):
+                    frames[name] = df
+
+        fresh = compute_anomaly_metrics(
+            {name: df[df["date"] <= targets[name]] for name, df in frames.items()}, self.config)
+        fresh["path"] = [market_files[name] for name in fresh["market"]]
+        fresh["data_version"] = [versions[name] for name in fresh["market"]]
+        fresh["last_date"] = [last_dates[name].strftime("%Y-%m-%d") for name in fresh["market"]]
+
+        kept_paths = {path for name, path in market_files.items() if name in last_dates and name not in frames}
+        kept = previous[previous["path"].isin(kept_paths)]
+        table = pd.concat([kept, fresh], ignore_index=True) if len(kept) else fresh
+        table = table.sort_values("score", ascending=False, ignore_index=True)[ALERT_COLUMNS]
+
+        self.alert_file.parent.mkdir(parents=True, exist_ok=True)
+        table.to_csv(self.alert_file, index=False)
+        logger.info(f"异动扫描完成: 共{len(table)}个序列，对齐到{as_of.strftime('%Y-%m-%d') if as_of else '-'}，"
+                    f"重新计算{len(fresh)}个，告警{int((table['alerts'].fillna('') != '').sum())}个")
+        return table
+
+    def get_alerts(self, top_n: int = 10, latest_only: bool = True) -> pd.DataFrame:
+        """读取告警表中有告警的前top_n个序列
+
+        Args:
+            top_n: 返回数量
+            latest_only: 是否只保留对齐交易日（所有序列共同的最新已完成交易日）的告警，
+                停止更新的序列的旧告警不会被返回
+
+        Returns:
+            pd.DataFrame: 告警列表
+        """
+        table = self._load_previous()
+        if table.empty or table["last_date"].isna().any():
+            table = self.scan()
+        alerts = table[table["alerts"].fillna("") != ""]
+        if latest_only and not alerts.empty:
+            as_of = common_completed_date(table["last_date"], self.config["max_lag_days"])
+            alerts = alerts[alerts["date"] == (as_of.strftime("%Y-%m-%d") if as_of is not None else None)]
+        return alerts.head(top_n)
+
+
+def get_anomaly_report(top_n: int = 10, config: Optional[Dict] = None, data_dir: str = "data/kline") -> str:
+    """生成"今天有什么异动"的文字报告，供智能体直接回答"""
+    alerts = AnomalyScanner(config, data_dir).get_alerts(top_n=top_n)
+    if alerts.empty:
+        return "最新交易日未发现明显异动的市场。"
+    lines = [f"最新交易日（{alerts['date'].iloc[0]}）异动市场（按异常程度排序）："]
+    for i, row in enumerate(alerts.itertuples(index=False), 1):
+        lines.append(f"{i}. {row.market}：收盘{row.close:.2f}，涨跌幅{row.return_pct:.2f}%，{row.alerts}")
+    return "\n".join(lines)
+
+
+def get_configured_anomaly_report(top_n: int = 10) -> str:
+    """按config.yaml中的anomaly配置和数据目录生成异动报告，读取抓取后扫描写出的同一份告警表"""
+    data_dir = get_config_section("data").get("output_dir", "data/kline")
+    return get_anomaly_report(top_n=top_n, config=get_config_section("anomaly"), data_dir=data_dir)
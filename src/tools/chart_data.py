@@ -0,0 +1,176 @@
+"""
+K线图表数据接口
+
+按请求的日期范围返回OHLCV列式数据，供前端在浏览器端绘制可缩放的交互式图表。
+历史较长时在服务端降采样到目标点数：K线使用保留开高低收的分桶聚合，
+收盘价折线可选LTTB算法，返回数据的大小与历史长度无关。
+解析并去重后的K线按 (文件路径, 数据版本) 缓存，交互式图表的重复请求不再重新读取整个文件。
+"""
+import base64
+import functools
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.tools.data_tools import find_csv_file, get_data_version
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+DOWNSAMPLE_METHODS = ("ohlc", "lttb")
+ENCODINGS = ("json", "binary")
+
+
+def downsample_ohlc(df: pd.DataFrame, target_points: int) -> pd.DataFrame:
+    """把连续K线按固定根数分桶合并：开盘取首根、最高取最大、最低取最小、收盘取末根、成交量求和
+
+    Args:
+        df: 按日期升序排列的K线数据
+        target_points: 目标K线数量
+
+    Returns:
+        pd.DataFrame: 降采样后的K线，日期为每个桶的最后一天
+    """
+    n = len(df)
+    if n <= target_points:
+        return df.reset_index(drop=True)
+    bucket = int(np.ceil(n / target_points))
+    # 从末尾对齐分桶，保证最新的K线总是完整的一桶
+    groups = (np.arange(n) + (-n) % bucket) // bucket
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    result = pd.DataFrame({
+        "date": df["date"].to_numpy()[ends],
+        "open": df["open"].to_numpy()[starts],
+        "high": np.maximum.reduceat(df["high"].to_numpy(), starts),
+        "low": np.minimum.reduceat(df["low"].to_numpy(), starts),
+        "close": df["close"].to_numpy()[ends],
+        "volume": np.add.reduceat(df["volume"].to_numpy(dtype=np.float64), starts),
+    })
+    if "amount" in df.columns:
+        result["amount"] = np.add.reduceat(df["amount"].to_numpy(dtype=np.float64), starts)
+    return result
+
+
+def lttb_indices(y: np.ndarray, target_points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets降采样，返回保留点的下标（x轴为等间距下标）"""
+    n = len(y)
+    if target_points >= n or target_points < 3:
+        return np.arange(n)
+    indices = np.empty(target_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    every = (n - 2) / (target_points - 2)
+    a = 0
+    for i in range(target_points - 2):
+        # 下一个桶的平均点作为三角形的第三个顶点
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = (avg_start + avg_end - 1) / 2.0
+        avg_y = y[avg_start:avg_end].mean()
+        # 在当前桶中选出与前一个选中点、下一桶平均点构成最大三角形的点
+        range_start = int(np.floor(i * every)) + 1
+        range_end = int(np.floor((i + 1) * every)) + 1
+        xs = np.arange(range_start, range_end)
+        areas = np.abs((a - avg_x) * (y[range_start:range_end] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = range_start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def _encode_column(values: np.ndarray, dtype: str) -> str:
+    return base64.b64encode(np.ascontiguousarray(values, dtype=dtype).tobytes()).decode("ascii")
+
+
+@functools.lru_cache(maxsize=32)
+def _load_frame(csv_path: str, version: str) -> pd.DataFrame:
+    """读取整个K线文件，按日期去重并排序；version只用作缓存键，数据文件更新后自动重新读取
+
+    返回的DataFrame在请求间共享，调用方只能筛选、不能原地修改。
+    """
+    df = pd.read_csv(csv_path)
+    df["date"] = pd.to_datetime(df["date"])
+    return df.drop_duplicates(subset=["date"], keep="last").sort_values("date").reset_index(drop=True)
+
+
+def _parse_date(value: str, label: str) -> pd.Timestamp:
+    try:
+        return pd.to_datetime(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"无效的{label}: {value}，应为YYYY-MM-DD格式的日期")
+
+
+def _json_number(value: float, column: str) -> Optional[float]:
+    """价格保留两位小数、成交量保留4位有效数字；NaN不是合法的JSON，输出为null"""
+    if not np.isfinite(value):
+        return None
+    return float(f"{value:.4g}") if column == "volume" else round(float(value), 2)
+
+
+def get_chart_data(market_name: str,
+                   start: Optional[str] = None,
+                   end: Optional[str] = None,
+                   target_points: int = 500,
+                   method: str = "ohlc",
+                   encoding: str = "json",
+                   data_dir: str = "data/kline") -> Optional[Dict]:
+    """获取指定日期范围的图表数据
+
+    Args:
+        market_name: 市场名称
+        start: 开始日期（含），如YYYY-MM-DD（也接受2025-6-1等写法），None表示最早
+        end: 结束日期（含），None表示最新
+        target_points: 目标点数，超过时在服务端降采样
+        method: 降采样方法，ohlc（保留开高低收的分桶聚合）或lttb（按收盘价LTTB选点）
+        encoding: json（数值列表，价格保留两位小数，成交量保留4位有效数字，缺失值为null）或binary（base64编码的小端float32/int32列）
+        data_dir: K线数据目录
+
+    Returns:
+        Optional[Dict]: 列式数据，日期为距1970-01-01的天数；未找到数据时返回None
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"不支持的降采样方法: {method}，可选: {', '.join(DOWNSAMPLE_METHODS)}")
+    if encoding not in ENCODINGS:
+        raise ValueError(f"不支持的编码: {encoding}，可选: {', '.join(ENCODINGS)}")
+    csv_path = find_csv_file(market_name, data_dir)
+    if not csv_path:
+        return None
+
+    df = _load_frame(csv_path, get_data_version(csv_path))
+    # 日期按时间比较而不是按字符串比较，"2025-6-1"与"2025-06-01"等价
+    if start:
+        df = df[df["date"] >= _parse_date(start, "开始日期")]
+    if end:
+        df = df[df["date"] <= _parse_date(end, "结束日期")]
+    total = len(df)
+
+    if method == "ohlc":
+        sampled = downsample_ohlc(df, target_points)
+    else:
+        sampled = df.iloc[lttb_indices(df["close"].to_numpy(dtype=np.float64), target_points)].reset_index(drop=True)
+
+    days = (sampled["date"].to_numpy().astype("datetime64[D]").astype(np.int64)).astype(np.int32)
+    payload = {
+        "market": market_name,
+        "method": method,
+        "encoding": encoding,
+        "total_points": total,
+        "points": len(sampled),
+        "start": df["date"].iloc[0].strftime("%Y-%m-%d") if total else None,
+        "end": df["date"].iloc[-1].strftime("%Y-%m-%d") if total else None,
+    }
+    if encoding == "binary":
+        payload["columns"] = {"date": _encode_column(days, "<i4")}
+        payload["columns"].update({c: _encode_column(sampled[c].to_numpy(), "<f4") for c in OHLCV_COLUMNS})
+    else:
+        payload["columns"] = {"date": days.tolist()}
+        for c in OHLCV_COLUMNS:
+            values = sampled[c].to_numpy(dtype=np.float64)
+            payload["columns"][c] = [_json_number(v, c) for v in values]
+    return payload
+
+
+def decode_binary_columns(payload: Dict) -> Dict[str, np.ndarray]:
+    """把binary编码的列解码为NumPy数组"""
+    columns = {"date": np.frombuffer(base64.b64decode(payload["columns"]["date"]), dtype="<i4")}
+    for c in OHLCV_COLUMNS:
+        columns[c] = np.frombuffer(base64.b64decode(payload["columns"][c]), dtype="<f4")
+    return columns
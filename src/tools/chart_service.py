@@ -0,0 +1,165 @@
+"""
+K线图渲染服务
+
+- 只渲染最近window根K线，不再每次绘制全部历史；
+- 图片按 市场、窗口、数据版本 缓存，数据未变化时直接返回已有图片；
+- 在常驻的进程池中渲染，工作进程启动时预先加载Agg后端和mplfinance；
+- 先写入唯一的临时文件再原子替换，并发请求不会读到写了一半的图片；
+- 旧版本图片在超过保留时间未被使用后才清理，刚返回给其他会话或写入预生成报告的图片不会被删除；
+- 相同图片的并发请求共享同一个渲染任务。
+"""
+import asyncio
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+from src.tools.data_tools import get_data_version
+from src.utils import metrics
+from src.utils.logger import setup_logger
+
+logger = setup_logger("chart_service")
+
+DEFAULT_CHART_CONFIG = {
+    "plot_dir": "plot/kline",
+    "window_days": 180,      # 默认渲染的K线根数
+    "max_workers": 2,        # 渲染进程数
+    "start_method": "spawn", # 进程启动方式，spawn可避免fork带有线程的父进程
+    "wait_timeout": 10.0,    # 同步接口在生成分析后等待图片的最长时间（秒）
+    "stale_grace_seconds": 3600,  # 旧版本图片最近一次使用后保留的时间（秒），超过后才清理
+}
+
+
+def _init_worker():
+    """工作进程初始化：固定使用Agg后端并预先导入绘图模块，避免首个请求承担导入开销"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import mplfinance  # noqa: F401
+    import src.tools.visualiza  # noqa: F401
+
+
+def _render_chart(csv_path: str, save_path: str, title: str, window: int, stale_pattern: str,
+                  stale_grace_seconds: float) -> str:
+    """在工作进程中渲染图片：写临时文件后原子替换，再清理同一市场窗口超过保留时间未使用的旧版本图片"""
+    from src.tools.visualiza import plot_kline
+
+    tmp_path = f"{os.path.splitext(save_path)[0]}.{uuid.uuid4().hex}.tmp.png"
+    try:
+        plot_kline(csv_path, save_path=tmp_path, title=title, window=window)
+        os.replace(tmp_path, save_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # 图片的修改时间即最近一次使用时间（命中缓存时会更新），其他会话可能还在读取刚使用过的旧图片
+    cutoff = time.time() - stale_grace_seconds
+    for path in glob.glob(stale_pattern):
+        if path != save_path and not path.endswith(".tmp.png"):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+    return save_path
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r'[\\/:*?"<>|\s]', '_', name)
+
+
+class ChartService:
+    def __init__(self, config: Optional[Dict] = None):
+        """初始化K线图渲染服务
+
+        Args:
+            config: 渲染配置，即config.yaml中的chart部分
+        """
+        self.config = {**DEFAULT_CHART_CONFIG, **(config or {})}
+        self.plot_dir = self.config["plot_dir"]
+        os.makedirs(self.plot_dir, exist_ok=True)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.config["max_workers"],
+                mp_context=multiprocessing.get_context(self.config["start_method"]),
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def warm_up(self):
+        """提前启动所有渲染进程并完成初始化"""
+        executor = self._get_executor()
+        futures = [executor.submit(os.getpid) for _ in range(self.config["max_workers"])]
+        for future in futures:
+            future.result()
+
+    def chart_path(self, market_name: str, csv_path: str, window: Optional[int] = None) -> str:
+        """根据市场、窗口和数据版本生成图片路径，数据变化后路径随之变化"""
+        window = window or self.config["window_days"]
+        version = get_data_version(csv_path)
+        digest = hashlib.sha1(f"{os.path.abspath(csv_path)}|{window}|{version}".encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.plot_dir, f"{_safe_name(market_name)}_{window}d_{digest}.png")
+
+    def submit(self, market_name: str, csv_path: str, window: Optional[int] = None) -> Future:
+        """提交渲染任务，立即返回Future；图片已缓存时返回已完成的Future"""
+        window = window or self.config["window_days"]
+        save_path = self.chart_path(market_name, csv_path, window)
+        if os.path.exists(save_path):
+            try:
+                # 记录最近一次使用时间，保留时间内不会被清理
+                os.utime(save_path)
+            except OSError:
+                pass
+            metrics.inc("cache_requests_total", cache="chart", result="hit")
+            future = Future()
+            future.set_result(save_path)
+            return future
+
+        with self._lock:
+            future = self._inflight.get(save_path)
+            if future is not None:
+                metrics.inc("cache_requests_total", cache="chart", result="shared")
+                return future
+            metrics.inc("cache_requests_total", cache="chart", result="miss")
+            submitted = time.perf_counter()
+            stale_pattern = os.path.join(self.plot_dir, f"{glob.escape(_safe_name(market_name))}_{window}d_*.png")
+            future = self._get_executor().submit(
+                _render_chart, csv_path, save_path, f"{market_name} K线图", window, stale_pattern,
+                self.config["stale_grace_seconds"]
+            )
+            self._inflight[save_path] = future
+
+        def _done(f: Future):
+            with self._lock:
+                self._inflight.pop(save_path, None)
+            # 渲染在工作进程中进行，在主进程记录从提交到完成的耗时（含排队）
+            metrics.observe("chart_render_seconds", time.perf_counter() - submitted)
+            if f.exception() is not None:
+                logger.error(f"渲染{market_name}K线图失败: {f.exception()}")
+
+        future.add_done_callback(_done)
+        return future
+
+    def get_chart(self, market_name: str, csv_path: str, window: Optional[int] = None,
+                  timeout: Optional[float] = None) -> str:
+        """同步获取图片路径，必要时等待渲染完成"""
+        return self.submit(market_name, csv_path, window).result(timeout=timeout)
+
+    async def aget_chart(self, market_name: str, csv_path: str, window: Optional[int] = None) -> str:
+        """异步获取图片路径，渲染在进程池中进行，不阻塞事件循环"""
+        # shield避免某个等待方被取消时连带取消其他请求共享的渲染任务
+        return await asyncio.shield(asyncio.wrap_future(self.submit(market_name, csv_path, window)))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,64 +1,205 @@
 import pandas as pd
-import os
-from typing import List, Dict, Any
-from src.tools.data_tools import read_market_data
-from src.utils.llm_client import LLMClient
-import yaml
-from dotenv import load_dotenv
-
-load_dotenv()
-api_key = os.getenv("API_KEY")
-# 读取配置
-with open("config/config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
-llm_cfg = config["llm_api"]
-
-llm = LLMClient(
-    api_url=llm_cfg["api_url"],
-    api_key=api_key,
-    model=llm_cfg["model"]
-)
-
-def compare_market_trends(market_names: List[str]) -> Dict[str, Any]:
-    """对比分析多个市场的趋势。"""
-    all_market_data = {}
-    for market_name in market_names:
-        df = read_market_data(market_name, num_days=730) # 更新为num_days，并设置读取两年数据
-        if df is not None and not df.empty:
-            all_market_data[market_name] = df
-        else:
-            print(f"未找到或无法读取 {market_name} 的数据。")
-
-    if len(all_market_data) < 2:
-        return {"analysis": "至少需要两个市场才能进行对比分析。", "image_path": None}
-
-    # 准备大模型分析的Prompt
-    comparison_prompt_parts = []
-    for name, df in all_market_data.items():
-        recent_data = df.tail(30) # 仅用最近30天数据生成摘要，避免Prompt过长
-        csv_str = recent_data.to_csv(index=False)
-        comparison_prompt_parts.append(f"市场名称：{name}\n最近30天K线数据：\n{csv_str}\n")
-
-    full_prompt = """
-    你是一个专业的市场分析师，请根据以下提供的多个市场数据，对它们进行对比分析。
-    请着重对比它们的近期走势、波动性、成交量变化，并指出它们的异同点，以及未来可能的发展趋势。
-    
-    以下是各个市场的数据：
-    {}
-
-    请用专业且易懂的语言进行分析。
-    """.format("\n---\n".join(comparison_prompt_parts))
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from src.tools.data_tools import find_csv_file, market_data_key, read_csv_data, read_market_data
+from src.tools.prompt_builder import build_comparison_prompt
+from src.utils.config import get_config_section
+from src.utils.llm_client import get_llm_client
+from src.utils.async_utils import run_blocking
+from src.utils.singleflight import AsyncSingleFlight, SingleFlight
 
+compare_cfg = get_config_section("compare")
+SUMMARY_DAYS = compare_cfg.get("summary_days", 30)      # 摘要统计的窗口
+LOAD_DAYS = compare_cfg.get("load_days", 60)            # 每个市场读取的末尾行数，需覆盖均线等指标的计算窗口
+MAX_WORKERS = compare_cfg.get("max_workers", 8)
+
+SYSTEM_PROMPT = "你是一个专业的市场分析师，擅长对比分析不同市场的趋势。"
+
+def summarize_market(market_name: str, num_days: int = LOAD_DAYS, summary_days: int = SUMMARY_DAYS,
+                     csv_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Map步骤：读取单个市场末尾数据并计算紧凑的统计摘要
+
+    Args:
+        csv_path: 已解析出的数据文件路径，传入时不再按名称查找
+
+    Returns:
+        Optional[Dict]: 包含name、summary（指标字典）和returns（近期日收益率序列），读取失败返回None
+    """
     try:
-        response = llm.chat(
-            messages=[
-                {"role": "system", "content": "你是一个专业的市场分析师，擅长对比分析不同市场的趋势。"},
-                {"role": "user", "content": full_prompt}
-            ],
+        df = read_csv_data(csv_path, num_days) if csv_path else read_market_data(market_name, num_days=num_days)
+    except Exception as e:
+        print(f"读取 {market_name} 的数据时发生错误: {e}")
+        df = None
+    if df is None or df.empty:
+        print(f"未找到或无法读取 {market_name} 的数据。")
+        return None
+    df = df.drop_duplicates(subset=['date'], keep='last')
+    close = df['close']
+    recent = df.tail(summary_days)
+    returns = close.pct_change()
+    latest = close.iloc[-1]
+
+    def period_return(days: int) -> Optional[float]:
+        if len(close) <= days or close.iloc[-days - 1] == 0:
+            return None
+        return round((latest / close.iloc[-days - 1] - 1) * 100, 2)
+
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1]
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1]
+    rsi = 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+    running_max = recent['close'].cummax()
+    volume_prev = df['volume'].iloc[-25:-5].mean()
+
+    summary = {
+        "最新日期": df['date'].iloc[-1].strftime("%Y-%m-%d"),
+        "收盘价": round(float(latest), 2),
+        "1日涨跌幅%": period_return(1),
+        "5日涨跌幅%": period_return(5),
+        f"{summary_days}日涨跌幅%": period_return(summary_days),
+        f"{summary_days}日最高": round(float(recent['high'].max()), 2),
+        f"{summary_days}日最低": round(float(recent['low'].min()), 2),
+        f"{summary_days}日最大回撤%": round(float(((recent['close'] / running_max) - 1).min() * 100), 2),
+        "20日年化波动率%": round(float(returns.tail(20).std() * (365 ** 0.5) * 100), 2),
+        "MA5偏离%": round(float((latest / close.tail(5).mean() - 1) * 100), 2),
+        "MA20偏离%": round(float((latest / close.tail(20).mean() - 1) * 100), 2),
+        "RSI14": round(float(rsi), 1),
+        "近5日均量较前20日变化%": round(float((df['volume'].tail(5).mean() / volume_prev - 1) * 100), 2) if volume_prev else None,
+    }
+    recent_returns = returns.tail(summary_days)
+    recent_returns.index = df['date'].tail(summary_days)
+    return {"name": market_name, "summary": summary, "returns": recent_returns}
+
+def _cross_market_parts(summaries: List[Dict[str, Any]], summary_days: int = SUMMARY_DAYS):
+    """计算跨市场统计：区间涨跌幅与波动率排名、日收益率相关系数矩阵（样本不足时为None）"""
+    names = [item["name"] for item in summaries]
+    lines = []
+    key = f"{summary_days}日涨跌幅%"
+    ranked = sorted(summaries, key=lambda x: x["summary"].get(key) if x["summary"].get(key) is not None else float("-inf"), reverse=True)
+    lines.append(f"{summary_days}日涨跌幅排名：" + " > ".join(f"{x['name']}({x['summary'].get(key)}%)" for x in ranked))
+    ranked = sorted(summaries, key=lambda x: x["summary"]["20日年化波动率%"], reverse=True)
+    lines.append("波动率排名：" + " > ".join(f"{x['name']}({x['summary']['20日年化波动率%']}%)" for x in ranked))
+
+    returns = pd.concat({item["name"]: item["returns"] for item in summaries}, axis=1, join="inner")
+    corr = returns.corr().round(2).loc[names, names] if len(returns) >= 5 else None
+    return lines, corr
+
+def cross_market_stats(summaries: List[Dict[str, Any]], summary_days: int = SUMMARY_DAYS) -> str:
+    """计算跨市场统计：区间涨跌幅与波动率排名、日收益率相关系数矩阵"""
+    lines, corr = _cross_market_parts(summaries, summary_days)
+    if corr is not None:
+        lines.append("日收益率相关系数：")
+        lines.append(corr.to_csv())
+    return "\n".join(lines)
+
+def _build_reduce_messages(summaries: List[Dict[str, Any]], token_budget: Optional[int] = None) -> List[Dict[str, str]]:
+    """Reduce步骤：只把各市场摘要和跨市场统计交给大模型，超出token预算时依次压缩排名和相关系数"""
+    ranking_lines, corr = _cross_market_parts(summaries)
+    prompt, _ = build_comparison_prompt(summaries, ranking_lines, corr, token_budget=token_budget)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+def _prepared_from_summaries(summaries: List[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    summaries = [item for item in summaries if item is not None]
+    if len(summaries) < 2:
+        return {"analysis": "至少需要两个市场才能进行对比分析。", "image_path": None, "messages": None}
+    return {"analysis": None, "image_path": None, "messages": _build_reduce_messages(summaries)}
+
+def prepare_comparison(market_names: List[str], csv_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+    """并发加载并摘要多个市场（map），构建只包含摘要的对比分析消息（reduce）
+
+    Args:
+        market_names: 市场名称列表
+        csv_paths: 与market_names一一对应的已解析数据文件路径，传入时不再按名称查找
+
+    Returns:
+        Dict: 包含messages；市场不足两个时messages为None，analysis为提示信息
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(market_names)))) as executor:
+        summaries = list(executor.map(lambda name, path: summarize_market(name, csv_path=path),
+                                      market_names, csv_paths or [None] * len(market_names)))
+    return _prepared_from_summaries(summaries)
+
+async def aprepare_comparison(market_names: List[str], csv_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+    """prepare_comparison的异步版本，各市场的map步骤在共享线程池中并发执行"""
+    paths = csv_paths or [None] * len(market_names)
+    summaries = await asyncio.gather(*(run_blocking(summarize_market, name, csv_path=path)
+                                       for name, path in zip(market_names, paths)))
+    return _prepared_from_summaries(list(summaries))
+
+@functools.lru_cache(maxsize=1)
+def get_compare_flights() -> Tuple[SingleFlight, AsyncSingleFlight]:
+    """同一组市场、同一数据版本的并发对比请求共享一次计算（线程版和协程版）"""
+    config = get_config_section("singleflight")
+    return SingleFlight("compare", config), AsyncSingleFlight("compare", config)
+
+def _comparison_target(market_names: List[str]) -> Tuple[Optional[List[str]], Optional[tuple]]:
+    """解析各市场名，返回 (数据文件路径列表, 合并键)；任一市场找不到数据文件时都为None"""
+    csv_paths = [find_csv_file(name) for name in market_names]
+    if not all(csv_paths):
+        return None, None
+    return csv_paths, ("compare", market_data_key(csv_paths), LOAD_DAYS, SUMMARY_DAYS)
+
+def compare_market_trends(market_names: List[str], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """对比分析多个市场的趋势，同一组市场（与顺序无关）、同一数据版本的并发请求共享一次分析。
+
+    Args:
+        market_names: 市场名称列表
+        timeout: 等待其他请求正在进行的同一对比分析的最长时间（秒），默认使用singleflight配置
+    """
+    csv_paths, key = _comparison_target(market_names)
+    if key is None:
+        return _compare_market_trends(market_names)
+    return dict(get_compare_flights()[0].do(key, _compare_market_trends, market_names, csv_paths, timeout=timeout))
+
+def _compare_market_trends(market_names: List[str], csv_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+    prepared = prepare_comparison(market_names, csv_paths)
+    if prepared["messages"] is None:
+        return {"analysis": prepared["analysis"], "image_path": None}
+
+    try:
+        response = get_llm_client().chat(
+            messages=prepared["messages"],
             temperature=0.7,
             max_tokens=2000 # 适当增加max_tokens以容纳对比分析内容
         )
         analysis_text = response["choices"][0]["message"]["content"]
         return {"analysis": analysis_text, "image_path": None} # 暂时没有图片
     except Exception as e:
-        return {"analysis": f"进行对比分析时发生错误: {str(e)}", "image_path": None} 
\ No newline at end of file
+        return {"analysis": f"进行对比分析时发生错误: {str(e)}", "image_path": None}
+
+async def acompare_market_trends(market_names: List[str], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """compare_market_trends的异步版本，调用方超时或被取消只影响自己"""
+    csv_paths, key = await run_blocking(_comparison_target, market_names)
+    if key is None:
+        return await _acompare_market_trends(market_names)
+    return dict(await get_compare_flights()[1].do(key, _acompare_market_trends, market_names, csv_paths,
+                                                  timeout=timeout))
+
+async def _acompare_market_trends(market_names: List[str], csv_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+    prepared = await aprepare_comparison(market_names, csv_paths)
+    if prepared["messages"] is None:
+        return {"analysis": prepared["analysis"], "image_path": None}
+    try:
+        response = await get_llm_client().achat(messages=prepared["messages"], temperature=0.7, max_tokens=2000)
+        return {"analysis": response["choices"][0]["message"]["content"], "image_path": None}
+    except Exception as e:
+        return {"analysis": f"进行对比分析时发生错误: {str(e)}", "image_path": None}
+
+async def astream_compare_market_trends(market_names: List[str],
+                                        prepared: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """流式对比分析多个市场，逐段产出分析文本"""
+    if prepared is None:
+        prepared = await aprepare_comparison(market_names)
+    if prepared["messages"] is None:
+        yield prepared["analysis"]
+        return
+    try:
+        async for token in get_llm_client().astream_text(prepared["messages"], temperature=0.7, max_tokens=2000):
+            yield token
+    except Exception as e:
+        yield f"进行对比分析时发生错误: {str(e)}"
@@ -1,14 +1,25 @@
 import os
 import pandas as pd
 import difflib
-from pypinyin import lazy_pinyin, Style
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+import functools
 import numpy as np
 import csv 
 import io 
 from collections import deque
 
+from src.utils import metrics
+from src.utils.logger import setup_logger
+
+logger = setup_logger("data_tools")
+
+# pypinyin、langchain_community（向量模型和FAISS）导入耗时较长，只在模糊匹配/语义搜索时才导入
+
+@functools.lru_cache(maxsize=1)
+def _get_embeddings():
+    """加载市场名称语义搜索使用的向量模型，进程内只加载一次"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
 def get_all_market_names(data_dir="data/kline"):
     names = set()
     for root, dirs, files in os.walk(data_dir):
@@ -23,21 +34,49 @@ def get_all_market_names(data_dir="data/kline"):
                 names.add(clean_name)
     return list(names)
 
+def _relative_market_name(csv_path: str, data_dir: str) -> str:
+    """相对data_dir、不含.csv的路径，如'HOT/百战指数'，用于区分不同目录下的同名文件"""
+    return os.path.relpath(csv_path, data_dir)[:-len(".csv")].replace(os.sep, "/")
+
+def list_market_files(data_dir="data/kline") -> dict:
+    """列出数据目录下所有市场的CSV文件，返回 {市场名: 文件路径}
+
+    市场名为去掉.csv的文件名；不同目录下存在同名文件时，这些文件改用相对data_dir的路径（如'HOT/百战指数'）
+    作为市场名并记录警告，不会互相覆盖。
+    """
+    paths_by_stem = {}
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        for file in sorted(files):
+            if file.endswith(".csv"):
+                paths_by_stem.setdefault(file.replace(".csv", ""), []).append(os.path.join(root, file))
+    market_files = {}
+    for stem, paths in paths_by_stem.items():
+        if len(paths) == 1:
+            market_files[stem] = paths[0]
+            continue
+        names = [_relative_market_name(path, data_dir) for path in paths]
+        logger.warning(f"存在{len(paths)}个同名市场文件“{stem}”，改用相对路径区分: {', '.join(names)}")
+        market_files.update(zip(names, paths))
+    return market_files
+
 def initialize_market_vectorstore(data_dir="data/kline"):
     """初始化市场名称的向量存储"""
     market_names = get_all_market_names(data_dir)
     if not market_names:
         return None
 
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_texts(market_names, embeddings)
+    from langchain_community.vectorstores import FAISS
+    vectorstore = FAISS.from_texts(market_names, _get_embeddings())
     return vectorstore
 
+@metrics.timed("data.fuzzy_match")
 def fuzzy_match_market_name(market_name, data_dir="data/kline", threshold=0.6):
     """
     支持市场名的模糊匹配，包括拼音、首字母、相似度等。
     返回最优匹配的文件路径和匹配分数。
     """
+    from pypinyin import lazy_pinyin, Style
     candidates = []
     for root, dirs, files in os.walk(data_dir):
         for file in files:
@@ -67,8 +106,16 @@ def fuzzy_match_market_name(market_name, data_dir="data/kline", threshold=0.6):
         return max(candidates, key=lambda x: x[1])
     return None, 0.0
 
+@metrics.timed("data.find_csv_file")
 def find_csv_file(market_name: str, data_dir="data/kline") -> str | None:
     """使用语义搜索和模糊匹配查找最相关的市场名对应的CSV文件路径。"""
+    # list_market_files为同名文件生成的相对路径市场名，如'HOT/百战指数'
+    if "/" in market_name:
+        root = os.path.abspath(data_dir)
+        csv_path = os.path.join(data_dir, *market_name.split("/")) + ".csv"
+        if os.path.abspath(csv_path).startswith(root + os.sep) and os.path.isfile(csv_path):
+            return csv_path
+
     # 优先精确匹配，兼容旧逻辑
     for root, dirs, files in os.walk(data_dir):
         for file in files:
@@ -92,23 +139,94 @@ def find_csv_file(market_name: str, data_dir="data/kline") -> str | None:
 
     return None
 
+def get_data_version(csv_path: str) -> str:
+    """根据文件修改时间与大小生成数据版本号，数据文件更新后版本号随之变化"""
+    stat = os.stat(csv_path)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def market_data_key(csv_paths: list) -> tuple:
+    """把一组已解析的CSV路径归一化为 (CSV路径, 数据版本) 的有序元组，用作合并并发请求的键
+
+    调用方先用find_csv_file解析市场名并把路径传给后续的读取，键的计算不再重复按名称查找。
+    不同写法指向同一文件的市场名得到相同的键，数据文件更新后键随之变化。
+    """
+    return tuple(sorted({(os.path.normpath(path), get_data_version(path)) for path in csv_paths}))
+
+def read_csv_tail(csv_path: str, num_rows: int) -> pd.DataFrame:
+    """从文件末尾向前分块读取，只解析表头和最后num_rows行，避免读取整个文件"""
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        block_size = 8192
+        data = b""
+        # 多读一个换行符，保证保留下来的num_rows行都是完整的
+        while pos > len(header) and data.count(b"\n") <= num_rows:
+            read_size = min(block_size, pos - len(header))
+            pos -= read_size
+            f.seek(pos)
+            data = f.read(read_size) + data
+            block_size *= 2
+    lines = data.splitlines()[-num_rows:] if num_rows > 0 else []
+    with metrics.span("data.parse_csv_tail") as span:
+        df = pd.read_csv(io.BytesIO(header + b"\n".join(lines) + b"\n"))
+        span.add("rows", len(df))
+        span.add("bytes", len(data))
+    return df
+
+def stack_series_tails(frames: list, column: str, length: int) -> np.ndarray:
+    """把多个序列某一列的末尾length行按末尾对齐堆叠成 序列数×length 的矩阵，长度不足的在前面补NaN"""
+    matrix = np.full((len(frames), length), np.nan)
+    for i, df in enumerate(frames):
+        values = df[column].to_numpy(dtype=np.float64)[-length:]
+        if len(values):
+            matrix[i, length - len(values):] = values
+    return matrix
+
+def normalize_daily_bars(df: pd.DataFrame, drop_today: bool = True) -> pd.DataFrame:
+    """规范日K线：date转为datetime，按日期去重（保留最后一条）并排序
+
+    Args:
+        df: K线数据
+        drop_today: 是否去掉日期为今天的K线（抓取时当天还未收盘，成交量等只是部分数据）
+
+    Returns:
+        pd.DataFrame: 规范后的K线数据
+    """
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"])
+    df = df.drop_duplicates("date", keep="last").sort_values("date")
+    if drop_today:
+        df = df[df["date"] < pd.Timestamp.now().normalize()]
+    return df.reset_index(drop=True)
+
+def common_completed_date(last_dates, max_lag_days: int = 3):
+    """多个序列共同的最新已完成交易日，即各序列最后日期中的最小值
+
+    部分序列（如大盘、HOT指数）可能多出一根未收盘的K线，对齐到这个日期后所有序列按同一天比较。
+    最后日期比最新日期落后超过max_lag_days天的序列视为已停止更新，不参与计算，以免拖住所有序列。
+
+    Returns:
+        pd.Timestamp | None: 对齐日期，没有有效日期时返回None
+    """
+    dates = pd.to_datetime(pd.Series(list(last_dates), dtype=object)).dropna()
+    if dates.empty:
+        return None
+    return dates[dates >= dates.max() - pd.Timedelta(days=max_lag_days)].min()
+
+@metrics.timed("data.read_market_data")
 def read_market_data(market_name, data_dir="data/kline", num_days: int | None = None):
     csv_path = find_csv_file(market_name, data_dir)
     if not csv_path:
         return None
-    
+    return read_csv_data(csv_path, num_days)
+
+def read_csv_data(csv_path: str, num_days: int | None = None):
+    """读取已解析出路径的K线文件，num_days为None时读取整个文件；调用方已有csv_path时不必再按名称查找"""
     if num_days is not None and num_days > 0:
         try:
-            # 使用deque高效读取文件末尾的num_days行数据
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            if len(lines) > num_days:
-                # 保证header+末尾数据
-                lines = [lines[0]] + lines[-num_days:]
-            data_str = "".join(lines)
-            print("header:", lines[0].strip())
-            df = pd.read_csv(io.StringIO(data_str))
-            print("df.columns:", df.columns.tolist())
+            # 从文件末尾高效读取num_days行数据
+            df = read_csv_tail(csv_path, num_days)
             if 'date' not in df.columns:
                 raise ValueError(f"CSV文件缺少'date'列，实际列名: {df.columns.tolist()}")
             # 确保日期是datetime类型并排序
@@ -123,4 +241,4 @@ def read_market_data(market_name, data_dir="data/kline", num_days: int | None =
         df = pd.read_csv(csv_path)
         df['date'] = pd.to_datetime(df['date'])
         df = df.sort_values('date')
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,298 @@
+"""
+按token预算构建紧凑的分析Prompt
+
+Prompt由若干段落组成，每段按从详细到精简给出多个版本，并带有优先级。
+构建时先使用最详细的版本，超出预算时从优先级最低的段落开始逐级降级（可选段落最终可被删除），
+直到Prompt落入预算。数值统一做压缩编码：价格保留有效数字，涨跌、偏离用相对百分比，
+用区间统计代替逐日原始K线。
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from src.utils.config import get_config_section
+from src.utils.logger import setup_logger
+from src.utils.tokenizer import count_tokens
+
+logger = setup_logger("prompt_builder")
+
+DEFAULT_PROMPT_CONFIG = {
+    "market_budget": 700,     # 单市场分析Prompt的token预算
+    "compare_budget": 700,    # 多市场对比Prompt的token预算
+}
+
+ANALYSIS_TASKS = (
+    "请分析：1.短期趋势（现价与短期均线） 2.中期趋势（均线排列与交叉） 3.关键支撑位和压力位 "
+    "4.风险提示（波动、成交量变化，如有VaR/CVaR请引用具体数值） 5.简明投资建议。"
+    "用专业易懂的中文回答，逻辑清晰。"
+)
+
+
+class PromptSection:
+    def __init__(self, name: str, variants: Sequence[str], priority: int = 0, required: bool = False):
+        """
+        Args:
+            name: 段落名称，用于日志
+            variants: 从详细到精简排列的多个版本
+            priority: 优先级，数值越大越先被降级
+            required: 是否必须保留，非必须段落在最精简版本之后还可以被删除
+        """
+        self.name = name
+        self.variants = [v for v in variants if v]
+        if not required or not self.variants:
+            self.variants.append("")
+        self.priority = priority
+        self.required = required
+
+
+def build_prompt(sections: List[PromptSection], budget: Optional[int]) -> Tuple[str, Dict]:
+    """按预算组装Prompt
+
+    Args:
+        sections: 按输出顺序排列的段落
+        budget: token预算，None表示不限制
+
+    Returns:
+        Tuple[str, Dict]: Prompt文本，以及包含tokens、budget、各段落所用版本的构建信息
+    """
+    levels = [0] * len(sections)
+
+    def render() -> str:
+        return "\n".join(s.variants[level] for s, level in zip(sections, levels) if s.variants[level])
+
+    text = render()
+    tokens = count_tokens(text)
+    while budget is not None and tokens > budget:
+        candidates = [i for i, s in enumerate(sections) if levels[i] < len(s.variants) - 1]
+        if not candidates:
+            logger.warning(f"Prompt已降到最精简仍超出预算: {tokens} > {budget}")
+            break
+        # 优先级最低（数值最大）的段落先降级，同优先级时靠后的段落先降级
+        target = max(candidates, key=lambda i: (sections[i].priority, i))
+        levels[target] += 1
+        text = render()
+        tokens = count_tokens(text)
+
+    info = {
+        "tokens": tokens,
+        "budget": budget,
+        "levels": {s.name: ("dropped" if not s.variants[level] else level) for s, level in zip(sections, levels)},
+    }
+    degraded = {name: level for name, level in info["levels"].items() if level != 0}
+    logger.info(f"Prompt构建完成: {tokens} tokens（预算{budget}）" + (f"，降级: {degraded}" if degraded else ""))
+    return text, info
+
+
+def fmt_num(value, digits: int = 5) -> str:
+    """按有效数字压缩数值，去掉多余的0"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    value = float(value)
+    if value == 0:
+        return "0"
+    magnitude = int(math.floor(math.log10(abs(value))))
+    decimals = max(0, digits - 1 - magnitude)
+    text = f"{value:.{decimals}f}"
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+
+def fmt_pct(value, decimals: int = 1) -> str:
+    """带符号的百分比"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    return f"{value:+.{decimals}f}%"
+
+
+def fmt_volume(value) -> str:
+    """成交量/成交额用万、亿为单位，保留3位有效数字"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    value = float(value)
+    for unit, scale in (("亿", 1e8), ("万", 1e4)):
+        if abs(value) >= scale:
+            return f"{fmt_num(value / scale, 3)}{unit}"
+    return fmt_num(value, 3)
+
+
+def _pct_change(close: pd.Series, days: int) -> Optional[float]:
+    if len(close) <= days or close.iloc[-days - 1] == 0:
+        return None
+    return (close.iloc[-1] / close.iloc[-days - 1] - 1) * 100
+
+
+def _overview_section(df: pd.DataFrame, market_name: str) -> PromptSection:
+    close = df["close"]
+    latest = df.iloc[-1]
+    recent = df.tail(30)
+    low, high = recent["low"].min(), recent["high"].max()
+    position = (latest["close"] - low) / (high - low) * 100 if high > low else 50.0
+    volume_avg = df["volume"].iloc[-21:-1].mean()
+    volume_change = (latest["volume"] / volume_avg - 1) * 100 if volume_avg else None
+    changes = "，".join(f"{label}{fmt_pct(_pct_change(close, days), 2 if days == 1 else 1)}"
+                       for label, days in (("日", 1), ("5日", 5), ("20日", 20), ("60日", 60))
+                       if _pct_change(close, days) is not None)
+    text = (f"市场：{market_name}，截至{latest['date'].strftime('%Y-%m-%d')}\n"
+            f"收盘{fmt_num(latest['close'])}，涨跌：{changes}\n"
+            f"近30日区间{fmt_num(low)}~{fmt_num(high)}，现价位于区间{position:.0f}%；"
+            f"成交量{fmt_volume(latest['volume'])}（较前20日均量{fmt_pct(volume_change, 0)}）")
+    return PromptSection("overview", [text], priority=0, required=True)
+
+
+def _indicator_section(df: pd.DataFrame) -> PromptSection:
+    latest = df.iloc[-1]
+    close = latest["close"]
+    ma = {k: latest[k] for k in ("MA5", "MA10", "MA20")}
+    bias = "/".join(fmt_pct((close / v - 1) * 100) for v in ma.values())
+    order = "多头排列" if ma["MA5"] > ma["MA10"] > ma["MA20"] else "空头排列" if ma["MA5"] < ma["MA10"] < ma["MA20"] else "交织"
+    compact = (f"MA5/10/20={'/'.join(fmt_num(v) for v in ma.values())}（现价偏离{bias}，{order}），"
+               f"RSI14={latest['RSI']:.0f}")
+    recent = df.tail(5).dropna(subset=["MA5", "MA20", "RSI"])
+    detailed = compact
+    if len(recent) > 1:
+        cross = recent["MA5"] - recent["MA20"]
+        cross_note = ""
+        if (cross.iloc[0] < 0) != (cross.iloc[-1] < 0):
+            cross_note = "，近5日MA5" + ("上穿" if cross.iloc[-1] > 0 else "下穿") + "MA20"
+        detailed += (f"\n近{len(recent)}日RSI：{','.join(f'{v:.0f}' for v in recent['RSI'])}；"
+                     f"MA5：{','.join(fmt_num(v, 4) for v in recent['MA5'])}{cross_note}")
+    return PromptSection("indicators", [detailed, compact], priority=1, required=True)
+
+
+def _levels_section(df: pd.DataFrame) -> PromptSection:
+    parts = []
+    for days in (20, 60, 120):
+        if len(df) >= days:
+            window = df.tail(days)
+            parts.append(f"{days}日低{fmt_num(window['low'].min())}/高{fmt_num(window['high'].max())}")
+    return PromptSection("levels", ["支撑压力参考：" + "，".join(parts)] if parts else [], priority=2)
+
+
+def _risk_section(risk_summary: Optional[str]) -> PromptSection:
+    if not risk_summary:
+        return PromptSection("risk", [], priority=4)
+    lines = risk_summary.splitlines()
+    horizon_lines = [line for line in lines if "持有期" in line]
+    variants = ["量化风险（蒙特卡洛，VaR/CVaR为亏损幅度）：\n" + risk_summary]
+    if horizon_lines:
+        variants.append("量化风险（VaR/CVaR为亏损幅度）：\n" + "\n".join(horizon_lines))
+        if len(horizon_lines) > 2:
+            variants.append("量化风险（VaR/CVaR为亏损幅度）：\n" + "\n".join([horizon_lines[0], horizon_lines[-1]]))
+    # 分析要求引用VaR/CVaR，风险段落最多压缩到首尾两个持有期，不整段删除
+    return PromptSection("risk", variants, priority=4, required=True)
+
+
+def _recent_section(df: pd.DataFrame) -> PromptSection:
+    """近期走势：逐日收盘相对现价的偏离，逐级压缩为更短的窗口和周线"""
+    close = df["close"]
+    latest = close.iloc[-1]
+
+    def daily(days: int) -> str:
+        window = df.tail(days)
+        rel = ",".join(f"{(v / latest - 1) * 100:.1f}" for v in window["close"])
+        return f"近{len(window)}日收盘（相对现价%，由远及近）：{rel}"
+
+    weekly = df.tail(30).set_index("date")["close"].resample("W").last().dropna()
+    weekly_changes = weekly.pct_change().dropna() * 100
+    variants = [daily(20), daily(10)]
+    if len(weekly_changes):
+        variants.append("近几周周涨跌：" + ",".join(fmt_pct(v) for v in weekly_changes))
+    return PromptSection("recent", variants, priority=3)
+
+
+def build_market_trend_prompt(df: pd.DataFrame,
+                              market_name: str,
+                              risk_summary: Optional[str] = None,
+                              token_budget: Optional[int] = None) -> Tuple[str, Dict]:
+    """构建单市场趋势分析Prompt
+
+    Args:
+        df: 已计算MA5/MA10/MA20/RSI列的K线数据，date为datetime类型
+        market_name: 市场名称
+        risk_summary: 风险模拟摘要
+        token_budget: token预算，默认读取config.yaml中prompt.market_budget
+
+    Returns:
+        Tuple[str, Dict]: Prompt文本和构建信息
+    """
+    if token_budget is None:
+        token_budget = {**DEFAULT_PROMPT_CONFIG, **get_config_section("prompt")}["market_budget"]
+    sections = [
+        PromptSection("header", [f"你是专业的市场分析师，请根据以下数据分析{market_name}的当前趋势并给出简要展望。"
+                                 "价格单位为元，百分比均为相对值。"], required=True),
+        _overview_section(df, market_name),
+        _indicator_section(df),
+        _levels_section(df),
+        _risk_section(risk_summary),
+        _recent_section(df),
+        PromptSection("tasks", [ANALYSIS_TASKS], required=True),
+    ]
+    return build_prompt(sections, token_budget)
+
+
+def build_short_history_prompt(df: pd.DataFrame, market_name: str) -> str:
+    """历史数据不足以计算指标时的精简Prompt"""
+    rows = "\n".join(f"{row.date.strftime('%m-%d')},{fmt_num(row.close)},{fmt_volume(row.volume)}"
+                     for row in df.itertuples(index=False))
+    return (f"以下是{market_name}最近{len(df)}天的K线（日期,收盘,成交量）：\n{rows}\n"
+            "数据不足，无法进行详细技术分析。请用中文简要分析该市场的趋势，并给出简要展望。")
+
+
+def _summary_table(summaries: List[Dict], columns: List[str]) -> str:
+    """把各市场摘要压缩成表格：列名只出现一次，价格按有效数字、百分比保留一位小数"""
+    header = "市场," + ",".join(c.replace("%", "") for c in columns)
+    rows = []
+    for item in summaries:
+        cells = []
+        for column in columns:
+            value = item["summary"].get(column)
+            if value is None:
+                cells.append("-")
+            elif column.endswith("%"):
+                cells.append(f"{value:.2f}" if column.startswith("1日") else f"{value:.1f}")
+            else:
+                cells.append(fmt_num(value))
+        rows.append(f"{item['name']}," + ",".join(cells))
+    return header + "\n" + "\n".join(rows)
+
+
+def build_comparison_prompt(summaries: List[Dict],
+                            ranking_lines: List[str],
+                            corr: Optional[pd.DataFrame],
+                            token_budget: Optional[int] = None) -> Tuple[str, Dict]:
+    """构建多市场对比Prompt
+
+    Args:
+        summaries: 各市场摘要，每项包含name和summary（指标字典，见compare_analyzer.summarize_market）
+        ranking_lines: 跨市场排名
+        corr: 日收益率相关系数矩阵
+        token_budget: token预算，默认读取config.yaml中prompt.compare_budget
+
+    Returns:
+        Tuple[str, Dict]: Prompt文本和构建信息
+    """
+    if token_budget is None:
+        token_budget = {**DEFAULT_PROMPT_CONFIG, **get_config_section("prompt")}["compare_budget"]
+    dates = {item["summary"].get("最新日期") for item in summaries}
+    columns = [c for c in summaries[0]["summary"] if c != "最新日期"]
+    # 精简版只保留涨跌、回撤、波动率、RSI和量能变化
+    core = [c for c in columns if c.endswith("涨跌幅%") or c in ("收盘价", "RSI14") or "回撤" in c
+            or "波动率" in c or "均量" in c]
+    title = "各市场摘要（涨跌、偏离、波动率等为%）" + (f"，截至{dates.pop()}" if len(dates) == 1 else "") + "："
+    sections = [
+        PromptSection("header", ["你是专业的市场分析师，请根据以下多个市场的统计摘要进行对比分析，"
+                                 "着重对比近期走势、波动性、成交量变化，指出异同点和可能的发展趋势。"], required=True),
+        PromptSection("summaries", [title + "\n" + _summary_table(summaries, columns),
+                                    title + "\n" + _summary_table(summaries, core)], priority=1, required=True),
+        PromptSection("rankings", ["\n".join(ranking_lines)] if ranking_lines else [], priority=3),
+    ]
+    if corr is not None and len(corr) > 1:
+        names = list(corr.index)
+        pairs = [(names[i], names[j], corr.iloc[i, j]) for i in range(len(names)) for j in range(i + 1, len(names))]
+        pairs.sort(key=lambda p: p[2], reverse=True)
+        full = "收益率相关系数：" + "，".join(f"{a}-{b}:{c:.2f}" for a, b, c in pairs)
+        extremes = pairs[:3] + [p for p in pairs[-3:] if p not in pairs[:3]]
+        short = "相关性最高/最低的市场对：" + "，".join(f"{a}-{b}:{c:.2f}" for a, b, c in extremes)
+        sections.append(PromptSection("correlation", [full, short], priority=2))
+    sections.append(PromptSection("tasks", ["请用专业且易懂的语言进行分析。"], required=True))
+    return build_prompt(sections, token_budget)
@@ -0,0 +1,107 @@
+"""
+预生成分析报告存储
+
+每个市场一份JSON报告（指标快照、K线图路径、大模型分析文本、所用Prompt），以数据文件的版本号标记。
+数据文件更新后版本号随之变化，旧报告自动失效；版本一致的报告可以直接用于回答，无需重新计算和请求大模型。
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.tools.data_tools import get_data_version
+from src.utils import metrics
+from src.utils.logger import setup_logger
+
+logger = setup_logger("report_store")
+
+DEFAULT_REPORT_CONFIG = {
+    "enabled": True,
+    "output_dir": "reports/daily",
+    # 预生成报告的市场，为相对数据目录的glob模式：大盘、HOT指数、各一级板块
+    "markets": ["大盘.csv", "HOT/*.csv", "*/*.csv"],
+    "max_concurrency": 4,        # 同时进行的大模型请求数
+}
+
+
+class ReportStore:
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Args:
+            config: 报告配置，即config.yaml中的reports部分，缺省项使用DEFAULT_REPORT_CONFIG
+        """
+        self.config = {**DEFAULT_REPORT_CONFIG, **(config or {})}
+        self.output_dir = Path(self.config["output_dir"])
+        self._lock = threading.Lock()
+        self._memory: Dict[str, Dict[str, Any]] = {}
+
+    def report_path(self, csv_path: str) -> Path:
+        abs_path = os.path.normpath(os.path.abspath(csv_path))
+        digest = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:12]
+        return self.output_dir / f"{Path(csv_path).stem}_{digest}.json"
+
+    def _load(self, csv_path: str) -> Optional[Dict[str, Any]]:
+        path = self.report_path(csv_path)
+        if not path.exists():
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"读取预生成报告{path}失败: {str(e)}")
+            return None
+
+    def get(self, csv_path: str, data_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """返回与当前数据版本一致的报告，没有报告或报告已过期时返回None
+
+        Args:
+            csv_path: 市场数据文件路径
+            data_version: 当前数据版本，默认根据文件计算
+        """
+        if not self.config["enabled"]:
+            return None
+        report = self._lookup(csv_path, data_version)
+        metrics.inc("cache_requests_total", cache="report", result="miss" if report is None else "hit")
+        return report
+
+    def _lookup(self, csv_path: str, data_version: Optional[str]) -> Optional[Dict[str, Any]]:
+        try:
+            version = data_version or get_data_version(csv_path)
+        except OSError:
+            return None
+        key = os.path.normpath(os.path.abspath(csv_path))
+        with self._lock:
+            report = self._memory.get(key)
+        if report is None or report.get("data_version") != version:
+            # 报告可能由抓取后的流水线在其他进程中更新，内存中的版本不一致时重新读取文件
+            report = self._load(csv_path)
+            if report is None:
+                return None
+            with self._lock:
+                self._memory[key] = report
+        if report.get("data_version") != version or not report.get("analysis"):
+            return None
+        return report
+
+    def put(self, report: Dict[str, Any]):
+        """写入报告（report需包含csv_path和data_version），先写临时文件再替换，读取方不会读到半个文件"""
+        path = self.report_path(report["csv_path"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._memory[os.path.normpath(os.path.abspath(report["csv_path"]))] = report
+
+    def list_reports(self) -> List[Dict[str, Any]]:
+        """列出所有已保存的报告（不检查是否过期）"""
+        reports = []
+        for path in sorted(self.output_dir.glob("*.json")):
+            if path.name.startswith("_"):
+                continue
+            try:
+                reports.append(json.loads(path.read_text(encoding="utf-8")))
+            except Exception:
+                continue
+        return reports
@@ -0,0 +1,340 @@
+"""
+风险模拟工具
+
+基于历史K线对单个市场或多个板块组成的组合进行蒙特卡洛价格路径模拟，
+计算不同持有期的VaR/CVaR与价格概率锥。模拟以 路径数×持有期 的NumPy数组批量完成，
+并按块生成随机数以控制内存占用。
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.tools.data_tools import find_csv_file, get_data_version, read_csv_data
+
+DEFAULT_RISK_CONFIG = {
+    "method": "bootstrap",          # bootstrap / gbm / garch
+    "n_paths": 100000,
+    "horizon": 30,
+    "report_horizons": [1, 5, 10, 30],
+    "confidence_levels": [0.95, 0.99],
+    "cone_quantiles": [0.05, 0.25, 0.5, 0.75, 0.95],
+    "lookback_days": 365,
+    "chunk_size": 20000,
+    "cache_size": 128,
+    "seed": None,
+    "garch": {"alpha": 0.08, "beta": 0.9},
+}
+
+SIMULATION_METHODS = ("bootstrap", "gbm", "garch")
+
+
+def compute_log_returns(close: Sequence[float]) -> np.ndarray:
+    """由收盘价序列计算对数收益率，剔除非正价格和无效值"""
+    prices = np.asarray(close, dtype=np.float64)
+    prices = prices[np.isfinite(prices) & (prices > 0)]
+    if len(prices) < 2:
+        return np.empty(0)
+    return np.diff(np.log(prices))
+
+
+def basket_log_returns(frames: Dict[str, pd.DataFrame], weights: Optional[Sequence[float]] = None) -> np.ndarray:
+    """计算多个市场按权重（每日再平衡）组成组合的对数收益率
+
+    Args:
+        frames: 市场名称到K线数据的映射
+        weights: 各市场权重，默认等权
+
+    Returns:
+        np.ndarray: 组合的日对数收益率
+    """
+    closes = pd.concat(
+        {name: df.drop_duplicates(subset=['date']).set_index('date')['close'] for name, df in frames.items()},
+        axis=1,
+        join="inner",
+    ).sort_index()
+    simple_returns = closes.pct_change().iloc[1:].to_numpy(dtype=np.float64)
+    if weights is None:
+        w = np.full(closes.shape[1], 1.0 / closes.shape[1])
+    else:
+        w = np.asarray(weights, dtype=np.float64)
+        if len(w) != closes.shape[1]:
+            raise ValueError(f"权重数量({len(w)})与市场数量({closes.shape[1]})不一致")
+        w = w / w.sum()
+    portfolio = simple_returns @ w
+    portfolio = portfolio[np.isfinite(portfolio) & (portfolio > -1)]
+    return np.log1p(portfolio)
+
+
+def _garch_initial_variance(log_returns: np.ndarray, alpha: float, beta: float) -> tuple:
+    """使用方差目标法确定GARCH(1,1)参数，并沿历史收益率滤波得到最新的条件方差"""
+    mu = log_returns.mean()
+    eps = log_returns - mu
+    long_run_var = eps.var()
+    omega = long_run_var * max(1.0 - alpha - beta, 1e-6)
+    h = long_run_var
+    for e in eps:
+        h = omega + alpha * e * e + beta * h
+    return mu, omega, h
+
+
+def simulate_cumulative_returns(log_returns: np.ndarray,
+                                n_paths: int,
+                                horizon: int,
+                                method: str = "bootstrap",
+                                chunk_size: int = 20000,
+                                seed: Optional[int] = None,
+                                garch_params: Optional[Dict] = None) -> np.ndarray:
+    """批量模拟未来horizon天的累计对数收益率
+
+    Args:
+        log_returns: 历史日对数收益率
+        n_paths: 模拟路径数
+        horizon: 模拟天数
+        method: 模拟方法，bootstrap（历史收益重采样）、gbm（几何布朗运动）或garch（GARCH(1,1)波动率聚集）
+        chunk_size: 每块生成的路径数，用于限制随机数中间数组的内存
+        seed: 随机种子
+        garch_params: GARCH参数，包含alpha和beta
+
+    Returns:
+        np.ndarray: 形状为(n_paths, horizon)的累计对数收益率（float32）
+    """
+    if method not in SIMULATION_METHODS:
+        raise ValueError(f"不支持的模拟方法: {method}，可选: {', '.join(SIMULATION_METHODS)}")
+    log_returns = np.asarray(log_returns, dtype=np.float64)
+    log_returns = log_returns[np.isfinite(log_returns)]
+    if len(log_returns) < 2:
+        raise ValueError("历史收益率数据不足，无法进行风险模拟")
+
+    rng = np.random.default_rng(seed)
+    out = np.empty((n_paths, horizon), dtype=np.float32)
+    mu, sigma = log_returns.mean(), log_returns.std(ddof=1)
+    if method == "garch":
+        params = garch_params or DEFAULT_RISK_CONFIG["garch"]
+        g_mu, omega, h0 = _garch_initial_variance(log_returns, params["alpha"], params["beta"])
+
+    for start in range(0, n_paths, chunk_size):
+        m = min(chunk_size, n_paths - start)
+        if method == "bootstrap":
+            steps = log_returns[rng.integers(0, len(log_returns), size=(m, horizon))]
+        elif method == "gbm":
+            steps = rng.standard_normal((m, horizon)) * sigma + mu
+        else:
+            # GARCH只能按时间步递推，但每一步在所有路径上向量化
+            steps = rng.standard_normal((m, horizon))
+            h = np.full(m, h0)
+            for t in range(horizon):
+                eps = steps[:, t] * np.sqrt(h)
+                steps[:, t] = g_mu + eps
+                h = omega + params["alpha"] * eps * eps + params["beta"] * h
+        np.cumsum(steps, axis=1, out=steps)
+        out[start:start + m] = steps
+    return out
+
+
+def summarize_paths(cum_log_returns: np.ndarray,
+                    last_price: float,
+                    report_horizons: Sequence[int],
+                    confidence_levels: Sequence[float],
+                    cone_quantiles: Sequence[float]) -> Dict:
+    """根据模拟路径计算各持有期的VaR/CVaR及价格概率锥
+
+    VaR与CVaR以正数百分比表示的亏损幅度给出。
+    """
+    horizon = cum_log_returns.shape[1]
+    horizons = sorted({h for h in report_horizons if 1 <= h <= horizon} | {horizon})
+    # 只对需要报告的持有期转换为简单收益率
+    simple = np.expm1(cum_log_returns[:, [h - 1 for h in horizons]].astype(np.float64))
+
+    metrics = {}
+    for j, h in enumerate(horizons):
+        col = simple[:, j]
+        item = {
+            "expected_return": float(col.mean() * 100),
+            "prob_loss": float((col < 0).mean() * 100),
+        }
+        for level in confidence_levels:
+            threshold = np.quantile(col, 1 - level)
+            tail = col[col <= threshold]
+            pct = int(round(level * 100))
+            item[f"VaR{pct}"] = float(-threshold * 100)
+            item[f"CVaR{pct}"] = float(-tail.mean() * 100) if len(tail) else float(-threshold * 100)
+        metrics[h] = item
+
+    cone = np.quantile(cum_log_returns, cone_quantiles, axis=0)
+    cone_prices = last_price * np.exp(cone)
+    return {
+        "horizons": horizons,
+        "metrics": metrics,
+        "cone": {
+            "quantiles": list(cone_quantiles),
+            "prices": cone_prices.round(4).tolist(),  # 形状: 分位数 × 天数
+        },
+    }
+
+
+class RiskSimulator:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline"):
+        """初始化风险模拟器
+
+        Args:
+            config: 风险模拟配置，即config.yaml中的risk部分，缺省项使用DEFAULT_RISK_CONFIG
+            data_dir: K线数据目录
+        """
+        self.config = {**DEFAULT_RISK_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        # 单例在线程池中被不同市场的请求并发使用，LRU的读取、更新和淘汰都需要加锁
+        self._lock = threading.Lock()
+
+    def _options(self, overrides: Dict) -> Dict:
+        options = dict(self.config)
+        options.update({k: v for k, v in overrides.items() if v is not None})
+        return options
+
+    def _cache_get(self, key: tuple) -> Optional[Dict]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key: tuple, result: Dict):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.config["cache_size"]:
+                self._cache.popitem(last=False)
+
+    def _run(self, log_returns: np.ndarray, last_price: float, options: Dict) -> Dict:
+        paths = simulate_cumulative_returns(
+            log_returns,
+            n_paths=options["n_paths"],
+            horizon=options["horizon"],
+            method=options["method"],
+            chunk_size=options["chunk_size"],
+            seed=options["seed"],
+            garch_params=options["garch"],
+        )
+        result = summarize_paths(
+            paths,
+            last_price,
+            options["report_horizons"],
+            options["confidence_levels"],
+            options["cone_quantiles"],
+        )
+        result.update({
+            "method": options["method"],
+            "n_paths": options["n_paths"],
+            "last_price": float(last_price),
+            "sample_size": int(len(log_returns)),
+        })
+        return result
+
+    def simulate_frame(self, df: pd.DataFrame, market_name: str, data_version: Optional[str] = None,
+                       **overrides) -> Dict:
+        """对已加载的单个市场K线数据进行风险模拟
+
+        Args:
+            df: K线数据
+            market_name: 市场名称
+            data_version: 数据版本号，提供时按版本缓存结果
+            **overrides: 覆盖配置的参数，如method、n_paths、horizon
+
+        Returns:
+            Dict: 模拟结果
+        """
+        options = self._options(overrides)
+        key = None
+        if data_version is not None:
+            key = ((market_name,), None, data_version, _options_key(options))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        close = df['close'].tail(options["lookback_days"] + 1)
+        result = self._run(compute_log_returns(close), float(df['close'].iloc[-1]), options)
+        result["markets"] = [market_name]
+        if key is not None:
+            self._cache_put(key, result)
+        return result
+
+    def simulate(self, market_names: List[str], weights: Optional[Sequence[float]] = None, **overrides) -> Dict:
+        """对单个市场或多个板块组成的组合进行风险模拟
+
+        Args:
+            market_names: 市场名称列表
+            weights: 组合权重，默认等权
+            **overrides: 覆盖配置的参数，如method、n_paths、horizon
+
+        Returns:
+            Dict: 模拟结果，组合的价格以初始净值1.0计
+        """
+        options = self._options(overrides)
+        paths = []
+        for name in market_names:
+            csv_path = find_csv_file(name, self.data_dir)
+            if not csv_path:
+                raise ValueError(f"未找到{name}的数据文件")
+            paths.append(csv_path)
+        versions = tuple(get_data_version(p) for p in paths)
+        key = (tuple(market_names), tuple(weights) if weights is not None else None, versions, _options_key(options))
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        frames = {}
+        for name, csv_path in zip(market_names, paths):
+            df = read_csv_data(csv_path, num_days=options["lookback_days"] + 1)
+            if df is None or df.empty:
+                raise ValueError(f"读取{name}的数据失败")
+            frames[name] = df
+
+        if len(frames) == 1:
+            df = next(iter(frames.values()))
+            log_returns = compute_log_returns(df['close'])
+            last_price = float(df['close'].iloc[-1])
+        else:
+            log_returns = basket_log_returns(frames, weights)
+            last_price = 1.0
+        result = self._run(log_returns, last_price, options)
+        result["markets"] = list(market_names)
+        self._cache_put(key, result)
+        return result
+
+
+def _options_key(options: Dict) -> tuple:
+    """把模拟参数转换为可哈希的缓存键"""
+    return (
+        options["method"], options["n_paths"], options["horizon"], options["lookback_days"],
+        tuple(options["report_horizons"]), tuple(options["confidence_levels"]),
+        tuple(options["cone_quantiles"]), options["seed"],
+        tuple(sorted(options["garch"].items())),
+    )
+
+
+def format_risk_summary(result: Dict) -> str:
+    """将风险模拟结果格式化为可嵌入Prompt的中文摘要"""
+    method_names = {"bootstrap": "历史收益重采样", "gbm": "几何布朗运动", "garch": "GARCH(1,1)"}
+    lines = [
+        f"模拟方法：{method_names.get(result['method'], result['method'])}，"
+        f"{result['n_paths']}条路径，基于{result['sample_size']}个历史日收益率"
+    ]
+    for h in result["horizons"]:
+        m = result["metrics"][h]
+        risk_parts = []
+        for key, value in m.items():
+            if key.startswith("VaR") or key.startswith("CVaR"):
+                risk_parts.append(f"{key}={value:.2f}%")
+        lines.append(
+            f"- {h}天持有期：预期收益{m['expected_return']:.2f}%，亏损概率{m['prob_loss']:.1f}%，"
+            + "，".join(risk_parts)
+        )
+    cone = result["cone"]
+    quantiles = cone["quantiles"]
+    last_prices = [row[-1] for row in cone["prices"]]
+    cone_str = "，".join(f"P{int(round(q * 100))}={p:.2f}" for q, p in zip(quantiles, last_prices))
+    lines.append(f"- {result['horizons'][-1]}天后价格概率锥：{cone_str}")
+    return "\n".join(lines)
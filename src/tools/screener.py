@@ -0,0 +1,316 @@
+"""
+市场筛选工具
+
+为每个K线序列（包括HOT指数和各级板块）预先计算区间涨跌幅、技术指标、成交量变化、
+波动率等指标，汇总成一张内存中的指标表，并支持声明式的筛选条件与排序，
+用于回答“哪些板块最近一周涨幅最大且RSI低于30”这类全市场问题。
+各序列按日期去重，并截断到所有序列共同的最新已完成交易日后再计算，区间涨跌幅按同一天比较。
+"""
+import json
+import os
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from src.tools.data_tools import (common_completed_date, get_data_version, list_market_files, normalize_daily_bars,
+                                  read_csv_tail, stack_series_tails)
+from src.utils.logger import setup_logger
+
+logger = setup_logger("screener")
+
+# 指标字段及说明，供工具描述和参数校验使用
+METRIC_FIELDS = {
+    "close": "最新收盘价",
+    "return_1d": "日涨跌幅(%)",
+    "return_5d": "近5日（约一周）涨跌幅(%)",
+    "return_20d": "近20日（约一月）涨跌幅(%)",
+    "return_60d": "近60日涨跌幅(%)",
+    "rsi_14": "14日RSI",
+    "ma5_bias": "收盘价相对MA5的偏离(%)",
+    "ma20_bias": "收盘价相对MA20的偏离(%)",
+    "volume_change_5d": "近5日均量相对此前20日均量的变化(%)",
+    "amount_change_5d": "近5日均额相对此前20日均额的变化(%)",
+    "volatility_20d": "20日年化波动率(%)",
+    "drawdown_60d": "相对60日最高价的回撤(%)",
+}
+
+TEXT_FIELDS = {
+    "market": "市场名称",
+    "category": "所属分类",
+    "date": "最新日期",
+}
+
+OPERATORS = (">", ">=", "<", "<=", "==", "!=", "between", "in", "contains")
+
+DEFAULT_SCREENER_CONFIG = {
+    "tail_rows": 130,          # 计算指标需要读取的末尾行数
+    "refresh_interval": 5.0,   # 两次检查数据版本之间的最小间隔（秒）
+    "max_lag_days": 3,         # 落后最新日期超过该天数的序列视为停止更新，不参与确定对齐日期
+}
+
+# 读取末尾数据时多读的行数，弥补按日期去重和截断到对齐日期去掉的行
+TAIL_SLACK_ROWS = 10
+
+FilterSpec = Union[Dict[str, Any], Sequence[Any]]
+
+
+def compute_metrics(frames: Dict[str, pd.DataFrame], tail_rows: int = 130) -> pd.DataFrame:
+    """对多个序列向量化计算筛选指标
+
+    Args:
+        frames: 市场名称到K线数据的映射，应已按日期去重并对齐到同一交易日
+        tail_rows: 参与计算的末尾行数
+
+    Returns:
+        pd.DataFrame: 每个市场一行的指标表
+    """
+    names = list(frames.keys())
+    if not names:
+        return pd.DataFrame(columns=["market", "date", *METRIC_FIELDS])
+    dfs = [frames[name] for name in names]
+    close = stack_series_tails(dfs, "close", tail_rows)
+    volume = stack_series_tails(dfs, "volume", tail_rows)
+    amount = stack_series_tails(dfs, "amount", tail_rows)
+    latest = close[:, -1]
+
+    with warnings.catch_warnings(), np.errstate(divide="ignore", invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        def period_return(days: int) -> np.ndarray:
+            return (latest / close[:, -days - 1] - 1) * 100
+
+        daily = close[:, 1:] / close[:, :-1] - 1
+        # RSI采用Wilder平滑（与pandas_ta一致），按列对所有市场一次性计算
+        delta = pd.DataFrame(np.diff(close, axis=1).T)
+        gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1].to_numpy()
+        loss = (-delta.clip(upper=0)).ewm(alpha=1 / 14, adjust=False).mean().iloc[-1].to_numpy()
+        rsi = 100 - 100 / (1 + gain / loss)
+        rsi = np.where(loss == 0, 100.0, rsi)
+
+        metrics = {
+            "close": latest,
+            "return_1d": period_return(1),
+            "return_5d": period_return(5),
+            "return_20d": period_return(20),
+            "return_60d": period_return(60),
+            "rsi_14": rsi,
+            "ma5_bias": (latest / np.nanmean(close[:, -5:], axis=1) - 1) * 100,
+            "ma20_bias": (latest / np.nanmean(close[:, -20:], axis=1) - 1) * 100,
+            "volume_change_5d": (np.nanmean(volume[:, -5:], axis=1) / np.nanmean(volume[:, -25:-5], axis=1) - 1) * 100,
+            "amount_change_5d": (np.nanmean(amount[:, -5:], axis=1) / np.nanmean(amount[:, -25:-5], axis=1) - 1) * 100,
+            "volatility_20d": np.nanstd(daily[:, -20:], axis=1, ddof=1) * np.sqrt(365) * 100,
+            "drawdown_60d": (latest / np.nanmax(close[:, -60:], axis=1) - 1) * 100,
+        }
+    dates = [pd.Timestamp(df["date"].iloc[-1]).strftime("%Y-%m-%d") if len(df) else None for df in dfs]
+    table = pd.DataFrame({"market": names, "date": dates})
+    for field, values in metrics.items():
+        values = np.where(np.isfinite(values), values, np.nan)
+        table[field] = np.round(values, 4)
+    return table
+
+
+def _normalize_filter(spec: FilterSpec) -> tuple:
+    if isinstance(spec, dict):
+        field, op, value = spec.get("field"), spec.get("op", "=="), spec.get("value")
+    else:
+        field, op, value = spec
+    if field not in METRIC_FIELDS and field not in TEXT_FIELDS:
+        raise ValueError(f"未知的筛选字段: {field}，可用字段: {', '.join([*METRIC_FIELDS, *TEXT_FIELDS])}")
+    if op == "=":
+        op = "=="
+    if op not in OPERATORS:
+        raise ValueError(f"不支持的运算符: {op}，可用运算符: {', '.join(OPERATORS)}")
+    return field, op, value
+
+
+def apply_filters(table: pd.DataFrame, filters: Sequence[FilterSpec]) -> np.ndarray:
+    """把声明式筛选条件转换为布尔掩码，所有条件取交集"""
+    mask = np.ones(len(table), dtype=bool)
+    for spec in filters:
+        field, op, value = _normalize_filter(spec)
+        column = table[field]
+        if op == "contains":
+            cond = column.fillna("").astype(str).str.contains(str(value), regex=False).to_numpy()
+        elif op == "in":
+            cond = column.isin(list(value)).to_numpy()
+        else:
+            values = column.to_numpy(dtype=np.float64) if field in METRIC_FIELDS else column.to_numpy()
+            if op == "between":
+                low, high = value
+                cond = (values >= low) & (values <= high)
+            elif op == ">":
+                cond = values > value
+            elif op == ">=":
+                cond = values >= value
+            elif op == "<":
+                cond = values < value
+            elif op == "<=":
+                cond = values <= value
+            elif op == "==":
+                cond = values == value
+            else:
+                cond = values != value
+        mask &= np.asarray(cond, dtype=bool)
+    return mask
+
+
+class MarketScreener:
+    def __init__(self, config: Optional[Dict] = None, data_dir: str = "data/kline"):
+        """初始化市场筛选器
+
+        Args:
+            config: 筛选器配置，缺省项使用DEFAULT_SCREENER_CONFIG
+            data_dir: K线数据目录
+        """
+        self.config = {**DEFAULT_SCREENER_CONFIG, **(config or {})}
+        self.data_dir = data_dir
+        self._table: Optional[pd.DataFrame] = None
+        self._versions: Dict[str, str] = {}
+        self._last_dates: Dict[str, pd.Timestamp] = {}
+        self._last_check = 0.0
+        # 共享的筛选器在线程池中被并发刷新，检查与重建在锁内进行，同一时刻只有一次重建
+        self._lock = threading.Lock()
+
+    def _category(self, path: str) -> str:
+        parent = os.path.relpath(os.path.dirname(path), self.data_dir)
+        return "" if parent == "." else parent.split(os.sep)[0]
+
+    def _read_tail(self, name: str, path: str) -> Optional[pd.DataFrame]:
+        try:
+            df = normalize_daily_bars(read_csv_tail(path, self.config["tail_rows"] + TAIL_SLACK_ROWS))
+        except Exception as e:
+            logger.error(f"读取{name}数据失败: {str(e)}")
+            return None
+        return df if len(df) else None
+
+    def refresh(self, force: bool = False) -> pd.DataFrame:
+        """检查数据版本并增量更新指标表，只重新计算数据或对齐日期发生变化的序列
+
+        Args:
+            force: 是否忽略检查间隔立即检查
+
+        Returns:
+            pd.DataFrame: 最新的指标表
+        """
+        if self._table is not None and not force and \
+                time.monotonic() - self._last_check < self.config["refresh_interval"]:
+            return self._table
+        with self._lock:
+            # 等待锁期间其他线程可能已完成刷新，重新检查后直接使用其结果
+            now = time.monotonic()
+            if self._table is not None and not force and now - self._last_check < self.config["refresh_interval"]:
+                return self._table
+            self._last_check = now
+            return self._rebuild()
+
+    def _rebuild(self) -> pd.DataFrame:
+        """按数据版本增量重建指标表，调用方需持有self._lock"""
+        market_files = list_market_files(self.data_dir)
+        versions = {path: get_data_version(path) for path in market_files.values()}
+        changed = {name: path for name, path in market_files.items() if self._versions.get(path) != versions[path]}
+        if self._table is not None and not changed and len(versions) == len(self._versions):
+            return self._table
+
+        frames = {}
+        for name, path in changed.items():
+            self._last_dates.pop(path, None)
+            df = self._read_tail(name, path)
+            if df is not None:
+                frames[name] = df
+                self._last_dates[path] = df["date"].iloc[-1]
+        last_dates = {name: self._last_dates[path] for name, path in market_files.items() if path in self._last_dates}
+        as_of = common_completed_date(last_dates.values(), self.config["max_lag_days"])
+        targets = {name: min(last_date, as_of) for name, last_date in last_dates.items()}
+
+        previous_dates = {}
+        if self._table is not None:
+            previous_dates = dict(zip(self._table["market"], self._table["date"]))
+        # 数据未变化但对齐日期变了的序列（如其他序列补齐了最新交易日）也需要重新计算
+        for name, target in targets.items():
+            if name not in frames and previous_dates.get(name) != target.strftime("%Y-%m-%d"):
+                df = self._read_tail(name, market_files[name])
+                if df is not None:
+                    frames[name] = df
+
+        fresh = compute_metrics({name: df[df["date"] <= targets[name]] for name, df in frames.items()},
+                                self.config["tail_rows"])
+        fresh.insert(1, "category", [self._category(market_files[name]) for name in fresh["market"]])
+
+        if self._table is not None:
+            kept = self._table[self._table["market"].isin(set(targets) - set(frames))]
+            fresh = pd.concat([kept, fresh], ignore_index=True)
+        self._table = fresh.reset_index(drop=True)
+        self._versions = versions
+        self._last_dates = {path: self._last_dates[path] for path in versions if path in self._last_dates}
+        logger.info(f"指标表已更新: 共{len(self._table)}个序列，对齐到{as_of.strftime('%Y-%m-%d') if as_of else '-'}，"
+                    f"重新计算{len(frames)}个")
+        return self._table
+
+    def screen(self,
+               filters: Optional[Sequence[FilterSpec]] = None,
+               sort_by: Optional[str] = None,
+               ascending: bool = False,
+               limit: Optional[int] = 10,
+               columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """按声明式条件筛选并排序全部序列
+
+        Args:
+            filters: 筛选条件列表，每个条件为 {"field": 字段, "op": 运算符, "value": 值} 或 (字段, 运算符, 值)
+            sort_by: 排序字段
+            ascending: 是否升序
+            limit: 返回数量，None表示全部
+            columns: 返回的列，默认返回市场、分类、日期及排序和筛选涉及的字段
+
+        Returns:
+            pd.DataFrame: 筛选结果
+        """
+        table = self.refresh()
+        filters = list(filters or [])
+        result = table[apply_filters(table, filters)]
+        if sort_by:
+            if sort_by not in METRIC_FIELDS:
+                raise ValueError(f"未知的排序字段: {sort_by}")
+            result = result.sort_values(sort_by, ascending=ascending, na_position="last")
+        if limit is not None:
+            result = result.head(limit)
+        if columns is None:
+            columns = ["market", "category", "date"]
+            for field in [sort_by, *(_normalize_filter(f)[0] for f in filters)]:
+                if field and field not in columns:
+                    columns.append(field)
+            if "close" not in columns:
+                columns.insert(3, "close")
+        return result[columns].reset_index(drop=True)
+
+
+def format_screen_result(result: pd.DataFrame) -> str:
+    """把筛选结果格式化为文字表格"""
+    if result.empty:
+        return "没有符合条件的市场。"
+    headers = [METRIC_FIELDS.get(c) or TEXT_FIELDS.get(c) or c for c in result.columns]
+    lines = [" | ".join(headers)]
+    for row in result.itertuples(index=False):
+        cells = []
+        for value in row:
+            cells.append(f"{value:.2f}" if isinstance(value, float) else str(value))
+        lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def screen_markets_tool(query: str, screener: MarketScreener) -> str:
+    """智能体工具入口：输入为JSON字符串，包含filters、sort_by、ascending、limit"""
+    try:
+        params = json.loads(query) if query and query.strip() else {}
+        result = screener.screen(
+            filters=params.get("filters"),
+            sort_by=params.get("sort_by"),
+            ascending=params.get("ascending", False),
+            limit=params.get("limit", 10),
+        )
+        return format_screen_result(result)
+    except Exception as e:
+        return f"筛选失败: {str(e)}"
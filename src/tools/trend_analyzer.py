@@ -1,23 +1,51 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import openai  # 或其他大模型API
+import asyncio
+import json
 import os
-from typing import List, Dict, Any
+import random
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+from src.tools.data_tools import get_data_version, list_market_files, read_csv_tail
+from src.utils.async_utils import run_blocking
+from src.utils.config import load_config
+from src.utils.llm_client import LLMClient
+from src.utils.logger import setup_logger
+from src.utils.rate_limiter import AsyncRateLimiter
+
+logger = setup_logger("trend_analyzer")
+
+SYSTEM_PROMPT = "你是一个专业的市场分析师，擅长技术分析和趋势判断。"
+
+DEFAULT_BATCH_CONFIG = {
+    "output_dir": "reports/batch",   # 每个市场一个JSON报告，用于断点续跑
+    "max_concurrency": 4,            # 同时进行的大模型请求数
+    "rate_per_second": 2.0,          # 共享的大模型请求速率上限
+    "max_retries": 3,
+    "tail_rows": 60,                 # 生成摘要需要读取的末尾行数
+}
 
 class TrendAnalyzer:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, config: Optional[Dict] = None):
         """初始化趋势分析器
         
         Args:
             api_key: 大模型API密钥，如果为None则从环境变量获取
+            config: 配置信息，默认读取config/config.yaml
         """
-        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.api_key = api_key or os.getenv("API_KEY") or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("需要提供API密钥")
-        
+
+        if config is None:
+            config = load_config()
+        self.config = config
+        self.batch_config = {**DEFAULT_BATCH_CONFIG, **(config.get("batch") or {})}
+
         # 初始化API客户端
-        openai.api_key = self.api_key
+        llm_cfg = config["llm_api"]
+        self.llm = LLMClient(api_url=llm_cfg["api_url"], api_key=self.api_key, model=llm_cfg["model"])
 
     def _prepare_data_summary(self, df: pd.DataFrame) -> str:
         """准备数据摘要供大模型分析
@@ -63,6 +91,26 @@ class TrendAnalyzer:
         """
         return summary
 
+    def _build_messages(self, data_summary: str, index_name: str, days: int) -> List[Dict[str, str]]:
+        prompt = f"""
+        你是一个专业的市场分析师，请基于以下数据对{index_name}的未来{days}天趋势进行分析：
+
+        {data_summary}
+
+        请从以下几个方面进行分析：
+        1. 短期趋势（1-7天）
+        2. 中期趋势（8-30天）
+        3. 关键支撑位和压力位
+        4. 风险提示
+        5. 投资建议
+
+        请用专业但易懂的语言进行分析。
+        """
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
     def analyze_trend(self, 
                      df: pd.DataFrame, 
                      index_name: str,
@@ -80,35 +128,11 @@ class TrendAnalyzer:
         # 准备数据摘要
         data_summary = self._prepare_data_summary(df)
         
-        # 构建提示词
-        prompt = f"""
-        你是一个专业的市场分析师，请基于以下数据对{index_name}的未来{days}天趋势进行分析：
-
-        {data_summary}
-
-        请从以下几个方面进行分析：
-        1. 短期趋势（1-7天）
-        2. 中期趋势（8-30天）
-        3. 关键支撑位和压力位
-        4. 风险提示
-        5. 投资建议
-
-        请用专业但易懂的语言进行分析。
-        """
-        
         try:
             # 调用大模型API
-            response = openai.ChatCompletion.create(
-                model="gpt-4",  # 或其他适合的模型
-                messages=[
-                    {"role": "system", "content": "你是一个专业的市场分析师，擅长技术分析和趋势判断。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            analysis = response.choices[0].message.content
+            response = self.llm.chat(self._build_messages(data_summary, index_name, days),
+                                     temperature=0.7, max_tokens=1000)
+            analysis = response["choices"][0]["message"]["content"]
             
             return {
                 "index_name": index_name,
@@ -124,47 +148,123 @@ class TrendAnalyzer:
                 "analysis_date": datetime.now().strftime("%Y-%m-%d")
             }
 
+    def _load_summary(self, csv_path: str) -> str:
+        """读取末尾数据并生成摘要（在线程池中执行）"""
+        df = read_csv_tail(csv_path, self.batch_config["tail_rows"])
+        df['date'] = pd.to_datetime(df['date'])
+        if len(df) < 20:
+            raise ValueError(f"数据不足（{len(df)}行），无法生成摘要")
+        return self._prepare_data_summary(df)
+
+    async def _achat_with_retry(self, messages: List[Dict[str, str]], limiter: AsyncRateLimiter,
+                                semaphore: asyncio.Semaphore) -> str:
+        """限流、限并发地调用大模型，失败时指数退避重试"""
+        max_retries = self.batch_config["max_retries"]
+        for attempt in range(max_retries + 1):
+            try:
+                async with semaphore:
+                    await limiter.acquire()
+                    response = await self.llm.achat(messages, temperature=0.7, max_tokens=1000)
+                return response["choices"][0]["message"]["content"]
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = 2 ** attempt + random.random()
+                logger.warning(f"大模型请求失败，{delay:.1f}秒后第{attempt + 1}次重试: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def abatch_analyze(self,
+                             data_dir: str = "data/kline",
+                             days: int = 30,
+                             resume: bool = True) -> List[Dict[str, Any]]:
+        """并发批量分析数据目录（含子目录）下所有市场的趋势
+
+        数据读取与摘要在共享线程池中并行执行；大模型请求受并发数和共享速率限制，
+        失败自动重试。每个市场的结果写入output_dir下的JSON文件，resume为True时
+        跳过数据版本未变化且已成功的市场。
+
+        Args:
+            data_dir: 数据目录
+            days: 预测未来天数
+            resume: 是否跳过已有的成功结果
+
+        Returns:
+            List[Dict]: 分析结果列表，失败的市场包含error字段
+        """
+        output_dir = Path(self.batch_config["output_dir"])
+        output_dir.mkdir(parents=True, exist_ok=True)
+        limiter = AsyncRateLimiter(self.batch_config["rate_per_second"],
+                                   burst=self.batch_config["max_concurrency"])
+        semaphore = asyncio.Semaphore(self.batch_config["max_concurrency"])
+
+        market_files = list_market_files(data_dir)
+        results: List[Dict[str, Any]] = []
+        pending = {}
+        for index_name, csv_path in market_files.items():
+            report_path = output_dir / (os.path.relpath(csv_path, data_dir).replace(os.sep, "_")[:-4] + ".json")
+            version = get_data_version(csv_path)
+            if resume and report_path.exists():
+                try:
+                    previous = json.loads(report_path.read_text(encoding="utf-8"))
+                    if previous.get("data_version") == version and "error" not in previous:
+                        previous["resumed"] = True
+                        results.append(previous)
+                        continue
+                except Exception:
+                    pass
+            pending[index_name] = (csv_path, version, report_path)
+
+        async def analyze_one(index_name: str, csv_path: str, version: str, report_path: Path) -> Dict[str, Any]:
+            result = {"index_name": index_name, "analysis_date": datetime.now().strftime("%Y-%m-%d"),
+                      "data_version": version}
+            try:
+                data_summary = await run_blocking(self._load_summary, csv_path)
+                result["data_summary"] = data_summary
+                result["analysis"] = await self._achat_with_retry(
+                    self._build_messages(data_summary, index_name, days), limiter, semaphore)
+            except Exception as e:
+                result["error"] = f"分析过程中出现错误: {str(e)}"
+                logger.error(f"处理{index_name}时出错: {str(e)}")
+            await run_blocking(report_path.write_text, json.dumps(result, ensure_ascii=False, indent=2), "utf-8")
+            return result
+
+        results.extend(await asyncio.gather(*(analyze_one(name, *args) for name, args in pending.items())))
+
+        failed = [r["index_name"] for r in results if "error" in r]
+        report = {
+            "total": len(results),
+            "succeeded": len(results) - len(failed),
+            "resumed": sum(1 for r in results if r.get("resumed")),
+            "failed": failed,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        (output_dir / "_summary.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        logger.info(f"批量分析完成: 共{report['total']}个市场，成功{report['succeeded']}个"
+                    f"（续跑跳过{report['resumed']}个），失败{len(failed)}个")
+        return results
+
     def batch_analyze(self, 
-                     data_dir: str = "data/index",
-                     days: int = 30) -> List[Dict[str, Any]]:
-        """批量分析多个指数的趋势
+                     data_dir: str = "data/kline",
+                     days: int = 30,
+                     resume: bool = True) -> List[Dict[str, Any]]:
+        """批量分析多个指数的趋势，abatch_analyze的同步入口
         
         Args:
             data_dir: 数据目录
             days: 预测未来天数
+            resume: 是否跳过已有的成功结果
             
         Returns:
             List[Dict]: 分析结果列表
         """
-        results = []
-        
-        # 遍历数据目录下的所有CSV文件
-        for file in os.listdir(data_dir):
-            if file.endswith('.csv'):
-                index_name = file.replace('.csv', '')
-                file_path = os.path.join(data_dir, file)
-                
-                try:
-                    # 读取数据
-                    df = pd.read_csv(file_path)
-                    df['date'] = pd.to_datetime(df['date'])
-                    
-                    # 分析趋势
-                    result = self.analyze_trend(df, index_name, days)
-                    results.append(result)
-                    
-                except Exception as e:
-                    print(f"处理{index_name}时出错: {str(e)}")
-                    continue
-        
-        return results
+        return asyncio.run(self.abatch_analyze(data_dir, days, resume))
 
 def main():
     # 使用示例
     analyzer = TrendAnalyzer()
     
     # 分析单个指数
-    df = pd.read_csv("data/index/百战指数.csv")
+    df = pd.read_csv("data/kline/HOT/百战指数.csv")
     df['date'] = pd.to_datetime(df['date'])
     result = analyzer.analyze_trend(df, "百战指数")
     print(result['analysis'])
@@ -173,7 +273,7 @@ def main():
     results = analyzer.batch_analyze()
     for result in results:
         print(f"\n{result['index_name']}分析结果:")
-        print(result['analysis'])
+        print(result.get('analysis') or result.get('error'))
 
 def get_market_trend_prompt(df, market_name):
     # 只取最近30天
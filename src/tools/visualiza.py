@@ -1,13 +1,29 @@
 import pandas as pd
 import mplfinance as mpf
 import os
+import threading
+from src.tools.data_tools import read_csv_tail
+from src.utils import metrics
 
-def plot_kline(csv_path, save_path=None, title="K线图"):
-    df = pd.read_csv(csv_path)
+# matplotlib的全局状态不是线程安全的，多线程绘图时需要串行化
+_PLOT_LOCK = threading.Lock()
+
+@metrics.timed("chart.plot_kline", profile=True)
+def plot_kline(csv_path, save_path=None, title="K线图", window=None):
+    """绘制K线图
+
+    Args:
+        csv_path: K线CSV文件路径
+        save_path: 图片保存路径，默认与CSV同名
+        title: 图表标题
+        window: 只绘制最近window根K线，None表示绘制全部历史
+    """
+    df = read_csv_tail(csv_path, window) if window else pd.read_csv(csv_path)
     df['date'] = pd.to_datetime(df['date'])
     df.set_index('date', inplace=True)
     df = df[['open', 'high', 'low', 'close', 'volume']]
     if save_path is None:
         save_path = os.path.splitext(csv_path)[0] + "_kline.png"
-    mpf.plot(df, type='candle', volume=True, title=title, style='yahoo', savefig=save_path)
-    return save_path
\ No newline at end of file
+    with _PLOT_LOCK:
+        mpf.plot(df, type='candle', volume=True, title=title, style='yahoo', savefig=save_path)
+    return save_path
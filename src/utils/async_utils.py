@@ -0,0 +1,51 @@
+"""
+异步辅助函数
+
+阻塞的IO与CPU计算（读CSV、指标计算、绘图、同步SDK调用）统一提交到一个有界线程池，
+避免阻塞事件循环，同时限制同时占用的工作线程数。
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_SENTINEL = object()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_max_workers = 8
+
+
+def configure_executor(max_workers: int):
+    """设置有界线程池的大小，需在首次使用前调用"""
+    global _executor, _max_workers
+    _max_workers = max_workers
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """获取共享的有界线程池"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_max_workers, thread_name_prefix="cs-worker")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """在有界线程池中执行阻塞函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def iterate_in_thread(iterable: Iterable[T]) -> AsyncIterator[T]:
+    """在线程池中逐个迭代同步生成器，避免阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    iterator = iter(iterable)
+    while True:
+        item = await loop.run_in_executor(get_executor(), next, iterator, _SENTINEL)
+        if item is _SENTINEL:
+            break
+        yield item
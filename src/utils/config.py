@@ -0,0 +1,45 @@
+"""
+配置加载工具
+
+config/config.yaml 只在第一次使用时解析一次，之后各模块共享同一份配置，
+避免每个模块在导入时各自打开并解析配置文件。
+"""
+import functools
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import yaml
+from dotenv import load_dotenv
+
+DEFAULT_CONFIG_PATH = Path("config") / "config.yaml"
+
+
+@functools.lru_cache(maxsize=None)
+def _load_config(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """读取配置文件，同一路径只解析一次
+
+    Args:
+        path: 配置文件路径，默认为 config/config.yaml
+
+    Returns:
+        Dict: 配置字典（各模块共享，请勿原地修改）
+    """
+    return _load_config(str(path or DEFAULT_CONFIG_PATH))
+
+
+def get_config_section(name: str, path: Optional[str] = None) -> Dict[str, Any]:
+    """读取配置中的某一部分，不存在时返回空字典"""
+    return load_config(path).get(name) or {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_api_key() -> Optional[str]:
+    """从环境变量（及.env文件）读取大模型API密钥"""
+    load_dotenv()
+    return os.getenv("API_KEY")
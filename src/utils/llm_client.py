@@ -1,41 +1,348 @@
-import requests
 import json
-from openai import OpenAI
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+import asyncio
+import functools
+from typing import AsyncIterator, Dict, Iterator, Optional
+from src.utils import metrics
+from src.utils.config import get_api_key, get_config_section
+from src.utils.logger import setup_logger
+from src.utils.singleflight import AsyncSingleFlight, SingleFlight
+from src.utils.tokenizer import count_message_tokens, count_tokens
 
-# 从 config/config.yaml 加载配置
-import yaml
+logger = setup_logger("llm_client")
 
-with open("config/config.yaml", "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
+class ResponseCache:
+    """基于SQLite的LLM响应持久化缓存
 
-llm_config = config["llm_api"]
+    缓存键由模型、采样参数和消息内容的哈希组成。Prompt中嵌入了行情数据时，
+    数据更新后Prompt随之变化，自然不会命中旧的缓存。
+    """
+
+    def __init__(self, path: str = "data/cache/llm_cache.sqlite", ttl_seconds: Optional[float] = 86400,
+                 max_entries: int = 5000):
+        """
+        Args:
+            path: SQLite文件路径
+            ttl_seconds: 缓存有效期（秒），None表示永不过期
+            max_entries: 最大缓存条数，超出后按最近访问时间淘汰
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, cache_config: Optional[Dict]) -> Optional["ResponseCache"]:
+        """根据config.yaml中的llm_cache配置创建缓存，未启用时返回None"""
+        if not cache_config or not cache_config.get("enabled", False):
+            return None
+        return cls(
+            path=cache_config.get("path", "data/cache/llm_cache.sqlite"),
+            ttl_seconds=cache_config.get("ttl_seconds", 86400),
+            max_entries=cache_config.get("max_entries", 5000),
+        )
+
+    @staticmethod
+    def make_key(model: str, messages, params: Dict) -> str:
+        payload = json.dumps({"model": model, "messages": messages, "params": params},
+                             sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache="llm_response", result="miss")
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        metrics.inc("cache_requests_total", cache="llm_response", result="hit")
+        return json.loads(row[0])
+
+    def set(self, key: str, response: Dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                # 一次淘汰到90%，避免每次写入都触发淘汰
+                evict = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (evict,),
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        """返回命中统计：hits、misses、hit_rate、entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
 
 class LLMClient:
-    def __init__(self, api_url, api_key, model, tools=None):
+    def __init__(self, api_url, api_key, model, tools=None, cache: Optional[ResponseCache] = None):
         self.api_url = api_url
         self.api_key = api_key
         self.model = model
         self.tools = tools or []
-        self.client = OpenAI(api_key=api_key, base_url=self.api_url)
-        print("api_url:", api_url, type(api_url))
+        # openai SDK导入较慢，客户端在第一次请求时才创建
+        self._client = None
+        self._async_client = None
+        # 未显式传入缓存时按配置创建，配置未启用则不缓存
+        self.cache = cache if cache is not None else ResponseCache.from_config(get_config_section("llm_cache"))
+        # 累计的token用量（不含命中缓存的请求）
+        self.token_usage = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        # 同步接口在线程池中调用，与事件循环中的异步请求同时累加用量
+        self._usage_lock = threading.Lock()
+        # 相同请求（模型、消息、采样参数一致）并发时只向服务端发送一次
+        flight_config = get_config_section("singleflight")
+        self._flight = SingleFlight("llm", flight_config)
+        self._aflight = AsyncSingleFlight("llm", flight_config)
+        logger.debug(f"LLM客户端已创建: api_url={api_url}, model={model}")
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key, base_url=self.api_url)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.api_url)
+        return self._async_client
+
+    def _log_usage(self, messages, content: str, usage: Optional[Dict] = None):
+        """记录一次请求的prompt和响应token数，接口未返回usage（如流式请求）时用本地分词器计数"""
+        if usage and usage.get("prompt_tokens") is not None:
+            prompt_tokens, completion_tokens, source = usage["prompt_tokens"], usage.get("completion_tokens") or 0, "api"
+        else:
+            prompt_tokens, completion_tokens, source = count_message_tokens(messages), count_tokens(content), "local"
+        with self._usage_lock:
+            self.token_usage["requests"] += 1
+            self.token_usage["prompt_tokens"] += prompt_tokens
+            self.token_usage["completion_tokens"] += completion_tokens
+        metrics.inc("llm_tokens_total", prompt_tokens, model=self.model, kind="prompt")
+        metrics.inc("llm_tokens_total", completion_tokens, model=self.model, kind="completion")
+        logger.info(f"token用量: prompt={prompt_tokens}, completion={completion_tokens}（{source}）, model={self.model}")
+
+    def _cache_key(self, messages, max_tokens, temperature, top_p, kwargs) -> str:
+        params = {"max_tokens": max_tokens, "temperature": temperature, "top_p": top_p, **kwargs}
+        return ResponseCache.make_key(self.model, messages, params)
+
+    def chat(self, messages, stream=False, max_tokens=1024, temperature=0.7, top_p=0.7, use_cache=True, **kwargs):
+        """调用大模型对话接口
+
+        非流式调用默认先查询响应缓存，未命中时相同的并发请求合并为一次；
+        传入use_cache=False可跳过缓存和合并，强制发起独立请求。
+        """
+        if stream:
+            return self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stream=True,
+                **kwargs
+            )  # 生成器
+        if not use_cache:
+            return self._create(messages, None, max_tokens, temperature, top_p, kwargs)
+
+        cache_key = self._cache_key(messages, max_tokens, temperature, top_p, kwargs)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        return self._flight.do(cache_key, self._create, messages, cache_key, max_tokens, temperature, top_p, kwargs)
+
+    def _create(self, messages, cache_key, max_tokens, temperature, top_p, kwargs) -> Dict:
+        with metrics.span("llm.chat", model=self.model):
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                **kwargs
+            )
+        result = response.model_dump()  # 返回dict
+        self._log_usage(messages, result["choices"][0]["message"]["content"] or "", result.get("usage"))
+        if cache_key is not None and self.cache is not None:
+            self.cache.set(cache_key, result)
+        return result
+
+    def stream_text(self, messages, max_tokens=1024, temperature=0.7, top_p=0.7, use_cache=True,
+                    **kwargs) -> Iterator[str]:
+        """流式调用大模型，逐段产出文本
+
+        命中响应缓存时一次性产出缓存内容；完整流式结束后把结果写入缓存。
+        首个token到达的耗时（TTFT）写入日志和指标；客户端在会话间共享，不在实例上保存单次请求的状态。
+        """
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self._cache_key(messages, max_tokens, temperature, top_p, kwargs)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield cached["choices"][0]["message"]["content"]
+                return
+
+        response = self.chat(messages, stream=True, max_tokens=max_tokens, temperature=temperature,
+                             top_p=top_p, use_cache=False, **kwargs)
+        parts = []
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not parts:
+                ttft = time.perf_counter() - start
+                metrics.observe("llm_ttft_seconds", ttft, model=self.model)
+                logger.info(f"首token耗时(TTFT): {ttft * 1000:.0f}ms, model={self.model}")
+            parts.append(delta)
+            yield delta
+
+        metrics.observe("llm_stream_seconds", time.perf_counter() - start, model=self.model)
+        logger.info(f"流式响应完成: 总耗时{(time.perf_counter() - start) * 1000:.0f}ms, 共{len(parts)}段")
+        self._log_usage(messages, "".join(parts))
+        if cache_key is not None and parts:
+            self.cache.set(cache_key, {"choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]})
 
-    def chat(self, messages, stream=False, max_tokens=1024, temperature=0.7, top_p=0.7, **kwargs):
-        response = self.client.chat.completions.create(
+    async def achat(self, messages, max_tokens=1024, temperature=0.7, top_p=0.7, use_cache=True, **kwargs) -> Dict:
+        """chat的异步版本，使用AsyncOpenAI，缓存读写放到线程中执行"""
+        if not use_cache:
+            return await self._acreate(messages, None, max_tokens, temperature, top_p, kwargs)
+
+        cache_key = self._cache_key(messages, max_tokens, temperature, top_p, kwargs)
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                return cached
+        return await self._aflight.do(cache_key, self._acreate, messages, cache_key, max_tokens, temperature, top_p,
+                                      kwargs)
+
+    async def _acreate(self, messages, cache_key, max_tokens, temperature, top_p, kwargs) -> Dict:
+        with metrics.span("llm.chat", model=self.model):
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                **kwargs
+            )
+        result = response.model_dump()
+        self._log_usage(messages, result["choices"][0]["message"]["content"] or "", result.get("usage"))
+        if cache_key is not None and self.cache is not None:
+            await asyncio.to_thread(self.cache.set, cache_key, result)
+        return result
+
+    async def astream_text(self, messages, max_tokens=1024, temperature=0.7, top_p=0.7, use_cache=True,
+                           **kwargs) -> AsyncIterator[str]:
+        """stream_text的异步版本，使用AsyncOpenAI逐段产出文本
+
+        相同的流式请求并发时只向服务端请求一次，产出的文本分发给所有调用方，后加入的调用方先补发已产出的部分。
+        """
+        if not use_cache:
+            source = self._astream_text(messages, max_tokens, temperature, top_p, use_cache, **kwargs)
+        else:
+            cache_key = self._cache_key(messages, max_tokens, temperature, top_p, kwargs)
+            source = self._aflight.stream(("stream", cache_key), self._astream_text, messages, max_tokens,
+                                          temperature, top_p, use_cache, **kwargs)
+        async for token in source:
+            yield token
+
+    async def _astream_text(self, messages, max_tokens, temperature, top_p, use_cache, **kwargs) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = self._cache_key(messages, max_tokens, temperature, top_p, kwargs)
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached["choices"][0]["message"]["content"]
+                return
+
+        response = await self.async_client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
             top_p=top_p,
-            stream=stream,
+            stream=True,
             **kwargs
         )
-        if stream:
-            return response  # 生成器
-        else:
-            return response.model_dump()  # 返回dict
+        parts = []
+        async for chunk in response:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not parts:
+                ttft = time.perf_counter() - start
+                metrics.observe("llm_ttft_seconds", ttft, model=self.model)
+                logger.info(f"首token耗时(TTFT): {ttft * 1000:.0f}ms, model={self.model}")
+            parts.append(delta)
+            yield delta
 
-    def classify_intent(self, user_query: str) -> dict:
-        """使用大模型分类用户意图并提取市场名称，返回字典。"""
+        metrics.observe("llm_stream_seconds", time.perf_counter() - start, model=self.model)
+        logger.info(f"流式响应完成: 总耗时{(time.perf_counter() - start) * 1000:.0f}ms, 共{len(parts)}段")
+        self._log_usage(messages, "".join(parts))
+        if cache_key is not None and parts:
+            content = "".join(parts)
+            await asyncio.to_thread(
+                self.cache.set, cache_key, {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            )
+
+    def cache_stats(self) -> Dict:
+        """返回响应缓存的命中统计，未启用缓存时返回空字典"""
+        return self.cache.stats() if self.cache is not None else {}
+
+    @staticmethod
+    def _intent_messages(user_query: str) -> list:
         prompt = f"""
         请分析以下用户查询的意图，并提取所有相关的市场名称。
         如果用户要求进行市场分析或比较，请将意图标记为 "market_analysis"，并列出所有相关的市场名称。
@@ -73,26 +380,52 @@ class LLMClient:
             {"role": "system", "content": "你是一个意图识别专家，能够准确判断用户查询的意图，并提取相关实体。"},
             {"role": "user", "content": prompt}
         ]
+        return messages
+
+    @staticmethod
+    def _parse_intent(text_response: str) -> dict:
+        """解析意图识别的返回文本"""
+        # 尝试解析JSON
         try:
-            response = self.chat(messages, max_tokens=100, temperature=0.0)
-            text_response = response["choices"][0]["message"]["content"].strip()
+            parsed_response = json.loads(text_response)
+            if "intent" in parsed_response:
+                return parsed_response
+        except json.JSONDecodeError:
+            print(f"LLM返回的不是有效JSON: {text_response}")
             
-            # 尝试解析JSON
-            try:
-                parsed_response = json.loads(text_response)
-                if "intent" in parsed_response:
-                    return parsed_response
-            except json.JSONDecodeError:
-                print(f"LLM返回的不是有效JSON: {text_response}")
-                
-            # 如果JSON解析失败，尝试回退到旧的字符串解析方式，或直接返回默认
-            if text_response.startswith("意图:"):
-                intent = text_response.split(":", 1)[1].strip()
-                if intent in ["market_analysis", "general_question"]:
-                    return {"intent": intent, "market_names": []}
-
-            return {"intent": "general_question", "market_names": []} # 默认 fallback
+        # 如果JSON解析失败，尝试回退到旧的字符串解析方式，或直接返回默认
+        if text_response.startswith("意图:"):
+            intent = text_response.split(":", 1)[1].strip()
+            if intent in ["market_analysis", "general_question"]:
+                return {"intent": intent, "market_names": []}
 
+        return {"intent": "general_question", "market_names": []} # 默认 fallback
+
+    def classify_intent(self, user_query: str) -> dict:
+        """使用大模型分类用户意图并提取市场名称，返回字典。"""
+        try:
+            response = self.chat(self._intent_messages(user_query), max_tokens=100, temperature=0.0)
+            return self._parse_intent(response["choices"][0]["message"]["content"].strip())
         except Exception as e:
             print(f"意图识别失败: {e}")
-            return {"intent": "general_question", "market_names": []} # 失败时也默认 fallback
\ No newline at end of file
+            return {"intent": "general_question", "market_names": []} # 失败时也默认 fallback
+
+    async def aclassify_intent(self, user_query: str) -> dict:
+        """classify_intent的异步版本"""
+        try:
+            response = await self.achat(self._intent_messages(user_query), max_tokens=100, temperature=0.0)
+            return self._parse_intent(response["choices"][0]["message"]["content"].strip())
+        except Exception as e:
+            print(f"意图识别失败: {e}")
+            return {"intent": "general_question", "market_names": []}
+
+
+@functools.lru_cache(maxsize=None)
+def get_llm_client() -> LLMClient:
+    """返回按config.yaml中llm_api配置创建的共享客户端，第一次调用时创建
+
+    设置环境变量LLM_API_URL时使用该地址代替配置中的api_url（如指向本地的兼容接口做压测）。
+    """
+    llm_cfg = get_config_section("llm_api")
+    api_url = os.getenv("LLM_API_URL") or llm_cfg["api_url"]
+    return LLMClient(api_url=api_url, api_key=get_api_key(), model=llm_cfg["model"])
@@ -1,41 +1,182 @@
+"""
+日志工具
+
+日志系统在第一次调用setup_logger时按config.yaml中的logging部分配置一次：
+- 各模块的logger共享同一个QueueHandler，调用方只把记录放入队列，格式化和文件、控制台I/O
+  由QueueListener在后台线程完成，抓取和并发对话不会因写日志而阻塞；
+- 文件按大小轮转，可选输出每行一个JSON对象的结构化日志；
+- 重复调用setup_logger不会重复添加处理器；
+- LogSampler对逐条的明细日志（每个板块、每次抓取）抽样输出，大规模抓取时日志量与板块数无关。
+"""
+import atexit
+import json
 import logging
-import os
+import logging.handlers
+import queue
+import threading
 from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_LOGGING_CONFIG = {
+    "level": "INFO",
+    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    "file": "logs/app.log",      # 为空则不写文件
+    "max_bytes": 10 * 1024 * 1024,  # 单个日志文件的大小上限，超过后轮转
+    "backup_count": 5,           # 保留的轮转文件数
+    "console": True,             # 是否输出到控制台
+    "json": False,               # 文件日志使用每行一个JSON对象的格式
+    "sample_first": 10,          # LogSampler：每类明细日志前多少条全部输出
+    "sample_every": 100,         # LogSampler：之后每多少条输出一条
+}
+
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """进程内队列的处理器：记录不需要序列化，入队前只合并消息参数（避免参数对象在后台输出前被修改），
+    格式化和异常堆栈都留给后台线程"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+_lock = threading.Lock()
+_config: Optional[Dict] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+# 所有logger共享的入队处理器，重新配置时只替换后台的监听器
+_queue_handler = _InProcessQueueHandler(queue.SimpleQueue())
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出为一行JSON：时间、级别、logger名称、线程、消息，有异常时附带堆栈"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+def _load_config() -> Dict:
+    try:
+        from src.utils.config import get_config_section
+        return get_config_section("logging")
+    except OSError:
+        # 不在项目根目录运行（找不到config.yaml）时使用默认配置
+        return {}
+
+
+def configure_logging(config: Optional[Dict] = None, force: bool = False) -> Dict:
+    """配置日志系统，默认只在第一次调用时生效
+
+    Args:
+        config: 日志配置，即config.yaml中的logging部分，默认读取配置文件；缺省项使用DEFAULT_LOGGING_CONFIG
+        force: 已配置过时是否按新配置重新配置
+
+    Returns:
+        Dict: 生效的配置
+    """
+    global _config, _listener
+    with _lock:
+        if _config is not None and not force:
+            return _config
+        merged = {**DEFAULT_LOGGING_CONFIG, **(config if config is not None else _load_config())}
+        formatter = logging.Formatter(merged["format"])
+        handlers = []
+        if merged["file"]:
+            path = Path(merged["file"])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=merged["max_bytes"], backupCount=merged["backup_count"], encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter() if merged["json"] else formatter)
+            handlers.append(file_handler)
+        if merged["console"]:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            handlers.append(console_handler)
+
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        if _config is None:
+            atexit.register(shutdown_logging)
+        _config = merged
+
+        level = logging.getLevelName(str(merged["level"]).upper())
+        for logger in logging.Logger.manager.loggerDict.values():
+            if isinstance(logger, logging.Logger) and _queue_handler in logger.handlers:
+                logger.setLevel(level)
+        return merged
+
+
+def shutdown_logging():
+    """停止后台监听器，写完队列中剩余的日志（进程退出时自动调用）"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
 
 def setup_logger(name: str) -> logging.Logger:
     """设置日志记录器
-    
+
     Args:
         name: 日志记录器名称
-        
+
     Returns:
         logging.Logger: 配置好的日志记录器
     """
-    # 创建日志目录
-    log_dir = Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    
-    # 创建日志记录器
+    config = configure_logging()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    
-    # 创建文件处理器
-    file_handler = logging.FileHandler(log_dir / "app.log", encoding="utf-8")
-    file_handler.setLevel(logging.INFO)
-    
-    # 创建控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    
-    # 创建格式化器
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    file_handler.setFormatter(formatter)
-    console_handler.setFormatter(formatter)
-    
-    # 添加处理器
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
+    logger.setLevel(logging.getLevelName(str(config["level"]).upper()))
+    if _queue_handler not in logger.handlers:
+        logger.addHandler(_queue_handler)
+    # 已由共享处理器输出，不再传给根logger（如前端框架配置的处理器），避免重复
+    logger.propagate = False
     return logger
+
+
+class LogSampler:
+    """按类别抽样输出明细日志：每类前first条全部输出，之后每every条输出一条并注明累计条数
+
+    消息使用logging的%格式参数，未输出的记录不做字符串格式化。
+    """
+
+    def __init__(self, first: Optional[int] = None, every: Optional[int] = None):
+        config = configure_logging()
+        self.first = config["sample_first"] if first is None else first
+        self.every = config["sample_every"] if every is None else every
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def log(self, logger: logging.Logger, level: int, key: str, msg: str, *args):
+        """按key抽样记录一条日志
+
+        Args:
+            logger: 使用的logger
+            level: 日志级别，如logging.INFO
+            key: 抽样类别，同一类别共用计数
+            msg: 消息模板，如"成功获取%d条K线数据"
+            args: 模板参数
+        """
+        if not logger.isEnabledFor(level):
+            return
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        if count <= self.first:
+            logger.log(level, msg, *args, stacklevel=2)
+        elif self.every and (count - self.first) % self.every == 0:
+            logger.log(level, msg + "（同类日志第%d条，其余已抽样省略）", *args, count, stacklevel=2)
@@ -0,0 +1,405 @@
+"""
+性能埋点与指标导出
+
+提供轻量的埋点接口，记录各环节的耗时分布、处理的行数和字节数、缓存命中和大模型token用量：
+- span(name, **labels)：上下文管理器，记录一段代码的耗时，可用span.add("rows", n)累加处理量；
+- timed(name)：装饰器，同步和异步函数都可使用；
+- inc / observe：直接累加计数器或记录一个观测值。
+
+指标以Prometheus文本格式导出：定期写入文本文件（供node_exporter的textfile收集器读取），
+或在本机端口上提供 /metrics。标记profile=True的同步埋点可按比例开启cProfile，
+耗时超过阈值时把profile结果保存到文件，便于定位慢请求。
+
+默认关闭，由入口调用configure_metrics(config.yaml中的metrics部分)开启；关闭时span返回共享的空对象，
+timed只多一次标志判断，对热点路径几乎没有额外开销。
+"""
+import asyncio
+import atexit
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.logger import setup_logger
+
+logger = setup_logger("metrics")
+
+DEFAULT_METRICS_CONFIG = {
+    "enabled": False,
+    "prefix": "cs",
+    # 耗时直方图的桶上界（秒）
+    "buckets": [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0],
+    "textfile": "logs/metrics.prom",   # Prometheus文本文件路径，为空则不写文件
+    "export_interval": 15.0,           # 写文本文件的间隔（秒），进程退出时再写一次
+    "http_port": 0,                    # 大于0时在127.0.0.1上提供/metrics
+    "profile_slow_seconds": 0.0,       # 大于0时对profile=True的埋点抽样做cProfile，超过该耗时才保存
+    "profile_sample_rate": 0.1,        # 抽样比例
+    "profile_dir": "logs/profiles",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (k + '="' + v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        self.counts = [0] * (size + 1)   # 最后一个为+Inf桶
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """计数器和直方图的集合，线程安全"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        """
+        Args:
+            config: 指标配置，即config.yaml中的metrics部分，缺省项使用DEFAULT_METRICS_CONFIG
+        """
+        self.config = {**DEFAULT_METRICS_CONFIG, **(config or {})}
+        self.buckets: List[float] = sorted(float(b) for b in self.config["buckets"])
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def _name(self, name: str) -> str:
+        prefix = self.config["prefix"]
+        return f"{prefix}_{name}" if prefix else name
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        """累加计数器，name不含前缀，按惯例以_total结尾"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name: str, value: float, help: str = "", **labels):
+        """向直方图记录一个观测值（秒）"""
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(len(self.buckets))
+            hist.counts[index] += 1
+            hist.sum += value
+            hist.count += 1
+            if help:
+                self._help.setdefault(name, help)
+
+    def snapshot(self) -> Dict:
+        """返回当前的指标值：counters为 {名称: {标签: 值}}，histograms为 {名称: {标签: {count, sum}}}"""
+        with self._lock:
+            counters = {name: {key: value for key, value in series.items()} for name, series in self._counters.items()}
+            histograms = {name: {key: {"count": h.count, "sum": h.sum} for key, h in series.items()}
+                          for name, series in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self) -> str:
+        """生成Prometheus文本格式（0.0.4）"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full = self._name(name)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                full = self._name(name)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{full}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Optional[str] = None) -> Optional[str]:
+        """把指标原子地写入文本文件，返回文件路径"""
+        path = path or self.config["textfile"]
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class Span:
+    """一次埋点：退出时记录耗时，add累加的处理量记为 {key}_total 计数器"""
+    __slots__ = ("name", "labels", "counts", "start", "duration")
+
+    def __init__(self, name: str, labels: Dict):
+        self.name = name
+        self.labels = labels
+        self.counts: Dict[str, float] = {}
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def add(self, key: str, value: float = 1):
+        """累加处理量，如add("rows", len(df))、add("bytes", size)"""
+        self.counts[key] = self.counts.get(key, 0) + value
+
+
+class _NullSpan:
+    """关闭指标时使用的空埋点"""
+    __slots__ = ()
+    name = ""
+    duration = None
+
+    def add(self, key: str, value: float = 1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+_enabled = False
+_registry = MetricsRegistry()
+_profile_lock = threading.Lock()
+_exporters: List[Callable[[], None]] = []
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def inc(name: str, value: float = 1, **labels):
+    """累加计数器，指标关闭时不做任何事"""
+    if _enabled:
+        _registry.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    """记录一个观测值，指标关闭时不做任何事"""
+    if _enabled:
+        _registry.observe(name, value, **labels)
+
+
+def _finish(span: Span, error: bool):
+    span.duration = time.perf_counter() - span.start
+    labels = {"span": span.name, **span.labels}
+    _registry.observe("span_duration_seconds", span.duration, help="埋点代码段的耗时", **labels)
+    if error:
+        _registry.inc("span_errors_total", help="埋点代码段抛出的异常数", **labels)
+    for key, value in span.counts.items():
+        _registry.inc(f"{key}_total", value, **labels)
+
+
+@contextmanager
+def _span(name: str, labels: Dict, profile: bool) -> Iterator[Span]:
+    span = Span(name, labels)
+    profiler = _start_profile() if profile else None
+    error = False
+    try:
+        yield span
+    except Exception:
+        error = True
+        raise
+    finally:
+        _finish(span, error)
+        if profiler is not None:
+            _stop_profile(profiler, span)
+
+
+def span(name: str, profile: bool = False, **labels):
+    """记录一段代码的耗时
+
+    Args:
+        name: 埋点名称，如"storage.load_csv"
+        profile: 是否参与慢请求的cProfile抽样，只应用于在单个线程内完成的同步代码
+        labels: 附加标签，取值种类应有限（如模型名、命中/未命中），不要放市场名等高基数值
+
+    Returns:
+        上下文管理器，as得到的对象可调用add累加行数、字节数等；指标关闭时为空对象
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return _span(name, labels, profile)
+
+
+def timed(name: Optional[str] = None, profile: bool = False, **labels):
+    """记录函数耗时的装饰器，同步和异步函数均可使用，name默认为 模块.函数名"""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _span(span_name, labels, False):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _span(span_name, labels, profile):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def _start_profile() -> Optional[cProfile.Profile]:
+    config = _registry.config
+    if config["profile_slow_seconds"] <= 0 or random.random() >= config["profile_sample_rate"]:
+        return None
+    # 同一时刻只允许一个profiler，嵌套或其他线程正在采样时跳过
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profile_lock.release()
+        return None
+    return profiler
+
+
+def _stop_profile(profiler: cProfile.Profile, span: Span):
+    try:
+        profiler.disable()
+        if span.duration < _registry.config["profile_slow_seconds"]:
+            return
+        profile_dir = _registry.config["profile_dir"]
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"{span.name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(10)
+        _registry.inc("profiles_saved_total", span=span.name)
+        logger.warning(f"慢请求{span.name}耗时{span.duration * 1000:.0f}ms，profile已保存: {path}\n{summary.getvalue()}")
+    except Exception as e:
+        logger.error(f"保存profile失败: {str(e)}")
+    finally:
+        _profile_lock.release()
+
+
+def _write_textfile():
+    try:
+        _registry.write_textfile()
+    except OSError as e:
+        logger.error(f"写入指标文件失败: {str(e)}")
+
+
+def _start_textfile_exporter():
+    interval = _registry.config["export_interval"]
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            _write_textfile()
+
+    if interval and interval > 0:
+        threading.Thread(target=loop, name="metrics-textfile", daemon=True).start()
+
+    def final_write():
+        stop.set()
+        _write_textfile()
+        atexit.unregister(final_write)
+
+    _exporters.append(final_write)
+    atexit.register(final_write)
+
+
+def _start_http_exporter(port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    _exporters.append(lambda: (server.shutdown(), server.server_close()))
+    logger.info(f"指标接口已启动: http://127.0.0.1:{server.server_address[1]}/metrics")
+    return server
+
+
+def configure_metrics(config: Optional[Dict] = None):
+    """按配置开启或关闭指标，并启动导出；重复调用时先停止之前的导出
+
+    Args:
+        config: 指标配置，即config.yaml中的metrics部分
+    """
+    global _enabled, _registry
+    shutdown_metrics()
+    _registry = MetricsRegistry(config)
+    _enabled = bool(_registry.config["enabled"])
+    if not _enabled:
+        return
+    if _registry.config["textfile"]:
+        _start_textfile_exporter()
+    if _registry.config["http_port"]:
+        try:
+            _start_http_exporter(int(_registry.config["http_port"]))
+        except OSError as e:
+            logger.error(f"启动指标接口失败: {str(e)}")
+
+
+def shutdown_metrics():
+    """停止导出线程和/metrics服务"""
+    while _exporters:
+        _exporters.pop()()
@@ -0,0 +1,40 @@
+"""
+异步令牌桶限流器，用于在多个并发任务之间共享大模型API的请求速率
+"""
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    def __init__(self, rate_per_second: float, burst: int = 1):
+        """
+        Args:
+            rate_per_second: 每秒补充的令牌数，即平均请求速率
+            burst: 令牌桶容量，允许的瞬时突发请求数
+        """
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second必须大于0")
+        self.rate = rate_per_second
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
@@ -0,0 +1,218 @@
+"""
+请求合并（single-flight）
+
+同一时刻对同一个键的多个请求只执行一次实际计算，结果分发给所有等待者。
+行情异动后大量用户同时询问同一个市场时，读数据、渲染、调用大模型的次数
+只与不同问题的数量有关，而与用户数量无关。
+
+- SingleFlight：线程版，由第一个调用者（leader）在自己的线程中执行，其他调用者等待结果，可设置超时；
+- AsyncSingleFlight：协程版，计算在独立任务中执行，单个等待者超时或被取消只影响它自己，
+  所有等待者都离开后才取消共享的计算；
+- AsyncSingleFlight.stream：流式结果的合并，每个订阅者都能从头收到完整的产出序列。
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from src.utils.logger import setup_logger
+
+logger = setup_logger("singleflight")
+
+DEFAULT_SINGLEFLIGHT_CONFIG = {
+    "enabled": True,
+    "wait_timeout": 120.0,   # 等待者默认的最长等待时间（秒），None表示一直等待
+}
+
+
+class SingleFlight:
+    def __init__(self, name: str = "singleflight", config: Optional[Dict] = None):
+        """
+        Args:
+            name: 名称，用于日志和统计
+            config: 合并配置，即config.yaml中的singleflight部分，缺省项使用DEFAULT_SINGLEFLIGHT_CONFIG
+        """
+        self.name = name
+        self.config = {**DEFAULT_SINGLEFLIGHT_CONFIG, **(config or {})}
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.stats = {"calls": 0, "executions": 0, "shared": 0}
+
+    def do(self, key: Hashable, func: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """执行func，相同键的并发调用共享同一次执行
+
+        Args:
+            key: 合并键，需包含影响结果的全部因素（如市场、窗口、数据版本）
+            func: 实际执行的函数
+            timeout: 非leader调用者等待结果的最长时间（秒），超时抛出concurrent.futures.TimeoutError，
+                默认使用配置中的wait_timeout
+        """
+        if not self.config["enabled"]:
+            return func(*args, **kwargs)
+        timeout = timeout if timeout is not None else self.config["wait_timeout"]
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats["executions"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            logger.debug(f"[{self.name}] 合并请求: {key}")
+            return future.result(timeout=timeout)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """把一个异步生成器的产出广播给多个订阅者，后加入的订阅者先补发已产出的部分"""
+
+    def __init__(self, source: AsyncIterator[Any]):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]):
+        try:
+            async for item in source:
+                async with self._changed:
+                    self.items.append(item)
+                    self._changed.notify_all()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def subscribe(self, timeout: Optional[float] = None) -> AsyncIterator[Any]:
+        index = 0
+        while True:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait_for(lambda: index < len(self.items) or self.done), timeout)
+                batch = self.items[index:]
+                finished = self.done
+            index += len(batch)
+            for item in batch:
+                yield item
+            if finished and index >= len(self.items):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class AsyncSingleFlight:
+    def __init__(self, name: str = "singleflight", config: Optional[Dict] = None):
+        """
+        Args:
+            name: 名称，用于日志和统计
+            config: 合并配置，即config.yaml中的singleflight部分，缺省项使用DEFAULT_SINGLEFLIGHT_CONFIG
+        """
+        self.name = name
+        self.config = {**DEFAULT_SINGLEFLIGHT_CONFIG, **(config or {})}
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.stats = {"calls": 0, "executions": 0, "shared": 0}
+
+    def _count(self, shared: bool):
+        self.stats["calls"] += 1
+        self.stats["shared" if shared else "executions"] += 1
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args,
+                 timeout: Optional[float] = None, **kwargs) -> Any:
+        """执行协程函数，相同键的并发调用共享同一个任务
+
+        Args:
+            key: 合并键
+            func: 返回协程的函数
+            timeout: 本调用者等待的最长时间（秒），超时抛出asyncio.TimeoutError，不影响其他等待者，
+                默认使用配置中的wait_timeout
+        """
+        if not self.config["enabled"]:
+            return await func(*args, **kwargs)
+        timeout = timeout if timeout is not None else self.config["wait_timeout"]
+        call = self._calls.get(key)
+        self._count(shared=call is not None)
+        if call is None:
+            call = _AsyncCall(asyncio.ensure_future(func(*args, **kwargs)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._calls.pop(key, None) if self._calls.get(key) is call else None)
+        else:
+            logger.debug(f"[{self.name}] 合并请求: {key}")
+        call.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.task), timeout)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 所有等待者都已超时或取消，共享的计算不再需要
+                call.task.cancel()
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+    async def stream(self, key: Hashable, func: Callable[..., AsyncIterator[Any]], *args,
+                     timeout: Optional[float] = None, **kwargs) -> AsyncIterator[Any]:
+        """合并流式请求，每个订阅者都从头收到完整的产出
+
+        Args:
+            key: 合并键
+            func: 返回异步生成器的函数
+            timeout: 两次产出之间的最长等待时间（秒），默认使用配置中的wait_timeout
+        """
+        if not self.config["enabled"]:
+            async for item in func(*args, **kwargs):
+                yield item
+            return
+        timeout = timeout if timeout is not None else self.config["wait_timeout"]
+        shared = self._streams.get(key)
+        self._count(shared=shared is not None)
+        if shared is None:
+            shared = _SharedStream(func(*args, **kwargs))
+            self._streams[key] = shared
+            shared.task.add_done_callback(
+                lambda _: self._streams.pop(key, None) if self._streams.get(key) is shared else None)
+        else:
+            logger.debug(f"[{self.name}] 合并流式请求: {key}")
+        shared.subscribers += 1
+        try:
+            async for item in shared.subscribe(timeout):
+                yield item
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.task.done():
+                shared.task.cancel()
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
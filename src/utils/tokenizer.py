@@ -0,0 +1,68 @@
+"""
+本地token计数
+
+优先使用与服务端模型一致的HuggingFace分词器（需安装transformers并在本地缓存了分词器文件），
+不可用时退回按字符类型估算：Qwen系列分词器把数字逐位切分，常见汉字约0.7个token，
+英文单词约4个字符一个token。估算值只用于预算控制和日志，不要求与计费完全一致。
+"""
+import functools
+import re
+from typing import Dict, List, Optional
+
+from src.utils.config import get_config_section
+from src.utils.logger import setup_logger
+
+logger = setup_logger("tokenizer")
+
+DEFAULT_TOKENIZER = "Qwen/Qwen2.5-7B-Instruct"
+
+# 每条消息的角色和分隔符开销（chat模板中的<|im_start|>role\n ... <|im_end|>\n）
+MESSAGE_OVERHEAD = 4
+
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]|[A-Za-z]+|\d|\s+|[^\sA-Za-z\d\u4e00-\u9fff]")
+
+
+@functools.lru_cache(maxsize=4)
+def _load_tokenizer(name: str):
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(name, local_files_only=True)
+    except Exception as e:
+        logger.info(f"未能加载分词器{name}，使用估算的token数: {type(e).__name__}")
+        return None
+
+
+def get_tokenizer(name: Optional[str] = None):
+    """返回本地分词器，不可用时返回None"""
+    return _load_tokenizer(name or get_config_section("prompt").get("tokenizer", DEFAULT_TOKENIZER))
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符类型估算token数"""
+    total = 0.0
+    for piece in _TOKEN_PATTERN.findall(text):
+        ch = piece[0]
+        if "\u4e00" <= ch <= "\u9fff":
+            total += 0.7
+        elif ch.isalpha():
+            total += max(1, len(piece) / 4)
+        elif ch.isspace():
+            total += 1 if len(piece) < 4 else len(piece) / 4
+        else:
+            total += 1
+    return int(round(total))
+
+
+def count_tokens(text: str) -> int:
+    """计算文本的token数"""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    return estimate_tokens(text)
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """计算对话消息列表的prompt token数"""
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages)
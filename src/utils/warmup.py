@@ -0,0 +1,44 @@
+"""
+后台预热工具
+
+服务启动时模块只做最少的初始化，较慢的依赖导入、客户端创建、渲染进程启动等
+可以交给后台线程提前完成，使第一个用户请求不必承担这些冷启动开销。
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from src.utils.logger import setup_logger
+
+logger = setup_logger("warmup")
+
+
+def run_warmup(steps: Dict[str, Callable[[], object]]) -> Dict[str, float]:
+    """依次执行预热步骤，单个步骤失败只记录日志
+
+    Args:
+        steps: 步骤名称到无参函数的映射
+
+    Returns:
+        Dict[str, float]: 每个步骤的耗时（秒），失败的步骤不计入
+    """
+    timings = {}
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.warning(f"预热步骤{name}失败: {str(e)}")
+            continue
+        timings[name] = time.perf_counter() - start
+        logger.info(f"预热步骤{name}完成，耗时{timings[name] * 1000:.0f}ms")
+    return timings
+
+
+def start_background_warmup(steps: Dict[str, Callable[[], object]]) -> Optional[threading.Thread]:
+    """在守护线程中执行预热步骤，不阻塞服务启动"""
+    if not steps:
+        return None
+    thread = threading.Thread(target=run_warmup, args=(steps,), name="warmup", daemon=True)
+    thread.start()
+    return thread
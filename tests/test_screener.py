@@ -0,0 +1,87 @@
+"""
+市场筛选器（src/tools/screener.py）的测试：共享筛选器被多个线程并发刷新时只重建一次，且不会出错
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.tools.screener import MarketScreener
+
+
+def _write_series(path, days, end="2025-06-15", seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, days)))
+    df = pd.DataFrame({
+        "date": pd.date_range(end=end, periods=days, freq="D").strftime("%Y-%m-%d"),
+        "open": close, "close": close, "high": close * 1.01, "low": close * 0.99,
+        "volume": rng.integers(1000, 2000, days), "amount": close * 1000,
+    })
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(path, index=False)
+
+
+def _make_tree(root):
+    _write_series(root / "大盘.csv", 200, end="2025-06-16", seed=1)
+    for i, name in enumerate(["步枪", "手枪", "匕首", "手套"]):
+        _write_series(root / name / f"{name}.csv", 200, seed=10 + i)
+    for i, name in enumerate(["百战指数", "千战指数"]):
+        _write_series(root / "HOT" / f"{name}.csv", 200, end="2025-06-16", seed=20 + i)
+
+
+def test_concurrent_refresh_rebuilds_once(tmp_path):
+    _make_tree(tmp_path)
+    screener = MarketScreener({"refresh_interval": 60}, data_dir=str(tmp_path))
+    rebuilds = []
+    original = screener._rebuild
+
+    def counting_rebuild():
+        rebuilds.append(1)
+        return original()
+
+    screener._rebuild = counting_rebuild
+    start = threading.Barrier(8)
+    tables, errors = [], []
+
+    def call():
+        start.wait()
+        try:
+            tables.append(screener.refresh())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+
+    assert not errors
+    assert len(rebuilds) == 1
+    assert len(tables) == 8 and all(t is tables[0] for t in tables)
+    assert len(tables[0]) == 7
+    # 所有序列对齐到共同的最新交易日
+    assert set(tables[0]["date"]) == {"2025-06-15"}
+
+
+def test_concurrent_forced_refresh_has_no_errors(tmp_path):
+    _make_tree(tmp_path)
+    for _ in range(5):
+        screener = MarketScreener(data_dir=str(tmp_path))
+        start = threading.Barrier(8)
+        errors = []
+
+        def call():
+            start.wait()
+            try:
+                table = screener.refresh(force=True)
+                assert len(table) == 7
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(30)
+        assert not errors
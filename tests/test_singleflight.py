@@ -0,0 +1,328 @@
+"""
+请求合并（src/utils/singleflight.py）的测试：leader/follower共享一次执行、异常传播、
+等待超时与取消、流式合并中后加入的订阅者补发已产出的部分
+"""
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+
+from src.utils.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def _run_followers(flight, key, func, count, **kwargs):
+    """在count个线程中并发调用flight.do，返回 (结果列表, 异常列表)"""
+    results, errors = [], []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            value = flight.do(key, func, **kwargs)
+            with lock:
+                results.append(value)
+        except BaseException as e:
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待条件超时"
+        time.sleep(0.005)
+
+
+# ---------------- SingleFlight（线程版） ----------------
+
+def test_sync_followers_share_leader_result():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    executions = []
+
+    def work():
+        executions.append(1)
+        release.wait(5)
+        return {"value": 42}
+
+    threads, results, errors = _run_followers(flight, "k", work, 8)
+    _wait_until(lambda: flight.stats["calls"] == 8)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert not errors
+    assert len(executions) == 1
+    assert results == [{"value": 42}] * 8
+    assert all(r is results[0] for r in results)
+    assert flight.stats == {"calls": 8, "executions": 1, "shared": 7}
+    assert flight.in_flight() == 0
+
+
+def test_sync_different_keys_execute_separately():
+    flight = SingleFlight("test")
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.stats["executions"] == 2
+
+
+def test_sync_error_propagates_to_all_waiters_and_key_is_released():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, results, errors = _run_followers(flight, "k", fail, 5)
+    _wait_until(lambda: flight.stats["calls"] == 5)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert not results
+    assert len(errors) == 5
+    assert all(isinstance(e, ValueError) and str(e) == "boom" for e in errors)
+    # 失败的调用不会留在表中，下一次调用重新执行
+    assert flight.in_flight() == 0
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_sync_follower_timeout_does_not_affect_leader():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    leader_result = []
+    leader = threading.Thread(target=lambda: leader_result.append(flight.do("k", lambda: release.wait(5) and "done")))
+    leader.start()
+    _wait_until(lambda: flight.in_flight() == 1)
+
+    with pytest.raises(concurrent.futures.TimeoutError):
+        flight.do("k", lambda: "unused", timeout=0.05)
+
+    release.set()
+    leader.join(5)
+    assert leader_result == ["done"]
+    assert flight.stats["executions"] == 1
+
+
+def test_sync_disabled_executes_every_call():
+    flight = SingleFlight("test", {"enabled": False})
+    counter = []
+    for _ in range(3):
+        flight.do("k", lambda: counter.append(1))
+    assert len(counter) == 3
+    assert flight.stats["calls"] == 0
+
+
+# ---------------- AsyncSingleFlight（协程版） ----------------
+
+def test_async_followers_share_one_task():
+    async def main():
+        flight = AsyncSingleFlight("test")
+        executions = []
+
+        async def work(value):
+            executions.append(value)
+            await asyncio.sleep(0.05)
+            return value * 2
+
+        results = await asyncio.gather(*(flight.do("k", work, 21) for _ in range(6)))
+        return flight, executions, results
+
+    flight, executions, results = asyncio.run(main())
+    assert executions == [21]
+    assert results == [42] * 6
+    assert flight.stats == {"calls": 6, "executions": 1, "shared": 5}
+    assert flight.in_flight() == 0
+
+
+def test_async_error_propagates_to_all_waiters():
+    async def main():
+        flight = AsyncSingleFlight("test")
+
+        async def fail():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(4)), return_exceptions=True)
+        after = await flight.do("k", asyncio.sleep, 0, "ok")
+        return flight, results, after
+
+    flight, results, after = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) and str(r) == "boom" for r in results)
+    assert after == "ok"
+    assert flight.in_flight() == 0
+
+
+def test_async_waiter_timeout_keeps_shared_task_for_others():
+    async def main():
+        flight = AsyncSingleFlight("test")
+        executions = []
+
+        async def work():
+            executions.append(1)
+            await asyncio.sleep(0.1)
+            return "done"
+
+        patient = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        with pytest.raises(asyncio.TimeoutError):
+            await flight.do("k", work, timeout=0.01)
+        return executions, await patient
+
+    executions, result = asyncio.run(main())
+    assert executions == [1]
+    assert result == "done"
+
+
+def test_async_cancelling_all_waiters_cancels_shared_task():
+    async def main():
+        flight = AsyncSingleFlight("test")
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(flight.do("k", work)) for _ in range(3)]
+        await started.wait()
+        waiters[0].cancel()
+        await asyncio.sleep(0.01)
+        # 还有等待者时共享任务继续执行
+        assert not cancelled.is_set()
+        for w in waiters[1:]:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flight
+
+    flight = asyncio.run(main())
+    assert flight.in_flight() == 0
+
+
+# ---------------- AsyncSingleFlight.stream（流式合并） ----------------
+
+def test_stream_late_subscriber_replays_from_start():
+    async def main():
+        flight = AsyncSingleFlight("test")
+        produced = []
+        gate = asyncio.Event()
+
+        async def source():
+            for i in range(5):
+                if i == 2:
+                    await gate.wait()
+                produced.append(i)
+                yield i
+
+        async def consume(out):
+            async for item in flight.stream("k", source):
+                out.append(item)
+
+        early, late = [], []
+        first = asyncio.ensure_future(consume(early))
+        while len(early) < 2:
+            await asyncio.sleep(0.001)
+        # 已产出两项后才加入的订阅者也从头收到完整序列
+        second = asyncio.ensure_future(consume(late))
+        await asyncio.sleep(0.01)
+        gate.set()
+        await asyncio.gather(first, second)
+        return flight, produced, early, late
+
+    flight, produced, early, late = asyncio.run(main())
+    assert produced == [0, 1, 2, 3, 4]
+    assert early == late == [0, 1, 2, 3, 4]
+    assert flight.stats == {"calls": 2, "executions": 1, "shared": 1}
+    assert flight.in_flight() == 0
+
+
+def test_stream_error_reaches_every_subscriber_after_partial_output():
+    async def main():
+        flight = AsyncSingleFlight("test")
+
+        async def source():
+            yield "a"
+            await asyncio.sleep(0.01)
+            raise ValueError("stream failed")
+
+        async def consume():
+            items = []
+            try:
+                async for item in flight.stream("k", source):
+                    items.append(item)
+            except ValueError as e:
+                return items, str(e)
+            return items, None
+
+        return await asyncio.gather(consume(), consume())
+
+    for items, error in asyncio.run(main()):
+        assert items == ["a"]
+        assert error == "stream failed"
+
+
+def test_stream_cancelled_when_last_subscriber_leaves():
+    async def main():
+        flight = AsyncSingleFlight("test")
+        closed = asyncio.Event()
+
+        async def source():
+            try:
+                i = 0
+                while True:
+                    yield i
+                    i += 1
+                    await asyncio.sleep(0.005)
+            finally:
+                closed.set()
+
+        async def take(n):
+            items = []
+            stream = flight.stream("k", source)
+            async for item in stream:
+                items.append(item)
+                if len(items) == n:
+                    break
+            await stream.aclose()
+            return items
+
+        results = await asyncio.gather(take(2), take(4))
+        await asyncio.wait_for(closed.wait(), 1)
+        return flight, results
+
+    flight, (short, long_) = asyncio.run(main())
+    assert short == [0, 1]
+    assert long_ == [0, 1, 2, 3]
+    assert flight.in_flight() == 0
+
+
+def test_stream_subscriber_timeout_between_items():
+    async def main():
+        flight = AsyncSingleFlight("test")
+
+        async def slow():
+            yield 1
+            await asyncio.sleep(1)
+            yield 2
+
+        items = []
+        with pytest.raises(asyncio.TimeoutError):
+            async for item in flight.stream("k", slow, timeout=0.05):
+                items.append(item)
+        return flight, items
+
+    flight, items = asyncio.run(main())
+    assert items == [1]
+    assert flight.in_flight() == 0